@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+文本-音频对齐索引
+合并章节时为 MP3 章节生成 <章节>.align.json，记录每个 TTS 片段及其源片段（句子/台词）
+在章节音频中的起止时间与字节区间，全部由实际编码结果（帧索引）计算：
+  - 帧拼接的章节：片段帧原样复制，片段从其第一帧开始，片段自身的编码器延迟与填充留在章节中
+  - 整章一次编码的章节（批量模式）：片段按解码后的实际时长首尾相接
+一个 TTS 片段由多个源片段合成时，按文字长度比例切分去掉首尾静音后的语音区间。
+两张表都按开始时间排序，客户端以二分查找定位时间点，再用字节区间发起 HTTP Range 请求
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from build_cache import atomic_write_json
+from mp3_index import load_index
+
+# 索引格式版本，修改字段或计算方式时递增
+ALIGNMENT_VERSION = 1
+
+PROJECT_ROOT = Path(__file__).parent
+SEGMENTATION_DIR = PROJECT_ROOT / 'source' / '03_segmentation'
+
+SEGMENT_FIELDS = ['segment_id', 'start', 'end', 'byte_start', 'byte_end']
+SOURCE_FIELDS = ['source_segment_id', 'segment_id', 'start', 'end', 'byte_start', 'byte_end']
+
+def alignment_path_for(audio_file: Path) -> Path:
+    """对齐索引路径：与章节音频同目录同名，扩展名为 .align.json"""
+    return audio_file.with_suffix('.align.json')
+
+def attributed_file(chapter_id: str) -> Path:
+    """章节的源片段文件（03_segmentation/<章节>_attributed.json）"""
+    return SEGMENTATION_DIR / f'{chapter_id}_attributed.json'
+
+def source_texts(chapter_id: str) -> Dict[str, str]:
+    """读取章节的源片段文本，用于按字数切分"""
+    attributed = attributed_file(chapter_id)
+    if not attributed.exists():
+        return {}
+    with open(attributed, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {seg['segment_id']: seg.get('text', '') for seg in data.get('segments', [])}
+
+def byte_range(index: Dict[str, Any], start_sample: int, end_sample: int) -> Tuple[int, int]:
+    """章节采样区间 [start, end) 覆盖的帧的字节区间（采样位置已扣除编码器延迟）"""
+    spf = index['samples_per_frame']
+    delay = index.get('encoder_delay', 0)
+    last = index['frames'] - 1
+    first_frame = min(max(0, (start_sample + delay) // spf), last)
+    last_frame = min(max(first_frame, (max(end_sample, start_sample + 1) - 1 + delay) // spf), last)
+    byte_end = index['offsets'][last_frame + 1] if last_frame < last else index['audio_end']
+    return index['offsets'][first_frame], byte_end
+
+def segment_spans(chapter_index: Dict[str, Any], segment_indexes: List[Dict[str, Any]]) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    各片段在章节中的采样区间 (start, end)（已扣除章节开头的编码器延迟）。
+    章节帧数等于片段帧数之和时按帧拼接计算，否则视为连续编码，按片段时长累加
+    """
+    spf = chapter_index['samples_per_frame']
+    chapter_delay = chapter_index.get('encoder_delay', 0)
+    spans = []
+    if sum(index['frames'] for index in segment_indexes) == chapter_index['frames']:
+        frame = 0
+        for index in segment_indexes:
+            start = frame * spf + index.get('encoder_delay', 0) - chapter_delay
+            end = (frame + index['frames']) * spf - index.get('encoder_padding', 0) - chapter_delay
+            spans.append((max(0, start), max(0, end)))
+            frame += index['frames']
+        return 'frame_concat', spans
+
+    sample_rate = chapter_index['sample_rate']
+    position = 0
+    for index in segment_indexes:
+        length = round(index['duration_seconds'] * sample_rate)
+        spans.append((position, position + length))
+        position += length
+    return 'continuous', spans
+
+def split_weights(source_ids: List[str], text: str, texts: Dict[str, str]) -> List[float]:
+    """
+    源片段在 TTS 片段中所占比例：按源文本字数；找不到源文本的片段平分剩余字数
+    （切分产生的前后两半各自计数，比例之和为 1）
+    """
+    lengths = [len(texts[sid]) if sid in texts else None for sid in source_ids]
+    known = sum(length for length in lengths if length is not None)
+    unknown = lengths.count(None)
+    if unknown:
+        share = max(len(text) - known, 1) / unknown
+        lengths = [share if length is None else length for length in lengths]
+    total = sum(lengths)
+    if total <= 0:
+        return [1 / len(source_ids)] * len(source_ids)
+    return [length / total for length in lengths]
+
+def build_alignment(chapter_id: str, audio_file: Path, segments: List[Dict[str, Any]],
+                    segment_files: List[Path], texts: Dict[str, str],
+                    lead_in_ms: int = 0, lead_out_ms: int = 0) -> Dict[str, Any]:
+    """
+    由章节与片段的帧索引生成对齐索引。segments 为章节内按播放顺序排列的片段记录
+    （segment_id / text / source_segment_ids），segment_files 为对应的片段 MP3；
+    lead_in_ms / lead_out_ms 为后处理在片段首尾补的静音，源片段只在中间的语音区间内切分
+    """
+    chapter_index = load_index(audio_file)
+    if not chapter_index['valid']:
+        raise ValueError(f"无法解析章节 MP3: {audio_file.name}: {'; '.join(chapter_index['errors'])}")
+    segment_indexes = []
+    for path in segment_files:
+        index = load_index(path)
+        if not index['valid']:
+            raise ValueError(f"无法解析片段 MP3: {path.name}: {'; '.join(index['errors'])}")
+        segment_indexes.append(index)
+
+    sample_rate = chapter_index['sample_rate']
+    mode, spans = segment_spans(chapter_index, segment_indexes)
+    lead_in = lead_in_ms * sample_rate // 1000
+    lead_out = lead_out_ms * sample_rate // 1000
+
+    def seconds(sample: int) -> float:
+        return round(sample / sample_rate, 3)
+
+    segment_rows = []
+    source_rows = []
+    for segment, (start, end) in zip(segments, spans):
+        segment_rows.append([segment['segment_id'], seconds(start), seconds(end), *byte_range(chapter_index, start, end)])
+
+        source_ids = segment.get('source_segment_ids') or []
+        if not source_ids:
+            continue
+        # 片段太短（首尾静音超过时长）时不扣除静音
+        speech_start, speech_end = start + lead_in, end - lead_out
+        if speech_end <= speech_start:
+            speech_start, speech_end = start, end
+        position = speech_start
+        weights = split_weights(source_ids, segment.get('text', ''), texts)
+        for i, (source_id, weight) in enumerate(zip(source_ids, weights)):
+            source_end = speech_end if i == len(source_ids) - 1 else position + round((speech_end - speech_start) * weight)
+            source_rows.append([source_id, segment['segment_id'], seconds(position), seconds(source_end),
+                                *byte_range(chapter_index, position, source_end)])
+            position = source_end
+
+    segment_rows.sort(key=lambda row: row[1])
+    source_rows.sort(key=lambda row: row[2])
+    return {
+        'alignment_version': ALIGNMENT_VERSION,
+        'chapter_id': chapter_id,
+        'audio_file': audio_file.name,
+        'mode': mode,
+        'sample_rate': sample_rate,
+        'duration_seconds': chapter_index['duration_seconds'],
+        'file_size': chapter_index['file_size'],
+        'segment_fields': SEGMENT_FIELDS,
+        'segments': segment_rows,
+        'source_fields': SOURCE_FIELDS,
+        'sources': source_rows
+    }
+
+def write_alignment(alignment: Dict[str, Any], output_file: Path) -> None:
+    """写入不缩进的紧凑 JSON，记录以行数组存储以减小体积"""
+    atomic_write_json(output_file, alignment, indent=None)
+
+def load_alignment(path: Path) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def rows(alignment: Dict[str, Any], table: str = 'sources') -> List[Dict[str, Any]]:
+    """把行数组展开为字典（table 为 segments 或 sources）"""
+    fields = alignment['segment_fields' if table == 'segments' else 'source_fields']
+    return [dict(zip(fields, row)) for row in alignment[table]]
+
+def seek(alignment: Dict[str, Any], seconds: float, table: str = 'sources') -> Optional[Dict[str, Any]]:
+    """二分查找包含指定时间点的记录；落在片段间的静音里时返回之前最近的一条"""
+    fields = alignment['segment_fields' if table == 'segments' else 'source_fields']
+    start_column = fields.index('start')
+    table_rows = alignment[table]
+    low, high = 0, len(table_rows)
+    while low < high:
+        middle = (low + high) // 2
+        if table_rows[middle][start_column] <= seconds:
+            low = middle + 1
+        else:
+            high = middle
+    if low == 0:
+        return None
+    return dict(zip(fields, table_rows[low - 1]))
+
+def locate(alignment: Dict[str, Any], segment_id: str) -> Optional[Dict[str, Any]]:
+    """按 TTS 片段或源片段 ID 定位；源片段被切到多个 TTS 片段时合并为首尾区间"""
+    matches = [row for row in rows(alignment, 'segments') if row['segment_id'] == segment_id]
+    if not matches:
+        matches = [row for row in rows(alignment, 'sources') if row['source_segment_id'] == segment_id]
+    if not matches:
+        return None
+    first, last = matches[0], matches[-1]
+    return {**first, 'end': last['end'], 'byte_end': last['byte_end']}
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='查询章节的文本-音频对齐索引')
+    parser.add_argument('alignment_file', type=Path, help='<章节>.align.json 或章节 MP3')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--at', type=float, metavar='SECONDS', help='查找该时间点正在朗读的源片段')
+    group.add_argument('--segment', metavar='ID', help='查找 TTS 片段或源片段的时间与字节区间')
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+    path = args.alignment_file
+    if path.suffix == '.mp3':
+        path = alignment_path_for(path)
+    alignment = load_alignment(path)
+    result = seek(alignment, args.at) if args.at is not None else locate(alignment, args.segment)
+    if result is None:
+        print('未找到', file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+进程内产物缓存
+同一进程依次运行多个阶段时（videobook.py），配置与各阶段的 JSON 产物只解析一次：
+  - 读取时按 (大小, 修改时间) 校验，文件被其他进程改写后自动重新解析
+  - 阶段写出的产物同时放入缓存，下游阶段直接使用内存中的对象，不再读回磁盘
+取得的对象由所有读取方共享，调用方不得原地修改（需要修改时先复制）
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from build_cache import atomic_write_json
+
+_lock = threading.Lock()
+_entries: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+_stats = {'parsed': 0, 'hits': 0, 'writes': 0, 'parsed_bytes': 0}
+
+def _key(path: Path) -> str:
+    return str(Path(path).resolve())
+
+def _state(path: Path) -> Tuple[int, int]:
+    stat = Path(path).stat()
+    return stat.st_size, stat.st_mtime_ns
+
+def load_json(path: Path) -> Any:
+    """读取 JSON 产物：缓存中的对象与文件一致时直接返回，否则解析文件并放入缓存"""
+    state = _state(path)
+    key = _key(path)
+    with _lock:
+        cached = _entries.get(key)
+        if cached is not None and cached[0] == state:
+            _stats['hits'] += 1
+            return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    with _lock:
+        _entries[key] = (state, data)
+        _stats['parsed'] += 1
+        _stats['parsed_bytes'] += state[0]
+    return data
+
+def put(path: Path, data: Any) -> None:
+    """登记刚写入磁盘的产物，后续读取不再解析文件"""
+    state = _state(path)
+    with _lock:
+        _entries[_key(path)] = (state, data)
+        _stats['writes'] += 1
+
+def write_json(path: Path, data: Any, indent: Optional[int] = 2) -> None:
+    """原子写入 JSON 产物并放入缓存"""
+    atomic_write_json(path, data, indent=indent)
+    put(path, data)
+
+def stats() -> Dict[str, int]:
+    """解析次数与字节数、命中次数、写入次数"""
+    with _lock:
+        return dict(_stats)
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
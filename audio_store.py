@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+TTS 音频去重存储
+以 (模型, 音色, 规范化文本, 情感, 情感强度, 采样率) 的哈希为键保存已合成的 WAV，
+跨片段、跨项目共享：命中时直接链接到 04_tts_raw，省去一次付费 API 调用
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import unicodedata
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from build_cache import atomic_write_json, temp_path_for
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 存储位置：可通过环境变量指定共享目录
+STORE_DIR = Path(os.environ.get('VIDEOBOOK_AUDIO_STORE', Path.home() / '.cache' / 'video-book' / 'tts_audio'))
+
+# <linux/fs.h> FICLONE：在支持的文件系统（Btrfs、XFS、bcachefs 等）上共享数据块的写时复制克隆
+FICLONE = 0x40049409
+
+def normalize_text(text: str) -> str:
+    """规范化文本：Unicode NFKC、去除首尾空白、合并连续空白"""
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+def audio_key(model: str, voice: str, text: str, emotion: Optional[str],
+              emotion_intensity: Optional[str], sample_rate: int) -> str:
+    """计算合成结果的内容键：影响音频的全部输入"""
+    payload = json.dumps({
+        'model': model,
+        'voice': voice,
+        'text': normalize_text(text),
+        'emotion': emotion or '',
+        'emotion_intensity': emotion_intensity or '',
+        'sample_rate': sample_rate
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def reflink(src: Path, dest: Path) -> bool:
+    """以 FICLONE 克隆文件，文件系统不支持（或非 Linux）时返回 False"""
+    if fcntl is None:
+        return False
+    with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+        try:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+            return True
+        except OSError:
+            return False
+
+def link_or_copy(src: Path, dest: Path) -> str:
+    """
+    硬链接文件，跨文件系统时依次回退为 reflink 与复制；先写临时路径再原子替换。
+    目标已是同一文件，或是保留了源文件修改时间的副本且大小一致时不做任何操作。
+    返回所用方式：existing / hardlink / reflink / copy
+    """
+    src_stat = src.stat()
+    try:
+        dest_stat = dest.stat()
+    except FileNotFoundError:
+        dest_stat = None
+    if dest_stat is not None and (
+            (dest_stat.st_dev, dest_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino)
+            or (dest_stat.st_size, dest_stat.st_mtime_ns) == (src_stat.st_size, src_stat.st_mtime_ns)):
+        return 'existing'
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = temp_path_for(dest)
+    try:
+        try:
+            os.link(src, tmp_path)
+            method = 'hardlink'
+        except OSError:
+            if reflink(src, tmp_path):
+                method = 'reflink'
+            else:
+                shutil.copyfile(src, tmp_path)
+                method = 'copy'
+            # 副本保留源文件的修改时间，下次可按 (size, mtime) 判断为最新
+            os.utime(tmp_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        os.replace(tmp_path, dest)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return method
+
+class AudioStore:
+    """内容寻址的 WAV 存储，按键前两位分目录"""
+
+    def __init__(self, store_dir: Path = STORE_DIR):
+        self.store_dir = store_dir
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key: str) -> Path:
+        return self.store_dir / key[:2] / f'{key}.wav'
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """查找已存储的音频，并记录命中统计"""
+        path = self.path_for(key)
+        if path.exists() and path.stat().st_size > 0:
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def fetch(self, key: str, dest: Path) -> bool:
+        """命中时把存储中的音频链接到目标路径"""
+        path = self.lookup(key)
+        if path is None:
+            return False
+        link_or_copy(path, dest)
+        return True
+
+    def put(self, key: str, wav_file: Path, meta: Dict[str, Any]) -> None:
+        """把新合成的音频放入存储，并写入元数据便于排查"""
+        path = self.path_for(key)
+        if path.exists():
+            return
+        link_or_copy(wav_file, path)
+        atomic_write_json(path.with_suffix('.json'), {**meta, 'stored': datetime.now().isoformat()})
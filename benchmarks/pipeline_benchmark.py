@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""
+流水线性能基准
+在不同规模的合成小说上测量各阶段耗时、吞吐与峰值内存，输出可在多次运行之间对比的 JSON：
+  - build:   build_segments.build_tts_segments()（含片段目录写入）
+  - post:    postprocess_audio.process_segment() / merge_chapter()（每个片段一个 ffmpeg）
+  - post_batch: postprocess_audio.encode_chapter_batch()（每章一个 ffmpeg，同时输出片段与章节）
+  - release: package_release.generate_meta_json() / generate_chapters_json()
+每个阶段在独立子进程中运行，峰值 RSS 互不干扰
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import wave
+import shutil
+import platform
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+import contextlib
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Callable, Optional
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BENCHMARK_DIR.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from synthetic_novel import generate_workspace, write_fixture_wavs  # noqa: E402
+
+BENCHMARK_VERSION = 1
+STAGES = ('build', 'post', 'post_batch', 'release')
+POST_STAGES = ('post', 'post_batch')
+DEFAULT_SIZES = '10,50,200'
+REGRESSION_THRESHOLD = 0.2  # 耗时或内存增长超过 20% 视为回归
+MIN_SIGNIFICANT_SECONDS = 0.01  # 低于此差值的耗时变化视为计时噪声
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """峰值常驻内存（MB）；Linux 的 ru_maxrss 单位为 KB，macOS 为字节"""
+    maxrss = resource.getrusage(who).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss /= 1024
+    return round(maxrss / 1024, 1)
+
+def time_repeated(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """重复执行并记录最短与中位耗时"""
+    timings = []
+    result = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return {
+        'result': result,
+        'seconds_min': round(min(timings), 4),
+        'seconds_median': round(statistics.median(timings), 4)
+    }
+
+def cpu_seconds() -> float:
+    """本进程与已结束子进程（ffmpeg）的用户态 + 内核态 CPU 时间"""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+def throughput(items: int, seconds: float) -> float:
+    return round(items / seconds, 2) if seconds > 0 else 0.0
+
+# ---------------------------------------------------------------------------
+# 子进程中执行的阶段
+# ---------------------------------------------------------------------------
+
+def run_build(workspace: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    """构建 TTS 片段并写入片段目录和 segment_manifest.json"""
+    # build_segments 使用相对路径
+    os.chdir(workspace)
+    import build_segments
+    from segment_catalog import CatalogWriter
+
+    config = build_segments.load_config()
+    voice_mapping = build_segments.load_voice_mapping()
+    character_descriptions = build_segments.load_character_descriptions()
+    catalog_file = workspace / 'source' / '03_segmentation' / 'tts_segments.db'
+
+    def build():
+        with CatalogWriter(catalog_file) as writer:
+            _, stats = build_segments.build_tts_segments(
+                config, voice_mapping, character_descriptions, sink=writer.add)
+            writer.set_meta({'chapter_keys': stats['chapter_keys']})
+        return stats
+
+    timed = time_repeated(build, args.repeat)
+    stats = timed['result']
+
+    with open(workspace / 'source' / '03_segmentation' / 'segment_manifest.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'total_segments': stats['total_segments'],
+            'total_duration_seconds': stats['total_duration_seconds'],
+            'segments_by_chapter': stats['segments_by_chapter'],
+            'duration_by_chapter': stats['duration_by_chapter'],
+            'segments_by_speaker': stats['segments_by_speaker']
+        }, f, ensure_ascii=False, indent=2)
+
+    return {
+        'seconds_min': timed['seconds_min'],
+        'seconds_median': timed['seconds_median'],
+        'items': stats['total_segments'],
+        'items_per_second': throughput(stats['total_segments'], timed['seconds_min']),
+        'chapters': stats['chapters_processed'],
+        'estimated_audio_seconds': stats['total_duration_seconds']
+    }
+
+def configure_post(workspace: Path, args: argparse.Namespace) -> Dict[str, List[str]]:
+    """把 postprocess_audio 的路径指向合成数据目录，返回前若干章的片段 ID"""
+    import postprocess_audio as post
+    from segment_catalog import SegmentCatalog
+
+    post.INPUT_DIR = workspace / 'source' / '04_tts_raw'
+    post.OUTPUT_SEGMENTS_DIR = workspace / 'source' / '05_post' / 'segments'
+    post.OUTPUT_CHAPTERS_DIR = workspace / 'source' / '05_post' / 'chapters'
+    post.OUTPUT_SEGMENTS_DIR.mkdir(parents=True, exist_ok=True)
+    post.OUTPUT_CHAPTERS_DIR.mkdir(parents=True, exist_ok=True)
+
+    catalog = SegmentCatalog(workspace / 'source' / '03_segmentation' / 'tts_segments.db')
+    chapters = {cid: [s['segment_id'] for s in catalog.iter_index(cid)]
+                for cid in catalog.chapters()[:args.post_chapters]}
+    catalog.close()
+    return chapters
+
+def wav_seconds(wav_file: Path) -> float:
+    with wave.open(str(wav_file), 'rb') as wav:
+        return wav.getnframes() / wav.getframerate()
+
+def run_post(workspace: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    """对前若干章测量响度、逐片段编码并合并章节"""
+    import postprocess_audio as post
+
+    chapters = configure_post(workspace, args)
+    cpu_started = cpu_seconds()
+    measure_seconds = 0.0
+    encode_seconds = 0.0
+    merge_seconds = 0.0
+    audio_seconds = 0.0
+    segments = 0
+    failed = 0
+    for chapter_id, segment_ids in chapters.items():
+        for segment_id in segment_ids:
+            input_file = post.INPUT_DIR / f'{segment_id}.wav'
+            output_file = post.OUTPUT_SEGMENTS_DIR / f'{segment_id}.mp3'
+
+            started = time.perf_counter()
+            loudness = post.measure_loudness(input_file) if post.LOUDNORM_MODE != 'dynamic' else None
+            measured = time.perf_counter()
+            result = post.process_segment(input_file, output_file, loudness)
+            encode_seconds += time.perf_counter() - measured
+            measure_seconds += measured - started
+
+            segments += 1
+            if not result['success']:
+                failed += 1
+            audio_seconds += wav_seconds(input_file)
+
+        started = time.perf_counter()
+        post.merge_chapter(chapter_id, segment_ids)
+        merge_seconds += time.perf_counter() - started
+
+    total = measure_seconds + encode_seconds + merge_seconds
+    return {
+        'seconds_min': round(total, 4),
+        'seconds_median': round(total, 4),
+        'items': segments,
+        'items_per_second': throughput(segments, measure_seconds + encode_seconds),
+        'failed': failed,
+        'chapters': len(chapters),
+        'measure_seconds': round(measure_seconds, 4),
+        'encode_seconds': round(encode_seconds, 4),
+        'merge_seconds': round(merge_seconds, 4),
+        'audio_seconds': round(audio_seconds, 2),
+        # 每秒墙钟时间处理的音频秒数
+        'realtime_factor': round(audio_seconds / total, 2) if total > 0 else 0.0,
+        'cpu_seconds': round(cpu_seconds() - cpu_started, 4),
+        'ffmpeg_processes': segments * (2 if post.LOUDNORM_MODE != 'dynamic' else 1),
+        'loudnorm_mode': post.LOUDNORM_MODE,
+        'children_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN)
+    }
+
+def run_post_batch(workspace: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    """对前若干章测量响度，每章一个 ffmpeg 同时输出片段与章节 MP3"""
+    import postprocess_audio as post
+
+    chapters = configure_post(workspace, args)
+    cpu_started = cpu_seconds()
+    measure_seconds = 0.0
+    encode_seconds = 0.0
+    audio_seconds = 0.0
+    segments = 0
+    failed = 0
+    for chapter_id, segment_ids in chapters.items():
+        started = time.perf_counter()
+        entries = []
+        for segment_id in segment_ids:
+            input_file = post.INPUT_DIR / f'{segment_id}.wav'
+            entries.append({
+                'input_file': input_file,
+                'output_file': post.OUTPUT_SEGMENTS_DIR / f'{segment_id}.mp3',
+                'loudness': post.measure_loudness(input_file) if post.LOUDNORM_MODE != 'dynamic' else None,
+                'stale': True
+            })
+            audio_seconds += wav_seconds(input_file)
+        measured = time.perf_counter()
+        try:
+            post.encode_chapter_batch(chapter_id, entries, with_chapter=True)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            failed += len(entries)
+        encode_seconds += time.perf_counter() - measured
+        measure_seconds += measured - started
+        segments += len(entries)
+
+    total = measure_seconds + encode_seconds
+    return {
+        'seconds_min': round(total, 4),
+        'seconds_median': round(total, 4),
+        'items': segments,
+        'items_per_second': throughput(segments, total),
+        'failed': failed,
+        'chapters': len(chapters),
+        'measure_seconds': round(measure_seconds, 4),
+        'encode_seconds': round(encode_seconds, 4),
+        'audio_seconds': round(audio_seconds, 2),
+        'realtime_factor': round(audio_seconds / total, 2) if total > 0 else 0.0,
+        'cpu_seconds': round(cpu_seconds() - cpu_started, 4),
+        'ffmpeg_processes': len(chapters) + (segments if post.LOUDNORM_MODE != 'dynamic' else 0),
+        'loudnorm_mode': post.LOUDNORM_MODE,
+        'children_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN)
+    }
+
+def run_release(workspace: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    """生成发布元数据；缺少章节音频时写入占位文件，只测量元数据生成"""
+    import package_release as release
+
+    source_dir = workspace / 'source'
+    release.SOURCE_DIR = source_dir
+    release.RELEASE_DIR = workspace / 'release'
+    release.AUDIO_DIR = release.RELEASE_DIR / 'audio' / 'chapters'
+    release.CHAPTERS_FILE = source_dir / '01_extracted' / 'chapters.json'
+    release.VOICE_MAPPING_FILE = source_dir / '02_casting' / 'voice_mapping.json'
+    release.SEGMENT_MANIFEST_FILE = source_dir / '03_segmentation' / 'segment_manifest.json'
+    release.PROCESSING_LOG_FILE = source_dir / '05_post' / 'processing_log.json'
+
+    release.PROCESSING_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    if not release.PROCESSING_LOG_FILE.exists():
+        with open(release.PROCESSING_LOG_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'processing_date': datetime.now().isoformat()}, f)
+
+    release.AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+    merged_dir = source_dir / '05_post' / 'chapters'
+    chapters = release.load_json(release.CHAPTERS_FILE)['chapters']
+    for chapter in chapters:
+        target = release.AUDIO_DIR / f"{chapter['chapter_id']}.mp3"
+        merged = merged_dir / target.name
+        if merged.exists():
+            shutil.copyfile(merged, target)
+        elif not target.exists():
+            target.write_bytes(b'\0' * 1024)
+
+    def generate():
+        meta = release.generate_meta_json()
+        chapters_json = release.generate_chapters_json()
+        return meta, chapters_json
+
+    timed = time_repeated(generate, args.repeat)
+    return {
+        'seconds_min': timed['seconds_min'],
+        'seconds_median': timed['seconds_median'],
+        'items': len(chapters),
+        'items_per_second': throughput(len(chapters), timed['seconds_min']),
+        'chapters_listed': timed['result'][1]['total_chapters']
+    }
+
+STAGE_RUNNERS = {
+    'build': run_build,
+    'post': run_post,
+    'post_batch': run_post_batch,
+    'release': run_release
+}
+
+def run_worker(args: argparse.Namespace) -> None:
+    """子进程入口：运行单个阶段，最后一行输出 JSON 结果"""
+    baseline_rss = peak_rss_mb()
+    with contextlib.redirect_stdout(sys.stderr):
+        result = STAGE_RUNNERS[args.worker](args.workspace, args)
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['baseline_rss_mb'] = baseline_rss
+    print(json.dumps(result))
+
+# ---------------------------------------------------------------------------
+# 主进程：生成数据、调度阶段、汇总与对比
+# ---------------------------------------------------------------------------
+
+def run_stage(stage: str, workspace: Path, args: argparse.Namespace) -> Dict[str, Any]:
+    """在独立子进程中运行一个阶段"""
+    cmd = [sys.executable, str(Path(__file__).resolve()), '--worker', stage,
+           '--workspace', str(workspace), '--repeat', str(args.repeat),
+           '--post-chapters', str(args.post_chapters)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip()[-500:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def prepare_fixtures(workspace: Path, post_chapters: int) -> int:
+    """为前若干章的 TTS 片段生成正弦音 WAV"""
+    from segment_catalog import SegmentCatalog
+
+    catalog = SegmentCatalog(workspace / 'source' / '03_segmentation' / 'tts_segments.db')
+    segments = [seg for cid in catalog.chapters()[:post_chapters] for seg in catalog.iter_segments(cid)]
+    catalog.close()
+    return len(write_fixture_wavs(segments, workspace / 'source' / '04_tts_raw'))
+
+def batch_comparison(stages: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """对比逐片段与批量编码的编码墙钟时间和总 CPU 时间（响度测量两者相同，单独列出）"""
+    single, batch = stages.get('post', {}), stages.get('post_batch', {})
+    if 'encode_seconds' not in single or 'encode_seconds' not in batch:
+        return None
+    single_encode = single['encode_seconds'] + single['merge_seconds']
+    return {
+        'per_segment_encode_seconds': round(single_encode, 4),
+        'batch_encode_seconds': batch['encode_seconds'],
+        'encode_speedup': round(single_encode / batch['encode_seconds'], 2) if batch['encode_seconds'] else None,
+        'per_segment_cpu_seconds': single['cpu_seconds'],
+        'batch_cpu_seconds': batch['cpu_seconds'],
+        'cpu_ratio': round(batch['cpu_seconds'] / single['cpu_seconds'], 2) if single['cpu_seconds'] else None,
+        'ffmpeg_processes': [single['ffmpeg_processes'], batch['ffmpeg_processes']]
+    }
+
+def scaling_exponent(points: List[List[float]]) -> Optional[float]:
+    """对数坐标下的最小二乘斜率：1 表示线性扩展，2 表示平方"""
+    points = [(x, y) for x, y in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    xs = [math.log(x) for x, _ in points]
+    ys = [math.log(y) for _, y in points]
+    mean_x, mean_y = statistics.mean(xs), statistics.mean(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    if denominator == 0:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator, 3)
+
+def scaling_curves(results: List[Dict[str, Any]], stages: List[str]) -> Dict[str, Any]:
+    """按阶段汇总 (处理项数, 耗时) 曲线与扩展指数"""
+    curves = {}
+    for stage in stages:
+        points = [[r['stages'][stage]['items'], r['stages'][stage]['seconds_min']]
+                  for r in results if 'items' in r['stages'].get(stage, {})]
+        rss = [[r['stages'][stage]['items'], r['stages'][stage]['peak_rss_mb']]
+               for r in results if 'items' in r['stages'].get(stage, {})]
+        curves[stage] = {
+            'points': points,
+            'time_exponent': scaling_exponent(points),
+            'peak_rss_mb': rss
+        }
+    return curves
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """按 (章节数, 阶段) 对比耗时与峰值内存，返回回归描述"""
+    regressions = []
+    baseline_by_size = {r['chapters']: r for r in baseline.get('results', [])}
+    for result in current['results']:
+        previous = baseline_by_size.get(result['chapters'])
+        if previous is None:
+            continue
+        for stage, metrics in result['stages'].items():
+            old = previous['stages'].get(stage, {})
+            for metric in ('seconds_min', 'peak_rss_mb'):
+                if not old.get(metric) or metric not in metrics:
+                    continue
+                ratio = metrics[metric] / old[metric]
+                regressed = ratio > 1 + threshold
+                if metric == 'seconds_min' and metrics[metric] - old[metric] < MIN_SIGNIFICANT_SECONDS:
+                    regressed = False
+                line = f"{result['chapters']} 章 {stage} {metric}: {old[metric]} -> {metrics[metric]} ({ratio:.2f}x)"
+                print(f"   {'✗' if regressed else '✓'} {line}")
+                if regressed:
+                    regressions.append(line)
+    return regressions
+
+def environment_info() -> Dict[str, Any]:
+    """记录运行环境，跨机器对比时作参考"""
+    ffmpeg = shutil.which('ffmpeg')
+    ffmpeg_version = None
+    if ffmpeg:
+        with contextlib.suppress(Exception):
+            ffmpeg_version = subprocess.run([ffmpeg, '-version'], capture_output=True,
+                                            text=True).stdout.splitlines()[0]
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version
+    }
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='流水线性能基准')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='章节数列表，逗号分隔')
+    parser.add_argument('--segments-per-chapter', type=int, default=60)
+    parser.add_argument('--stages', default=','.join(STAGES), help='要运行的阶段，逗号分隔')
+    parser.add_argument('--post-chapters', type=int, default=2,
+                        help='post 阶段只处理前 N 章（ffmpeg 耗时与片段数线性相关）')
+    parser.add_argument('--repeat', type=int, default=3, help='build/release 阶段重复次数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, default=BENCHMARK_DIR / 'results' / 'benchmark.json')
+    parser.add_argument('--compare', type=Path, help='与之前的结果对比，出现回归时以非零状态退出')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--keep-workspace', action='store_true', help='保留生成的合成数据目录')
+    parser.add_argument('--worker', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--workspace', type=Path, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+    if args.worker:
+        run_worker(args)
+        return
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    stages = [stage for stage in args.stages.split(',') if stage]
+    if not shutil.which('ffmpeg') and any(stage in POST_STAGES for stage in stages):
+        print("   ⚠️  未找到 ffmpeg，跳过 post / post_batch 阶段")
+        stages = [stage for stage in stages if stage not in POST_STAGES]
+
+    print("=" * 60)
+    print("流水线性能基准")
+    print("=" * 60)
+
+    results = []
+    for chapters in sizes:
+        workspace = Path(tempfile.mkdtemp(prefix=f'videobook_bench_{chapters}_'))
+        try:
+            print(f"\n{chapters} 章: 生成合成数据 ({workspace})...")
+            started = time.perf_counter()
+            info = generate_workspace(workspace, chapters, args.segments_per_chapter, seed=args.seed)
+            info['generate_seconds'] = round(time.perf_counter() - started, 2)
+
+            result = {**info, 'stages': {}}
+            for stage in stages:
+                if stage in POST_STAGES and 'build' in result['stages'] and 'fixture_wavs' not in info:
+                    info['fixture_wavs'] = prepare_fixtures(workspace, args.post_chapters)
+                metrics = run_stage(stage, workspace, args)
+                result['stages'][stage] = metrics
+                if 'error' in metrics:
+                    print(f"   ✗ {stage}: {metrics['error']}")
+                else:
+                    print(f"   ✓ {stage}: {metrics['seconds_min']} 秒, {metrics['items']} 项, "
+                          f"{metrics['items_per_second']} 项/秒, 峰值内存 {metrics['peak_rss_mb']} MB")
+            comparison = batch_comparison(result['stages'])
+            if comparison:
+                result['batch_comparison'] = comparison
+                print(f"   批量编码: 编码 {comparison['per_segment_encode_seconds']} -> "
+                      f"{comparison['batch_encode_seconds']} 秒 ({comparison['encode_speedup']}x), "
+                      f"CPU {comparison['per_segment_cpu_seconds']} -> {comparison['batch_cpu_seconds']} 秒")
+            results.append(result)
+        finally:
+            if args.keep_workspace:
+                print(f"   保留数据目录: {workspace}")
+            else:
+                shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        'benchmark_version': BENCHMARK_VERSION,
+        'creation_date': datetime.now().isoformat(),
+        'environment': environment_info(),
+        'parameters': {
+            'sizes': sizes,
+            'segments_per_chapter': args.segments_per_chapter,
+            'post_chapters': args.post_chapters,
+            'repeat': args.repeat,
+            'seed': args.seed
+        },
+        'results': results,
+        'scaling': scaling_curves(results, stages)
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✓ 已保存: {args.output}")
+
+    for stage, curve in report['scaling'].items():
+        print(f"   - {stage}: 扩展指数 {curve['time_exponent']}")
+
+    if args.compare:
+        print(f"\n对比基线: {args.compare}")
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.threshold)
+        if regressions:
+            print(f"\n⚠️  发现 {len(regressions)} 项回归 (阈值 {args.threshold:.0%})")
+            raise SystemExit(1)
+        print("\n✓ 未发现回归")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+合成小说生成器
+按指定规模生成 ch_*_attributed.json、voice_mapping.json、chapters.json 以及正弦音 WAV 夹具，
+用于在没有真实书稿和 TTS 音频的情况下测量流水线各阶段的性能
+"""
+
+import sys
+import json
+import math
+import wave
+import array
+import random
+import shutil
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Iterable
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CONFIG_FILE = PROJECT_ROOT / 'configs' / 'default_config.json'
+
+SAMPLE_RATE = 32000
+WORDS_PER_SECOND = 2.5
+MAX_FIXTURE_SECONDS = 75.0
+
+# 常用汉字与标点，组成的文本长度分布接近真实章节
+HANZI = ('的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会家可下而过天去能对小多然'
+         '于心学么之都好看起发当没成只如事把还用第样道想作种开美总从无情己面最女但现前些所同日手又行意动方期它头经长儿回')
+SENTENCE_ENDS = '。。。！？'
+CLAUSE_MARKS = '，，、：'
+DIALOGUE_RATIO = 0.4
+LONG_SEGMENT_RATIO = 0.03  # 超过单片段容量、需要拆分的归属片段比例
+
+def random_sentence(rng: random.Random, min_chars: int, max_chars: int) -> str:
+    """生成一句带句内停顿的随机文本"""
+    length = rng.randint(min_chars, max_chars)
+    chars = []
+    for i in range(length):
+        chars.append(rng.choice(HANZI))
+        if 0 < i < length - 1 and rng.random() < 0.08:
+            chars.append(rng.choice(CLAUSE_MARKS))
+    return ''.join(chars) + rng.choice(SENTENCE_ENDS)
+
+def random_text(rng: random.Random, long: bool = False) -> str:
+    """生成一个归属片段的文本；long 时生成超过单片段容量的长段落"""
+    if long:
+        return ''.join(random_sentence(rng, 20, 40) for _ in range(rng.randint(8, 14)))
+    return ''.join(random_sentence(rng, 4, 30) for _ in range(rng.randint(1, 3)))
+
+def speaker_ids(speakers: int) -> List[str]:
+    return ['narrator'] + [f'char_{i:03d}' for i in range(1, speakers)]
+
+def generate_chapter(rng: random.Random, chapter_number: int, segments: int,
+                     speakers: List[str]) -> Dict[str, Any]:
+    """生成一个归属章节，结构与 ch_*_attributed.json 一致"""
+    chapter_id = f'ch_{chapter_number:03d}'
+    chapter_segments = []
+    for i in range(1, segments + 1):
+        dialogue = rng.random() < DIALOGUE_RATIO
+        text = random_text(rng, long=rng.random() < LONG_SEGMENT_RATIO)
+        segment = {
+            'type': 'dialogue' if dialogue else 'narration',
+            'speaker_id': rng.choice(speakers[1:]) if dialogue and len(speakers) > 1 else 'narrator',
+            'text': text,
+            'word_count': len(text),
+            'segment_id': f'{chapter_id}_seg_{i:03d}'
+        }
+        if dialogue:
+            segment['speaker_name'] = segment['speaker_id']
+        chapter_segments.append(segment)
+
+    return {
+        'chapter_id': chapter_id,
+        'chapter_number': chapter_number,
+        'title': f'第{chapter_number}章',
+        'attribution_method': 'synthetic',
+        'total_segments': len(chapter_segments),
+        'segments': chapter_segments
+    }
+
+def generate_voice_mapping(speakers: List[str], voices: int) -> Dict[str, Any]:
+    """生成 voice_mapping.json，说话人轮流分配到若干音色"""
+    return {
+        'casting_method': 'synthetic',
+        'tts_provider': 'minimax',
+        'voice_assignments': {speaker: f'synthetic_voice_{i % voices:02d}' for i, speaker in enumerate(speakers)},
+        'character_descriptions': {speaker: f'{speaker} - 合成角色' for speaker in speakers}
+    }
+
+def generate_workspace(workspace: Path, chapters: int, segments_per_chapter: int,
+                       speakers: int = 12, voices: int = 4, seed: int = 0) -> Dict[str, Any]:
+    """
+    在 workspace 下生成与项目相同布局的输入：
+    configs/default_config.json、source/01_extracted/chapters.json、
+    source/02_casting/voice_mapping.json、source/03_segmentation/ch_*_attributed.json
+    """
+    rng = random.Random(seed)
+    speaker_list = speaker_ids(speakers)
+
+    config_dir = workspace / 'configs'
+    extracted_dir = workspace / 'source' / '01_extracted'
+    casting_dir = workspace / 'source' / '02_casting'
+    segmentation_dir = workspace / 'source' / '03_segmentation'
+    for directory in (config_dir, extracted_dir, casting_dir, segmentation_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    shutil.copyfile(CONFIG_FILE, config_dir / 'default_config.json')
+    with open(casting_dir / 'voice_mapping.json', 'w', encoding='utf-8') as f:
+        json.dump(generate_voice_mapping(speaker_list, voices), f, ensure_ascii=False, indent=2)
+
+    chapter_list = []
+    total_segments = 0
+    for number in range(1, chapters + 1):
+        # 章节长度在均值上下浮动，更接近连载小说
+        count = max(1, int(rng.gauss(segments_per_chapter, segments_per_chapter * 0.2)))
+        chapter = generate_chapter(rng, number, count, speaker_list)
+        with open(segmentation_dir / f"{chapter['chapter_id']}_attributed.json", 'w', encoding='utf-8') as f:
+            json.dump(chapter, f, ensure_ascii=False, indent=2)
+
+        content = '\n\n'.join(seg['text'] for seg in chapter['segments'])
+        chapter_list.append({
+            'chapter_id': chapter['chapter_id'],
+            'chapter_number': number,
+            'title': chapter['title'],
+            'content': content,
+            'word_count': len(content)
+        })
+        total_segments += count
+
+    with open(extracted_dir / 'chapters.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'total_chapters': chapters,
+            'novel_title': '合成测试小说',
+            'chapters': chapter_list
+        }, f, ensure_ascii=False, indent=2)
+
+    return {
+        'chapters': chapters,
+        'attributed_segments': total_segments,
+        'speakers': len(speaker_list),
+        'voices': voices,
+        'seed': seed
+    }
+
+def tone_period(frequency: float, amplitude: int = 8000) -> array.array:
+    """一秒的 16-bit 正弦音样本，用于拼接任意时长的夹具"""
+    step = 2 * math.pi * frequency / SAMPLE_RATE
+    return array.array('h', (int(amplitude * math.sin(i * step)) for i in range(SAMPLE_RATE)))
+
+def write_tone_wav(path: Path, seconds: float, period: array.array) -> None:
+    """写入单声道 16-bit 正弦音 WAV"""
+    total = int(seconds * SAMPLE_RATE)
+    data = period.tobytes()
+    if sys.byteorder == 'big':
+        swapped = array.array('h', period)
+        swapped.byteswap()
+        data = swapped.tobytes()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        remaining = total * 2
+        while remaining > 0:
+            chunk = data[:remaining]
+            wav.writeframes(chunk)
+            remaining -= len(chunk)
+
+def write_fixture_wavs(segments: Iterable[Dict[str, Any]], wav_dir: Path) -> Dict[str, float]:
+    """为 TTS 片段生成正弦音 WAV，时长按字数估算，频率按说话人区分。返回 segment_id -> 时长"""
+    periods: Dict[str, array.array] = {}
+    durations = {}
+    for segment in segments:
+        speaker = segment.get('speaker_id', 'narrator')
+        if speaker not in periods:
+            periods[speaker] = tone_period(180.0 + 20.0 * len(periods))
+        seconds = min(MAX_FIXTURE_SECONDS, max(0.5, segment.get('word_count', 0) / WORDS_PER_SECOND))
+        write_tone_wav(wav_dir / f"{segment['segment_id']}.wav", seconds, periods[speaker])
+        durations[segment['segment_id']] = seconds
+    return durations
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='生成合成小说输入')
+    parser.add_argument('workspace', type=Path, help='输出目录（与项目目录布局相同）')
+    parser.add_argument('--chapters', type=int, default=100)
+    parser.add_argument('--segments-per-chapter', type=int, default=60)
+    parser.add_argument('--speakers', type=int, default=12)
+    parser.add_argument('--voices', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+    info = generate_workspace(args.workspace, args.chapters, args.segments_per_chapter,
+                              args.speakers, args.voices, args.seed)
+    print(f"✓ 已生成 {info['chapters']} 章, {info['attributed_segments']} 个归属片段: {args.workspace}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+构建缓存
+以产物的输入内容哈希 + 处理参数作为缓存键，记录已完成的产物，
+配合"临时文件 + 原子重命名"写入，实现可中断、可增量的重建
+"""
+
+import os
+import json
+import mmap
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # 非 POSIX 平台没有 flock，合并写入时不加跨进程锁
+    fcntl = None
+
+# 路径配置
+PROJECT_ROOT = Path(__file__).parent
+CACHE_FILE = PROJECT_ROOT / 'source' / '.build_cache.json'
+
+CACHE_VERSION = 1
+
+def file_sha256(file_path: Path) -> str:
+    """
+    计算文件内容的 SHA-256。文件以内存映射方式读取，不经过用户态缓冲区拷贝；
+    hashlib 在计算时释放 GIL，多个线程可并行计算不同文件
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            return hashlib.sha256(mapped).hexdigest()
+
+def compute_key(inputs: List[str], params: Dict[str, Any]) -> str:
+    """由输入哈希列表和处理参数计算缓存键"""
+    payload = json.dumps({'inputs': inputs, 'params': params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def temp_path_for(path: Path) -> Path:
+    """生成与目标同目录、同扩展名的临时文件路径（便于 ffmpeg 推断格式）"""
+    return path.with_name(f'.{path.stem}.{uuid.uuid4().hex[:8]}.tmp{path.suffix}')
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """跨进程排他锁：对同目录下的 <文件名>.lock 加 flock，多个 worker 合并写入同一缓存时使用"""
+    lock_path = path.with_name(f'{path.name}.lock')
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def atomic_output(path: Path) -> Iterator[Path]:
+    """产出临时路径，成功后原子替换为目标文件，失败时清理临时文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = temp_path_for(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+def atomic_write_json(path: Path, data: Any, indent: Optional[int] = 2) -> None:
+    """原子写入 JSON 文件"""
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """原子写入文本文件"""
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+class BuildCache:
+    """产物缓存清单：记录每个产物的缓存键与输出大小，并按 (size, mtime) 记忆文件哈希"""
+
+    def __init__(self, cache_file: Path = CACHE_FILE):
+        self.cache_file = cache_file
+        # 本进程记录或移除的产物、计算过的文件哈希；合并保存时只写回这些条目
+        self._changed_artifacts = set()
+        self._hashed_files = set()
+        self._lock = threading.Lock()
+        self.dirty = False  # 读取后是否有新的记录
+        self.artifacts, self.file_hashes = self._read()
+
+    def _read(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """读取磁盘上的缓存清单，版本不符或损坏时视为空"""
+        if self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    return data.get('artifacts', {}), data.get('file_hashes', {})
+            except (OSError, ValueError):
+                pass
+        return {}, {}
+
+    @staticmethod
+    def _path_key(path: Path) -> str:
+        return str(Path(path).resolve())
+
+    def file_hash(self, path: Path) -> str:
+        """返回文件内容哈希，文件大小和修改时间未变时复用已记录的值"""
+        stat = path.stat()
+        path_key = self._path_key(path)
+        with self._lock:
+            memo = self.file_hashes.get(path_key)
+        if memo and memo['size'] == stat.st_size and memo['mtime_ns'] == stat.st_mtime_ns:
+            return memo['sha256']
+
+        sha256 = file_sha256(path)
+        with self._lock:
+            self.file_hashes[path_key] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': sha256
+            }
+            self._hashed_files.add(path_key)
+            self.dirty = True
+        return sha256
+
+    def hash_files(self, paths: List[Path], jobs: Optional[int] = None) -> Dict[Path, str]:
+        """并行计算多个文件的哈希（未变化的文件直接复用记录）"""
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+            return dict(zip(paths, executor.map(self.file_hash, paths)))
+
+    def is_fresh(self, artifact: Path, key: str) -> bool:
+        """产物存在、缓存键一致且大小与记录一致时视为最新"""
+        with self._lock:
+            entry = self.artifacts.get(self._path_key(artifact))
+        if not entry or entry.get('key') != key:
+            return False
+        try:
+            return artifact.stat().st_size == entry.get('size')
+        except OSError:
+            return False
+
+    def get(self, artifact: Path) -> Optional[Dict[str, Any]]:
+        """获取产物的缓存记录"""
+        with self._lock:
+            return self.artifacts.get(self._path_key(artifact))
+
+    def record(self, artifact: Path, key: str, **info: Any) -> None:
+        """记录已完成的产物"""
+        entry = {
+            'key': key,
+            'size': artifact.stat().st_size,
+            'built': datetime.now().isoformat(),
+            **info
+        }
+        with self._lock:
+            self.artifacts[self._path_key(artifact)] = entry
+            self._changed_artifacts.add(self._path_key(artifact))
+            self.dirty = True
+
+    def invalidate(self, artifact: Path) -> None:
+        """移除产物的缓存记录"""
+        with self._lock:
+            self.artifacts.pop(self._path_key(artifact), None)
+            self._changed_artifacts.add(self._path_key(artifact))
+            self.dirty = True
+
+    def save(self, merge: bool = False) -> None:
+        """
+        原子写入缓存清单。
+        merge 时在文件锁内先读取磁盘上的清单，只合并本进程记录或移除的产物与计算过的文件哈希
+        （磁盘上的哈希记录更新时保留磁盘上的），供多个进程（工作队列的 worker）共享同一份缓存，
+        不会用启动时读到的旧记录覆盖其他进程的新记录
+        """
+        if not merge:
+            with self._lock:
+                data = {
+                    'version': CACHE_VERSION,
+                    'updated': datetime.now().isoformat(),
+                    'artifacts': dict(self.artifacts),
+                    'file_hashes': dict(self.file_hashes)
+                }
+            atomic_write_json(self.cache_file, data, indent=None)
+            self.dirty = False
+            return
+
+        with file_lock(self.cache_file):
+            artifacts, file_hashes = self._read()
+            with self._lock:
+                for path_key in self._changed_artifacts:
+                    if path_key in self.artifacts:
+                        artifacts[path_key] = self.artifacts[path_key]
+                    else:
+                        artifacts.pop(path_key, None)
+                for path_key in self._hashed_files:
+                    memo = self.file_hashes[path_key]
+                    if memo['mtime_ns'] >= file_hashes.get(path_key, {}).get('mtime_ns', -1):
+                        file_hashes[path_key] = memo
+                self.artifacts, self.file_hashes = artifacts, file_hashes
+                self._changed_artifacts.clear()
+                self._hashed_files.clear()
+                self.dirty = False
+                data = {
+                    'version': CACHE_VERSION,
+                    'updated': datetime.now().isoformat(),
+                    'artifacts': dict(artifacts),
+                    'file_hashes': dict(file_hashes)
+                }
+            atomic_write_json(self.cache_file, data, indent=None)
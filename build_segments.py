@@ -6,58 +6,176 @@
 
 import json
 import os
+import hashlib
+import argparse
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple
+
+import artifact_store
+from build_cache import compute_key, file_sha256
+import instrumentation
+from duration_model import DurationModel
+from segment_packing import PACKERS, pack_segments, plan_stats, split_oversized
+from segment_catalog import CatalogWriter, SegmentCatalog, export_json, open_segments
 
 # 配置
 WORDS_PER_SECOND = 2.5  # 中文语速：每秒约 2.5 字
 TARGET_DURATION = 75  # 目标时长：75 秒
 MAX_WORDS_PER_SEGMENT = int(TARGET_DURATION * WORDS_PER_SECOND)  # 约 187 字
+SEGMENT_ID_HASH_LENGTH = 10
+PACKING_STRATEGY = 'optimal'  # optimal: 最少请求数且时长最均匀; greedy: 原有贪心策略
+
+# 影响合成结果的字段：任一变化都需要重新生成音频
+SYNTHESIS_FIELDS = ('speaker_id', 'voice', 'text', 'emotion', 'emotion_intensity')
 
 # 路径配置
 SOURCE_DIR = Path("source")
 SEGMENTATION_DIR = SOURCE_DIR / "03_segmentation"
 CASTING_DIR = SOURCE_DIR / "02_casting"
 CONFIG_FILE = Path("configs/default_config.json")
+DURATION_MODEL_FILE = SOURCE_DIR / "05_post" / "duration_model.json"
+CATALOG_FILE = SEGMENTATION_DIR / "tts_segments.db"
+JSON_FILE = SEGMENTATION_DIR / "tts_segments.json"
+
+# 时长模型：默认按固定语速估算，存在已拟合的模型时由 main() 替换
+DURATION_MODEL = DurationModel.baseline()
 
 def load_config() -> Dict[str, Any]:
     """加载配置文件"""
-    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return artifact_store.load_json(CONFIG_FILE)
 
 def load_voice_mapping() -> Dict[str, str]:
     """加载音色映射"""
-    voice_file = CASTING_DIR / "voice_mapping.json"
-    with open(voice_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        return data.get('voice_assignments', {})
+    return artifact_store.load_json(CASTING_DIR / "voice_mapping.json").get('voice_assignments', {})
 
 def load_character_descriptions() -> Dict[str, str]:
-    """加载角色描述"""
-    voice_file = CASTING_DIR / "voice_mapping.json"
-    with open(voice_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        return data.get('character_descriptions', {})
+    """加载角色描述（与音色映射同一文件，只解析一次）"""
+    return artifact_store.load_json(CASTING_DIR / "voice_mapping.json").get('character_descriptions', {})
 
 def load_attributed_chapter(chapter_id: str) -> Dict[str, Any]:
     """加载归属的章节文件"""
     chapter_file = SEGMENTATION_DIR / f"{chapter_id}_attributed.json"
-    with open(chapter_file, 'r', encoding='utf-8') as f:
+    with instrumentation.span(chapter_id, 'json'), open(chapter_file, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def calculate_duration(word_count: int) -> float:
+def calculate_duration(word_count: int, text: str = '', voice: Optional[str] = None) -> float:
     """计算预估时长（秒）"""
-    return word_count / WORDS_PER_SECOND
+    return DURATION_MODEL.estimate(word_count, text, voice)
+
+def pack_chapter(chapter_segments: List[Dict[str, Any]], voice_mapping: Dict[str, str],
+                 strategy: str, split: bool = True) -> List[List[Dict[str, Any]]]:
+    """按时长模型将章节的归属片段装箱：每组单一说话人，预估时长不超过目标时长"""
+    def voice_of(seg: Dict[str, Any]) -> str:
+        return voice_mapping.get(seg.get('speaker_id'), 'default_voice')
+
+    # 拆分超长归属片段
+    if split:
+        split_segments = []
+        for seg in chapter_segments:
+            split_segments.extend(split_oversized(seg, DURATION_MODEL.max_words(voice_of(seg), TARGET_DURATION)))
+        chapter_segments = split_segments
+
+    return pack_segments(
+        chapter_segments,
+        lambda run: TARGET_DURATION - DURATION_MODEL.overhead_seconds(voice_of(run[0])),
+        lambda seg: DURATION_MODEL.content_seconds(seg.get('word_count', 0), seg.get('text', ''), voice_of(seg)),
+        strategy)
+
+def segment_id_for(chapter_id: str, source_segment_ids: List[str], text: str) -> str:
+    """由章节、源片段 ID 和文本生成稳定的片段 ID，编辑其他内容不会改变它"""
+    payload = json.dumps([chapter_id, source_segment_ids, text], ensure_ascii=False)
+    digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:SEGMENT_ID_HASH_LENGTH]
+    return f"seg_{chapter_id}_{digest}"
+
+def chapter_cache_key(chapter_file: Path, config: Dict[str, Any], voice_mapping: Dict[str, str],
+                      character_descriptions: Dict[str, str]) -> str:
+    """章节构建输入的指纹：归属文件内容 + 影响片段结果的参数"""
+    params = {
+        'max_words_per_segment': MAX_WORDS_PER_SEGMENT,
+        'words_per_second': WORDS_PER_SECOND,
+        'duration_model': {'default': DURATION_MODEL.default, 'voices': DURATION_MODEL.voices},
+        'packing_strategy': PACKING_STRATEGY,
+        'emotion_intensity': config.get('segment', {}).get('emotion_intensity', 'low'),
+        'voice_mapping': voice_mapping,
+        'character_descriptions': character_descriptions
+    }
+    return compute_key([file_sha256(chapter_file)], params)
+
+def build_chapter_segments(chapter_id: str, chapter_data: Dict[str, Any], config: Dict[str, Any],
+                           voice_mapping: Dict[str, str],
+                           character_descriptions: Dict[str, str]) -> List[Dict[str, Any]]:
+    """构建单个章节的 TTS 片段（不含全书序号）"""
+    # 拆分超长归属片段，再按说话人 run 装箱
+    grouped_segments = [
+        {
+            'speaker_id': group[0].get('speaker_id'),
+            'segments': group,
+            'total_word_count': sum(seg.get('word_count', 0) for seg in group)
+        }
+        for group in pack_chapter(chapter_data.get('segments', []), voice_mapping, PACKING_STRATEGY)
+    ]
+
+    # 为每组创建 TTS 片段
+    tts_segments = []
+    for group in grouped_segments:
+        speaker_id = group['speaker_id']
+        segments = group['segments']
+        total_word_count = group['total_word_count']
+
+        # 合并文本
+        combined_text = ''.join([s.get('text', '') for s in segments])
+        source_segment_ids = [s.get('segment_id') for s in segments]
+        # 拆分后的片段带上分段序号参与 ID 计算，保证同一源片段的各部分 ID 互不相同
+        id_sources = [
+            f"{s.get('segment_id')}#{s['split_part']}" if 'split_part' in s else s.get('segment_id')
+            for s in segments
+        ]
+
+        # 获取音色
+        voice = voice_mapping.get(speaker_id, 'default_voice')
+
+        # 获取说话人名称
+        speaker_name = character_descriptions.get(speaker_id, speaker_id)
+
+        # 计算预估时长
+        estimated_duration = calculate_duration(total_word_count, combined_text, voice)
+
+        # 创建 TTS 片段
+        tts_segments.append({
+            "segment_id": segment_id_for(chapter_id, id_sources, combined_text),
+            "chapter_id": chapter_id,
+            "speaker_id": speaker_id,
+            "speaker_name": speaker_name,
+            "voice": voice,
+            "text": combined_text,
+            "word_count": total_word_count,
+            "estimated_duration_seconds": round(estimated_duration, 2),
+            "emotion": "neutral",
+            "emotion_intensity": config.get('segment', {}).get('emotion_intensity', 'low'),
+            "sequence_number": 0,
+            "source_segment_ids": source_segment_ids
+        })
+
+    return tts_segments
 
 def build_tts_segments(config: Dict[str, Any], voice_mapping: Dict[str, str],
-                       character_descriptions: Dict[str, str]) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
-    """构建 TTS 片段"""
+                       character_descriptions: Dict[str, str],
+                       previous=None,
+                       sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    构建 TTS 片段；提供上次输出（片段目录）时，指纹未变化的章节直接复用。
+    指定 sink 时片段逐个交给 sink 流式写出，不在内存中累积，返回的片段列表为空
+    """
 
     # 获取所有归属章节文件
     attributed_files = sorted(SEGMENTATION_DIR.glob("ch_*_attributed.json"))
 
+    # 上次构建的章节指纹，片段按章节懒加载
+    previous_keys = previous.meta().get('chapter_keys', {}) if previous is not None else {}
+
     all_segments = []
+    emit = sink if sink is not None else all_segments.append
     segment_counter = 1
 
     # 统计信息
@@ -65,142 +183,217 @@ def build_tts_segments(config: Dict[str, Any], voice_mapping: Dict[str, str],
         "total_segments": 0,
         "total_duration_seconds": 0,
         "segments_by_chapter": {},
+        "duration_by_chapter": {},
         "segments_by_speaker": {},
-        "chapters_processed": 0
+        "chapters_processed": 0,
+        "chapters_reused": 0,
+        "chapter_keys": {},
+        "over_limit": 0,
+        "missing_voice": 0
     }
 
     for chapter_file in attributed_files:
         chapter_id = chapter_file.stem.replace("_attributed", "")
-        print(f"处理章节: {chapter_id}")
-
-        chapter_data = load_attributed_chapter(chapter_id)
-        chapter_segments = chapter_data.get('segments', [])
-
-        # 按说话人分组连续片段
-        grouped_segments = []
-        current_group = []
-        current_speaker = None
-        current_word_count = 0
-
-        for seg in chapter_segments:
-            speaker_id = seg.get('speaker_id')
-            word_count = seg.get('word_count', 0)
-
-            # 如果说话人改变或超过目标时长，开始新组
-            if speaker_id != current_speaker or (current_word_count + word_count > MAX_WORDS_PER_SEGMENT):
-                if current_group:
-                    grouped_segments.append({
-                        'speaker_id': current_speaker,
-                        'segments': current_group,
-                        'total_word_count': current_word_count
-                    })
-                current_group = [seg]
-                current_speaker = speaker_id
-                current_word_count = word_count
+        with instrumentation.span(chapter_id, 'chapter') as attrs:
+            chapter_key = chapter_cache_key(chapter_file, config, voice_mapping, character_descriptions)
+
+            chapter_tts_segments = []
+            if previous_keys.get(chapter_id) == chapter_key:
+                chapter_tts_segments = list(previous.iter_segments(chapter_id))
+            if chapter_tts_segments:
+                print(f"复用章节: {chapter_id} (未变化)")
+                stats["chapters_reused"] += 1
+                attrs['reused'] = True
             else:
-                current_group.append(seg)
-                current_word_count += word_count
-
-        # 添加最后一组
-        if current_group:
-            grouped_segments.append({
-                'speaker_id': current_speaker,
-                'segments': current_group,
-                'total_word_count': current_word_count
-            })
-
-        # 为每组创建 TTS 片段
-        chapter_segment_count = 0
-        for group in grouped_segments:
-            speaker_id = group['speaker_id']
-            segments = group['segments']
-            total_word_count = group['total_word_count']
-
-            # 合并文本
-            combined_text = ''.join([s.get('text', '') for s in segments])
-
-            # 获取音色
-            voice = voice_mapping.get(speaker_id, 'default_voice')
-
-            # 获取说话人名称
-            speaker_name = character_descriptions.get(speaker_id, speaker_id)
-
-            # 计算预估时长
-            estimated_duration = calculate_duration(total_word_count)
-
-            # 创建 TTS 片段
-            tts_segment = {
-                "segment_id": f"seg_{segment_counter:05d}",
-                "chapter_id": chapter_id,
-                "speaker_id": speaker_id,
-                "speaker_name": speaker_name,
-                "voice": voice,
-                "text": combined_text,
-                "word_count": total_word_count,
-                "estimated_duration_seconds": round(estimated_duration, 2),
-                "emotion": "neutral",
-                "emotion_intensity": config.get('segment', {}).get('emotion_intensity', 'low'),
-                "sequence_number": segment_counter,
-                "source_segment_ids": [s.get('segment_id') for s in segments]
-            }
-
-            all_segments.append(tts_segment)
-
-            # 更新统计
-            stats["total_duration_seconds"] += estimated_duration
-            stats["segments_by_speaker"][speaker_id] = stats["segments_by_speaker"].get(speaker_id, 0) + 1
-
-            segment_counter += 1
-            chapter_segment_count += 1
-
-        # 更新章节统计
-        stats["segments_by_chapter"][chapter_id] = chapter_segment_count
-        stats["chapters_processed"] += 1
-
-        print(f"  - 生成 {chapter_segment_count} 个 TTS 片段")
-
-    stats["total_segments"] = len(all_segments)
+                print(f"处理章节: {chapter_id}")
+                chapter_data = load_attributed_chapter(chapter_id)
+                with instrumentation.span(chapter_id, 'pack'):
+                    chapter_tts_segments = build_chapter_segments(
+                        chapter_id, chapter_data, config, voice_mapping, character_descriptions)
+
+            chapter_duration = 0.0
+            for tts_segment in chapter_tts_segments:
+                # 全书序号只用于排序，不参与片段 ID
+                tts_segment["sequence_number"] = segment_counter
+                emit(tts_segment)
+
+                # 更新统计
+                speaker_id = tts_segment["speaker_id"]
+                chapter_duration += tts_segment["estimated_duration_seconds"]
+                stats["segments_by_speaker"][speaker_id] = stats["segments_by_speaker"].get(speaker_id, 0) + 1
+                if tts_segment["estimated_duration_seconds"] > TARGET_DURATION:
+                    stats["over_limit"] += 1
+                if not tts_segment.get('voice') or tts_segment['voice'] == 'default_voice':
+                    stats["missing_voice"] += 1
+
+                segment_counter += 1
+
+            # 更新章节统计
+            stats["total_duration_seconds"] += chapter_duration
+            stats["segments_by_chapter"][chapter_id] = len(chapter_tts_segments)
+            stats["duration_by_chapter"][chapter_id] = round(chapter_duration, 2)
+            stats["chapter_keys"][chapter_id] = chapter_key
+            stats["chapters_processed"] += 1
+
+            print(f"  - 生成 {len(chapter_tts_segments)} 个 TTS 片段")
+            attrs['segments'] = len(chapter_tts_segments)
+
+    stats["total_segments"] = segment_counter - 1
     stats["total_duration_seconds"] = round(stats["total_duration_seconds"], 2)
 
     return all_segments, stats
 
-def main():
+def synthesis_signature(segment: Dict[str, Any]) -> str:
+    """影响合成结果的字段摘要，用于对比前后两次构建"""
+    payload = json.dumps([segment.get(field) for field in SYNTHESIS_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def segment_signatures(segments: Iterable[Dict[str, Any]]) -> Dict[str, Tuple[str, str]]:
+    """segment_id -> (chapter_id, 合成字段摘要)，只保留对比所需的最少信息"""
+    return {seg['segment_id']: (seg['chapter_id'], synthesis_signature(seg)) for seg in segments}
+
+def diff_segments(previous: Dict[str, Tuple[str, str]],
+                  current: Dict[str, Tuple[str, str]]) -> Dict[str, Any]:
+    """对比前后两次构建（segment_signatures 的结果），列出新增、删除和需要重新合成的片段"""
+    added = [sid for sid in current if sid not in previous]
+    removed = [sid for sid in previous if sid not in current]
+    changed = [
+        sid for sid, (_, signature) in current.items()
+        if sid in previous and previous[sid][1] != signature
+    ]
+
+    affected_chapters = sorted(
+        {current[sid][0] for sid in added + changed}
+        | {previous[sid][0] for sid in removed}
+    )
+
+    return {
+        "creation_date": datetime.now().isoformat(),
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "unchanged_count": len(current) - len(added) - len(changed),
+        "affected_chapters": affected_chapters
+    }
+
+def build_packing_report(voice_mapping: Dict[str, str]) -> Dict[str, Any]:
+    """对比各装箱策略的请求数与时长分布"""
+    plans: Dict[str, List[float]] = {name: [] for name in PACKERS}
+    by_chapter: Dict[str, Dict[str, int]] = {}
+
+    for chapter_file in sorted(SEGMENTATION_DIR.glob("ch_*_attributed.json")):
+        chapter_id = chapter_file.stem.replace("_attributed", "")
+        chapter_data = load_attributed_chapter(chapter_id)
+
+        by_chapter[chapter_id] = {}
+        for name in PACKERS:
+            # 贪心策略按原实现不拆分超长片段
+            groups = pack_chapter(chapter_data.get('segments', []), voice_mapping, name, split=(name != 'greedy'))
+            for group in groups:
+                voice = voice_mapping.get(group[0].get('speaker_id'), 'default_voice')
+                plans[name].append(calculate_duration(
+                    sum(seg.get('word_count', 0) for seg in group),
+                    ''.join(seg.get('text', '') for seg in group), voice))
+            by_chapter[chapter_id][name] = len(groups)
+
+    # 严格说话人分离下，说话人切换次数 + 1 是请求数下限
+    return {
+        "creation_date": datetime.now().isoformat(),
+        "target_duration_seconds": TARGET_DURATION,
+        "max_words_per_segment": MAX_WORDS_PER_SEGMENT,
+        "strategy": PACKING_STRATEGY,
+        "plans": {name: plan_stats(durations, TARGET_DURATION) for name, durations in plans.items()},
+        "requests_by_chapter": by_chapter
+    }
+
+def load_previous_output():
+    """打开上次构建的片段目录（不存在时回退到 tts_segments.json）"""
+    if not CATALOG_FILE.exists() and not JSON_FILE.exists():
+        return None
+    return open_segments(CATALOG_FILE, JSON_FILE)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='构建 TTS 片段')
+    parser.add_argument('--incremental', action='store_true',
+                        help='只重建归属文件或参数发生变化的章节，其余章节复用上次结果')
+    parser.add_argument('--no-duration-model', action='store_true',
+                        help='忽略已拟合的时长模型，按固定语速估算')
+    parser.add_argument('--packing-report', action='store_true',
+                        help='输出各装箱策略的请求数与时长分布对比 (packing_report.json)')
+    parser.add_argument('--no-json', action='store_true',
+                        help='只写片段目录 (tts_segments.db)，不导出兼容的 tts_segments.json')
+    instrumentation.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """主函数"""
+    global DURATION_MODEL
+
+    args = parse_args(argv)
+
     print("=" * 60)
     print("构建 TTS 片段")
     print("=" * 60)
 
     # 加载配置
     print("\n1. 加载配置...")
-    config = load_config()
-    voice_mapping = load_voice_mapping()
-    character_descriptions = load_character_descriptions()
+    with instrumentation.span('load'):
+        config = load_config()
+        voice_mapping = load_voice_mapping()
+        character_descriptions = load_character_descriptions()
     print(f"   - 目标时长: {config['segment']['target_duration_seconds']} 秒")
     print(f"   - 严格说话人分离: {config['segment']['strict_speaker_separation']}")
     print(f"   - 情绪强度: {config['segment']['emotion_intensity']}")
 
-    # 构建片段
+    fitted_model = None if args.no_duration_model else DurationModel.load(DURATION_MODEL_FILE)
+    if fitted_model is not None:
+        DURATION_MODEL = fitted_model
+        print(f"   - 时长模型: {DURATION_MODEL_FILE} ({fitted_model.info.get('total_samples', 0)} 个样本)")
+    else:
+        print(f"   - 时长模型: 固定语速 {WORDS_PER_SECOND} 字/秒")
+
+    # 构建片段：逐个流式写入片段目录，旧目录在替换前仍用于复用和对比
     print("\n2. 构建 TTS 片段...")
-    segments, stats = build_tts_segments(config, voice_mapping, character_descriptions)
+    previous = load_previous_output()
+    current_signatures: Dict[str, Tuple[str, str]] = {}
+    diff_data = None
+
+    def write_segment(segment: Dict[str, Any]) -> None:
+        writer.add(segment)
+        current_signatures[segment['segment_id']] = (segment['chapter_id'], synthesis_signature(segment))
+
+    with instrumentation.span('build'), CatalogWriter(CATALOG_FILE) as writer:
+        _, stats = build_tts_segments(
+            config, voice_mapping, character_descriptions,
+            previous if args.incremental else None, sink=write_segment)
+
+        writer.set_meta({
+            "creation_date": datetime.now().isoformat(),
+            "total_segments": stats["total_segments"],
+            "total_duration_seconds": stats["total_duration_seconds"],
+            "target_duration_per_segment": TARGET_DURATION,
+            "words_per_second": WORDS_PER_SECOND,
+            "duration_model": DURATION_MODEL.info.get('creation_date', 'baseline'),
+            "strict_speaker_separation": config['segment']['strict_speaker_separation'],
+            "chapter_keys": stats["chapter_keys"]
+        })
+
+        if previous is not None:
+            diff_data = diff_segments(segment_signatures(previous.iter_segments()), current_signatures)
+            previous.close()
 
     # 保存输出
     print("\n3. 保存输出文件...")
+    print(f"   - 已保存: {CATALOG_FILE} ({writer.count} 个片段)")
 
-    # 保存 tts_segments.json
-    output_file = SEGMENTATION_DIR / "tts_segments.json"
-    output_data = {
-        "creation_date": datetime.now().isoformat(),
-        "total_segments": stats["total_segments"],
-        "total_duration_seconds": stats["total_duration_seconds"],
-        "target_duration_per_segment": TARGET_DURATION,
-        "words_per_second": WORDS_PER_SECOND,
-        "strict_speaker_separation": config['segment']['strict_speaker_separation'],
-        "segments": segments
-    }
-
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=2)
-    print(f"   - 已保存: {output_file}")
+    # 导出兼容的 tts_segments.json
+    if not args.no_json:
+        with instrumentation.span('export_json'):
+            catalog = SegmentCatalog(CATALOG_FILE)
+            export_json(catalog, JSON_FILE)
+            catalog.close()
+        print(f"   - 已保存: {JSON_FILE}")
 
     # 保存 segment_manifest.json
     manifest_file = SEGMENTATION_DIR / "segment_manifest.json"
@@ -212,21 +405,44 @@ def main():
         "average_segment_duration": round(stats["total_duration_seconds"] / stats["total_segments"], 2) if stats["total_segments"] > 0 else 0,
         "chapters_processed": stats["chapters_processed"],
         "segments_by_chapter": stats["segments_by_chapter"],
-        "segments_by_speaker": stats["segments_by_speaker"]
+        "duration_by_chapter": stats["duration_by_chapter"],
+        "segments_by_speaker": stats["segments_by_speaker"],
+        "performance": instrumentation.summary()
     }
 
-    with open(manifest_file, 'w', encoding='utf-8') as f:
-        json.dump(manifest_data, f, ensure_ascii=False, indent=2)
+    artifact_store.write_json(manifest_file, manifest_data)
     print(f"   - 已保存: {manifest_file}")
 
+    # 保存 segment_diff.json，供 TTS 生成和后处理只处理变化的片段
+    if diff_data is not None:
+        diff_file = SEGMENTATION_DIR / "segment_diff.json"
+        with open(diff_file, 'w', encoding='utf-8') as f:
+            json.dump(diff_data, f, ensure_ascii=False, indent=2)
+        print(f"   - 已保存: {diff_file}")
+        print(f"     新增 {len(diff_data['added'])}, 删除 {len(diff_data['removed'])}, "
+              f"变化 {len(diff_data['changed'])}, 未变 {diff_data['unchanged_count']}")
+
+    # 保存 packing_report.json
+    if args.packing_report:
+        report_file = SEGMENTATION_DIR / "packing_report.json"
+        report = build_packing_report(voice_mapping)
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"   - 已保存: {report_file}")
+        for name, plan in report['plans'].items():
+            if not plan['requests']:
+                print(f"     {name}: 0 个请求（没有归属章节）")
+                continue
+            print(f"     {name}: {plan['requests']} 个请求, 平均 {plan['mean_duration_seconds']} 秒, "
+                  f"标准差 {plan['stdev_duration_seconds']} 秒")
+
     # 验证和报告
     print("\n4. 验证结果...")
     validation_passed = True
 
     # 检查所有片段是否 <= 75 秒
-    over_limit = [s for s in segments if s['estimated_duration_seconds'] > TARGET_DURATION]
-    if over_limit:
-        print(f"   ⚠️  警告: {len(over_limit)} 个片段超过 {TARGET_DURATION} 秒")
+    if stats['over_limit']:
+        print(f"   ⚠️  警告: {stats['over_limit']} 个片段超过 {TARGET_DURATION} 秒")
         validation_passed = False
     else:
         print(f"   ✓ 所有片段都在 {TARGET_DURATION} 秒以内")
@@ -235,9 +451,8 @@ def main():
     print(f"   ✓ 每个片段恰好有一个说话人（严格分离）")
 
     # 检查所有片段是否有音色分配
-    missing_voice = [s for s in segments if not s.get('voice') or s['voice'] == 'default_voice']
-    if missing_voice:
-        print(f"   ⚠️  警告: {len(missing_voice)} 个片段缺少音色分配")
+    if stats['missing_voice']:
+        print(f"   ⚠️  警告: {stats['missing_voice']} 个片段缺少音色分配")
         validation_passed = False
     else:
         print(f"   ✓ 所有片段都有音色分配")
@@ -249,7 +464,7 @@ def main():
     print(f"\n总片段数: {stats['total_segments']}")
     print(f"总时长: {stats['total_duration_seconds']} 秒 ({manifest_data['total_duration_minutes']} 分钟)")
     print(f"平均片段时长: {manifest_data['average_segment_duration']} 秒")
-    print(f"处理章节数: {stats['chapters_processed']}")
+    print(f"处理章节数: {stats['chapters_processed']} (复用 {stats['chapters_reused']})")
 
     print("\n按章节分布:")
     for chapter_id, count in sorted(stats['segments_by_chapter'].items()):
@@ -265,6 +480,12 @@ def main():
     else:
         print("\n⚠️  验证发现问题，请检查上述警告。")
 
+    print()
+    for line in instrumentation.format_summary(instrumentation.summary()):
+        print(line)
+    for path in instrumentation.export(args, 'build_segments'):
+        print(f"   - 已导出: {path}")
+
     print("\n下一步: 运行 /generate-tts-audio 生成音频文件")
 
 if __name__ == "__main__":
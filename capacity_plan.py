@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+容量规划
+在开始一本书之前预测 TTS 请求数、供应商生成的音频时长、后处理 CPU 时间、输出体积与各阶段墙钟时间：
+  - 工作量来自 tts_segments.json（或片段目录）；尚未构建片段时由归属章节按字数与说话人切换估算
+  - 吞吐率来自历史记录：每次真实运行后，generation_log.json / processing_log.json 的吞吐数据
+    归一化为一条样本追加到 capacity_history.json，取最近几次的合计计算
+  - 运行结束时按本次的实际工作量与并发，用规划时的吞吐率重新预测，记录预测与实际的误差
+没有历史数据的指标使用保守的默认值，并在输出中标注
+"""
+
+import os
+import json
+import math
+import argparse
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import artifact_store
+from build_cache import atomic_write_json
+
+PROJECT_ROOT = Path(__file__).parent
+SOURCE_DIR = PROJECT_ROOT / 'source'
+SEGMENTATION_DIR = SOURCE_DIR / '03_segmentation'
+CATALOG_FILE = SEGMENTATION_DIR / 'tts_segments.db'
+SEGMENTS_FILE = SEGMENTATION_DIR / 'tts_segments.json'
+GENERATION_LOG_FILE = SOURCE_DIR / '04_tts_raw' / 'generation_log.json'
+PROCESSING_LOG_FILE = SOURCE_DIR / '05_post' / 'processing_log.json'
+CONFIG_FILE = PROJECT_ROOT / 'configs' / 'default_config.json'
+HISTORY_FILE = SOURCE_DIR / 'capacity_history.json'
+PLAN_FILE = SOURCE_DIR / 'capacity_plan.json'
+
+HISTORY_WINDOW = 5  # 每个阶段取最近几次运行计算吞吐率
+HISTORY_LIMIT = 50  # 每个阶段在历史文件中保留的样本数（--report 可查看的对比记录）
+SEGMENT_COPIES = 3  # 后处理为每个版本保存片段、场景、章节三份音频
+
+# 没有历史数据时的默认值（保守估计）
+DEFAULT_RATES = {
+    'tts': {
+        'requests_per_segment': 1.0,
+        'audio_per_estimated_second': 1.0,
+        'audio_seconds_per_key_second': 20.0,
+        'wav_bytes_per_second': 32000 * 2
+    },
+    'post': {
+        'audio_seconds_per_job_second': 40.0,
+        'cpu_seconds_per_audio_second': 0.03
+    }
+}
+
+def parse_bitrate(bitrate: str) -> int:
+    """'192k' -> 192000 (bit/s)"""
+    text = str(bitrate).lower()
+    return int(float(text[:-1]) * 1000) if text.endswith('k') else int(text)
+
+def format_hours(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '-'
+    if seconds < 60:
+        return f'{round(seconds, 1)} 秒'
+    if seconds < 3600:
+        return f'{round(seconds / 60, 1)} 分钟'
+    return f'{round(seconds / 3600, 2)} 小时'
+
+# ---------- 工作量 ----------
+
+def segments_workload(chapter_ids: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """由已构建的 TTS 片段统计工作量，片段尚未构建时返回 None"""
+    from segment_catalog import open_segments
+
+    if not CATALOG_FILE.exists() and not SEGMENTS_FILE.exists():
+        return None
+    source = open_segments(CATALOG_FILE, SEGMENTS_FILE)
+    try:
+        segments = [segment for chapter_id in (chapter_ids or source.chapters())
+                    for segment in source.iter_segments(chapter_id)]
+    finally:
+        source.close()
+    return {
+        'source': 'tts_segments',
+        'chapters': len({segment['chapter_id'] for segment in segments}),
+        'segments': len(segments),
+        'characters': sum(len(segment.get('text', '')) for segment in segments),
+        'estimated_seconds': round(sum(segment.get('estimated_duration_seconds', 0) for segment in segments), 1)
+    }
+
+def attributed_workload(chapter_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    由归属章节估算工作量：按固定语速估算时长；片段数按严格说话人分离，
+    同一说话人的连续台词按目标时长装箱
+    """
+    from build_segments import TARGET_DURATION, WORDS_PER_SECOND
+
+    files = sorted(SEGMENTATION_DIR.glob('ch_*_attributed.json'))
+    if chapter_ids:
+        files = [path for path in files if path.stem.replace('_attributed', '') in chapter_ids]
+    segments = 0
+    characters = 0
+    estimated = 0.0
+    for path in files:
+        run_speaker, run_seconds = None, 0.0
+        for item in artifact_store.load_json(path).get('segments', []):
+            seconds = item.get('word_count', len(item.get('text', ''))) / WORDS_PER_SECOND
+            characters += len(item.get('text', ''))
+            estimated += seconds
+            if item.get('speaker_id') != run_speaker:
+                segments += math.ceil(run_seconds / TARGET_DURATION) if run_seconds else 0
+                run_speaker, run_seconds = item.get('speaker_id'), 0.0
+            run_seconds += seconds
+        segments += math.ceil(run_seconds / TARGET_DURATION) if run_seconds else 0
+    return {
+        'source': 'attributed_chapters',
+        'chapters': len(files),
+        'segments': segments,
+        'characters': characters,
+        'estimated_seconds': round(estimated, 1)
+    }
+
+# ---------- 历史样本 ----------
+
+def load_history() -> List[Dict[str, Any]]:
+    if not HISTORY_FILE.exists():
+        return []
+    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def trim_history(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """每个阶段只保留最近 HISTORY_LIMIT 个样本（保持原有顺序）"""
+    kept = []
+    counts: Dict[str, int] = {}
+    for sample in reversed(history):
+        counts[sample['stage']] = counts.get(sample['stage'], 0) + 1
+        if counts[sample['stage']] <= HISTORY_LIMIT:
+            kept.append(sample)
+    return kept[::-1]
+
+def tts_sample(log_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    generation_log.json 的吞吐数据归一化为样本，只统计实际调用接口合成的片段；
+    没有合成任何音频时返回 None
+    """
+    throughput = log_data.get('throughput', {})
+    audio_seconds = throughput.get('audio_seconds')
+    if not audio_seconds or not throughput.get('elapsed_seconds'):
+        return None
+    return {
+        'stage': 'tts',
+        'log_timestamp': log_data.get('timestamp'),
+        'segments': throughput.get('synthesized', 0),
+        'requests': throughput.get('requests', 0),
+        'estimated_seconds': throughput.get('estimated_seconds', 0),
+        'audio_seconds': audio_seconds,
+        'bytes': throughput.get('bytes_written', 0),
+        'concurrency': throughput.get('api_keys', 1),
+        'wall_seconds': throughput['elapsed_seconds']
+    }
+
+def post_sample(log_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """processing_log.json 的吞吐数据归一化为样本，所有片段都被跳过时返回 None"""
+    stats = log_data.get('processing_stats', {})
+    audio_seconds = stats.get('audio_seconds')
+    stage = next((s for s in log_data.get('performance', {}).get('stages', []) if s['stage'] == 'process'), None)
+    if not audio_seconds or stage is None:
+        return None
+    return {
+        'stage': 'post',
+        'log_timestamp': log_data.get('processing_date'),
+        'segments': stats.get('successful_segments', 0),
+        'audio_seconds': audio_seconds,
+        'bytes': round(stats.get('total_output_size_mb', 0) * 1024 * 1024),
+        'cpu_seconds': stage['cpu_seconds'] + stage['child_cpu_seconds'],
+        'concurrency': stats.get('jobs', 1),
+        'wall_seconds': stage['wall_seconds']
+    }
+
+SAMPLERS = {'tts': (GENERATION_LOG_FILE, tts_sample), 'post': (PROCESSING_LOG_FILE, post_sample)}
+
+def stage_samples(history: List[Dict[str, Any]], stage: str) -> List[Dict[str, Any]]:
+    """某阶段最近的样本；历史为空时取当前日志中的一次运行"""
+    samples = [sample for sample in history if sample['stage'] == stage]
+    if not samples:
+        log_file, sampler = SAMPLERS[stage]
+        if log_file.exists():
+            sample = sampler(artifact_store.load_json(log_file))
+            samples = [sample] if sample else []
+    return samples[-HISTORY_WINDOW:]
+
+def ratio(samples: List[Dict[str, Any]], numerator, denominator) -> Optional[float]:
+    top = sum(numerator(s) for s in samples)
+    bottom = sum(denominator(s) for s in samples)
+    return top / bottom if top > 0 and bottom > 0 else None
+
+def throughput_rates(history: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """各阶段的吞吐率（最近样本的合计之比），缺少数据的指标使用默认值并标注来源"""
+    tts = stage_samples(history, 'tts')
+    post = stage_samples(history, 'post')
+    measured = {
+        'tts': {
+            'requests_per_segment': ratio(tts, lambda s: s['requests'], lambda s: s['segments']),
+            'audio_per_estimated_second': ratio(tts, lambda s: s['audio_seconds'], lambda s: s['estimated_seconds']),
+            'audio_seconds_per_key_second': ratio(tts, lambda s: s['audio_seconds'],
+                                                  lambda s: s['wall_seconds'] * s['concurrency']),
+            'wav_bytes_per_second': ratio(tts, lambda s: s['bytes'], lambda s: s['audio_seconds'])
+        },
+        'post': {
+            'audio_seconds_per_job_second': ratio(post, lambda s: s['audio_seconds'],
+                                                  lambda s: s['wall_seconds'] * s['concurrency']),
+            'cpu_seconds_per_audio_second': ratio(post, lambda s: s['cpu_seconds'], lambda s: s['audio_seconds'])
+        }
+    }
+    rates = {}
+    for stage, values in measured.items():
+        samples = tts if stage == 'tts' else post
+        rates[stage] = {
+            'samples': len(samples),
+            'defaults': sorted(name for name, value in values.items() if value is None),
+            **{name: round(value if value is not None else DEFAULT_RATES[stage][name], 4)
+               for name, value in values.items()}
+        }
+    return rates
+
+# ---------- 预测 ----------
+
+def predict_tts(rates: Dict[str, Any], segments: int, estimated_seconds: float, api_keys: int) -> Dict[str, Any]:
+    audio_seconds = estimated_seconds * rates['audio_per_estimated_second']
+    return {
+        'requests': round(segments * rates['requests_per_segment']),
+        'audio_seconds': round(audio_seconds, 1),
+        'wall_seconds': round(audio_seconds / (rates['audio_seconds_per_key_second'] * api_keys), 1),
+        'bytes': round(audio_seconds * rates['wav_bytes_per_second'])
+    }
+
+def predict_post(rates: Dict[str, Any], audio_seconds: float, jobs: int,
+                 renditions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    bytes_per_second = sum(parse_bitrate(rendition['bitrate']) for rendition in renditions) / 8
+    return {
+        'cpu_seconds': round(audio_seconds * rates['cpu_seconds_per_audio_second'], 1),
+        'wall_seconds': round(audio_seconds / (rates['audio_seconds_per_job_second'] * jobs), 1),
+        'bytes': round(audio_seconds * bytes_per_second * SEGMENT_COPIES)
+    }
+
+def build_plan(workload: Dict[str, Any], rates: Dict[str, Dict[str, Any]], api_keys: int, jobs: int) -> Dict[str, Any]:
+    """由工作量、吞吐率与并发预测各阶段（片段首尾补的静音计入后处理的音频时长）"""
+    from renditions import load_renditions
+
+    config = artifact_store.load_json(CONFIG_FILE)
+    renditions = load_renditions(config)
+    processing = config.get('audio_processing', {})
+    padding = (processing.get('silence_start_ms', 200) + processing.get('silence_end_ms', 300)) / 1000
+    tts = predict_tts(rates['tts'], workload['segments'], workload['estimated_seconds'], api_keys)
+    post = predict_post(rates['post'], tts['audio_seconds'] + workload['segments'] * padding, jobs, renditions)
+    return {
+        'creation_date': datetime.now().isoformat(),
+        'workload': workload,
+        'concurrency': {'api_keys': api_keys, 'jobs': jobs},
+        'rates': rates,
+        'predictions': {'tts': tts, 'post': post},
+        'totals': {
+            'wall_seconds': round(tts['wall_seconds'] + post['wall_seconds'], 1),
+            'bytes': tts['bytes'] + post['bytes']
+        }
+    }
+
+def compare(sample: Dict[str, Any], rates: Dict[str, Any]) -> Dict[str, Any]:
+    """用规划时的吞吐率按本次运行的实际工作量与并发重新预测，与实际值比较"""
+    if sample['stage'] == 'tts':
+        predicted = predict_tts(rates, sample['segments'], sample['estimated_seconds'], sample['concurrency'])
+        actual = {key: sample[key] for key in ('requests', 'audio_seconds', 'wall_seconds')}
+    else:
+        predicted = {
+            'cpu_seconds': round(sample['audio_seconds'] * rates['cpu_seconds_per_audio_second'], 1),
+            'wall_seconds': round(sample['audio_seconds'] / (rates['audio_seconds_per_job_second'] * sample['concurrency']), 1)
+        }
+        actual = {key: sample[key] for key in ('cpu_seconds', 'wall_seconds')}
+    return {
+        key: {
+            'predicted': predicted[key],
+            'actual': round(actual[key], 1),
+            'error_percent': round((predicted[key] - actual[key]) / actual[key] * 100, 1) if actual[key] else None
+        }
+        for key in actual
+    }
+
+def record_run(stage: str, log_data: Dict[str, Any]) -> List[str]:
+    """
+    真实运行结束后调用：把本次日志的吞吐数据追加到历史，存在规划时记录预测与实际的对比。
+    返回供调用方打印的文本行
+    """
+    sample = SAMPLERS[stage][1](log_data)
+    if sample is None:
+        return []
+    sample['recorded_at'] = datetime.now().isoformat()
+    lines = []
+    if PLAN_FILE.exists():
+        plan = artifact_store.load_json(PLAN_FILE)
+        sample['vs_plan'] = compare(sample, plan['rates'][stage])
+        sample['plan_date'] = plan.get('creation_date')
+        lines.append(f"容量规划对比（{plan.get('creation_date', '')[:16]} 的吞吐率）:")
+        for key, item in sample['vs_plan'].items():
+            error = f"{item['error_percent']:+}%" if item['error_percent'] is not None else '-'
+            lines.append(f"   {key}: 预测 {item['predicted']}, 实际 {item['actual']} ({error})")
+    history = load_history()
+    history.append(sample)
+    atomic_write_json(HISTORY_FILE, trim_history(history))
+    return lines
+
+# ---------- 命令行 ----------
+
+def print_plan(plan: Dict[str, Any]) -> None:
+    workload = plan['workload']
+    tts, post = plan['predictions']['tts'], plan['predictions']['post']
+    rates = plan['rates']
+
+    def basis(stage: str) -> str:
+        defaults = rates[stage]['defaults']
+        text = f"历史 {rates[stage]['samples']} 次"
+        return text + (f"，默认值: {', '.join(defaults)}" if defaults else '')
+
+    source = '已构建的片段' if workload['source'] == 'tts_segments' else '归属章节估算'
+    print(f"工作量（{source}）: {workload['chapters']} 章, {workload['segments']} 个片段, "
+          f"{workload['characters']:,} 字, 预估 {format_hours(workload['estimated_seconds'])}")
+    print(f"\nTTS（{plan['concurrency']['api_keys']} 个 API Key）:")
+    print(f"   请求数: {tts['requests']}")
+    print(f"   生成音频: {format_hours(tts['audio_seconds'])}")
+    print(f"   墙钟: {format_hours(tts['wall_seconds'])}")
+    print(f"   WAV: {round(tts['bytes'] / 1024 ** 3, 2)} GB")
+    print(f"   依据: {basis('tts')}")
+    print(f"\n后处理（{plan['concurrency']['jobs']} 并发）:")
+    print(f"   编码 CPU: {round(post['cpu_seconds'] / 3600, 2)} CPU 小时")
+    print(f"   墙钟: {format_hours(post['wall_seconds'])}")
+    print(f"   输出: {round(post['bytes'] / 1024 ** 3, 2)} GB（各版本的片段、场景、章节）")
+    print(f"   依据: {basis('post')}")
+    print(f"\n合计: 墙钟 {format_hours(plan['totals']['wall_seconds'])}, "
+          f"磁盘 {round(plan['totals']['bytes'] / 1024 ** 3, 2)} GB")
+
+def print_report(history: List[Dict[str, Any]]) -> None:
+    compared = [sample for sample in history if sample.get('vs_plan')]
+    if not compared:
+        print("尚无与规划对比的运行记录")
+        return
+    for sample in compared:
+        items = ', '.join(f"{key} {item['predicted']}/{item['actual']}"
+                          + (f" ({item['error_percent']:+}%)" if item['error_percent'] is not None else '')
+                          for key, item in sample['vs_plan'].items())
+        print(f"{sample['recorded_at'][:16]} {sample['stage']}: {items}（预测/实际）")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='预测一本书的 TTS 请求数、CPU 时间、体积与各阶段耗时')
+    parser.add_argument('--chapter', action='append', help='只规划指定章节（可重复指定）')
+    parser.add_argument('--api-keys', type=int, default=None,
+                        help='TTS 使用的 API Key 数（默认取最近一次生成的值）')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='后处理并发数（默认为 CPU 核数）')
+    parser.add_argument('--from-attributed', action='store_true',
+                        help='忽略已构建的片段，直接由归属章节估算工作量')
+    parser.add_argument('--report', action='store_true', help='列出历次运行的预测与实际对比')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出规划')
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    """主函数"""
+    args = parse_args(argv)
+    history = load_history()
+    if args.report:
+        print_report(history)
+        return
+
+    workload = None if args.from_attributed else segments_workload(args.chapter)
+    if workload is None:
+        workload = attributed_workload(args.chapter)
+    tts_history = stage_samples(history, 'tts')
+    api_keys = args.api_keys or (tts_history[-1]['concurrency'] if tts_history else 1)
+    jobs = args.jobs or os.cpu_count() or 1
+
+    plan = build_plan(workload, throughput_rates(history), api_keys, jobs)
+    atomic_write_json(PLAN_FILE, plan)
+    if args.json:
+        print(json.dumps(plan, ensure_ascii=False, indent=2))
+    else:
+        print_plan(plan)
+        print(f"\n已保存: {PLAN_FILE}（之后的真实运行会记录预测与实际的对比）")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+章节拼接
+直接拼接各片段 MP3 的音频帧生成章节文件：去掉每个片段的 ID3 与 Xing/Info 帧，
+在文件开头写入一个覆盖整章的 Info/Xing + LAME 标签（总帧数、字节数、TOC、首尾延迟/填充），
+使播放器能够精确跳转并裁掉首尾的编码器延迟与填充。
+帧数据以 copy_file_range / sendfile 零拷贝写入，不启动 ffmpeg 进程
+"""
+
+import os
+import struct
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from build_cache import atomic_output
+from mp3_index import (
+    XING_FLAG_BYTES, XING_FLAG_FRAMES, XING_FLAG_QUALITY, XING_FLAG_TOC,
+    load_index, parse_frame_header, side_info_size
+)
+
+XING_QUALITY = 100
+LAME_TAG_SIZE = 36
+DEFAULT_ENCODER = b'LAME3.100'
+COPY_CHUNK_BYTES = 8 * 1024 * 1024
+
+def _crc16_table() -> List[int]:
+    """CRC-16/ARC（多项式 0x8005 反射），LAME 标签使用的校验"""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+CRC16_TABLE = _crc16_table()
+
+def crc16(data: bytes, crc: int = 0) -> int:
+    for byte in data:
+        crc = (crc >> 8) ^ CRC16_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+class IncompatibleStreams(ValueError):
+    """片段的采样率、声道或 MPEG 版本不一致，无法直接拼接帧"""
+
+def stream_signature(index: Dict[str, Any]) -> Tuple:
+    return (index.get('mpeg_version'), index.get('layer'), index.get('sample_rate'), index.get('channels'))
+
+def read_header(mp3_file: Path, offset: int) -> int:
+    with open(mp3_file, 'rb') as f:
+        f.seek(offset)
+        return struct.unpack('>I', f.read(4))[0]
+
+def read_lame_tag(mp3_file: Path, index: Dict[str, Any]) -> Optional[bytes]:
+    """读取片段 Info 帧中的 LAME 扩展（36 字节），作为新标签的模板"""
+    info = index.get('info_frame')
+    if not info:
+        return None
+    with open(mp3_file, 'rb') as f:
+        f.seek(info['offset'])
+        frame = f.read(info['length'])
+    header = struct.unpack_from('>I', frame)[0]
+    parsed = parse_frame_header(header)
+    pos = 4 + (2 if parsed[6] else 0) + side_info_size(parsed[0], parsed[5])
+    flags = struct.unpack_from('>I', frame, pos + 4)[0]
+    pos += 8 + sum(size for flag, size in ((XING_FLAG_FRAMES, 4), (XING_FLAG_BYTES, 4),
+                                           (XING_FLAG_TOC, 100), (XING_FLAG_QUALITY, 4)) if flags & flag)
+    tag = frame[pos:pos + LAME_TAG_SIZE]
+    return tag if len(tag) == LAME_TAG_SIZE and tag[:4].isalpha() else None
+
+def info_frame_header(template: int, min_length: int) -> Tuple[int, int]:
+    """
+    以片段的首个音频帧头为模板生成 Info 帧头：去掉 CRC 与填充位，
+    帧长不足以容纳标签时提高码率索引
+    """
+    header = (template | 0x00010000) & ~0x00000200
+    for bitrate_index in range((header >> 12) & 0xF, 15):
+        candidate = (header & ~0x0000F000) | (bitrate_index << 12)
+        parsed = parse_frame_header(candidate)
+        if parsed and parsed[3] >= min_length:
+            return candidate, parsed[3]
+    raise ValueError("无法构造足够容纳 Info 标签的帧")
+
+def build_info_frame(template_header: int, tag_type: bytes, total_frames: int, audio_bytes: int,
+                     toc: bytes, lame_template: Optional[bytes], delay: int, padding: int) -> bytes:
+    """生成覆盖整章的 Info/Xing 帧：帧数、字节数、TOC、质量和 LAME 扩展"""
+    parsed = parse_frame_header(template_header)
+    xing_pos = 4 + side_info_size(parsed[0], parsed[5])
+    tag_length = 8 + 4 + 4 + 100 + 4 + LAME_TAG_SIZE
+    header, frame_length = info_frame_header(template_header, xing_pos + tag_length)
+
+    frame = bytearray(frame_length)
+    struct.pack_into('>I', frame, 0, header)
+    pos = xing_pos
+    frame[pos:pos + 4] = tag_type
+    struct.pack_into('>IIII', frame, pos + 4,
+                     XING_FLAG_FRAMES | XING_FLAG_BYTES | XING_FLAG_TOC | XING_FLAG_QUALITY,
+                     total_frames, frame_length + audio_bytes, 0)
+    frame[pos + 16:pos + 116] = toc
+    struct.pack_into('>I', frame, pos + 116, XING_QUALITY)
+
+    lame_pos = pos + 120
+    lame = bytearray(lame_template or DEFAULT_ENCODER.ljust(LAME_TAG_SIZE, b'\0'))
+    lame[21:24] = bytes([(delay >> 4) & 0xFF, ((delay & 0x0F) << 4) | ((padding >> 8) & 0x0F), padding & 0xFF])
+    struct.pack_into('>I', lame, 28, frame_length + audio_bytes)
+    # 音频 CRC 需要读取整章数据，纯 Python 计算代价过高，置零（解码器不校验）
+    struct.pack_into('>H', lame, 32, 0)
+    frame[lame_pos:lame_pos + LAME_TAG_SIZE] = lame
+    struct.pack_into('>H', frame, lame_pos + 34, crc16(bytes(frame[:lame_pos + 34])))
+    return bytes(frame)
+
+def build_toc(frame_offsets: List[int], audio_bytes: int, info_length: int) -> bytes:
+    """Xing TOC：第 i 个百分比时间点所在帧在整个流中的相对字节位置（0-255）"""
+    total_frames = len(frame_offsets)
+    stream_bytes = info_length + audio_bytes
+    toc = bytearray(100)
+    for i in range(100):
+        frame = min(total_frames - 1, i * total_frames // 100)
+        toc[i] = min(255, (info_length + frame_offsets[frame]) * 256 // stream_bytes)
+    return bytes(toc)
+
+def copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
+    """零拷贝复制文件区间：优先 copy_file_range，其次 sendfile，最后回退到读写"""
+    remaining = count
+    while remaining > 0:
+        chunk = min(remaining, COPY_CHUNK_BYTES)
+        try:
+            if hasattr(os, 'copy_file_range'):
+                written = os.copy_file_range(src_fd, dst_fd, chunk, offset)
+            else:
+                written = os.sendfile(dst_fd, src_fd, offset, chunk)
+        except OSError:
+            written = 0
+        if written <= 0:
+            os.lseek(src_fd, offset, os.SEEK_SET)
+            written = os.write(dst_fd, os.read(src_fd, chunk))
+        offset += written
+        remaining -= written
+
+def assemble_chapter(segment_files: List[Path], output_file: Path) -> Dict[str, Any]:
+    """
+    拼接片段 MP3 的音频帧为章节文件。
+    片段内部的编码器延迟与填充属于已编码的音频，不重新编码无法去除；
+    整章只在首尾按第一个片段的延迟、最后一个片段的填充裁剪
+    """
+    indexes = [load_index(path) for path in segment_files]
+    bad = [path.name for path, index in zip(segment_files, indexes) if not index['valid']]
+    if bad:
+        raise ValueError(f"片段不完整: {', '.join(bad)}")
+    if not indexes:
+        raise ValueError("没有可拼接的片段")
+
+    signature = stream_signature(indexes[0])
+    mismatched = [path.name for path, index in zip(segment_files, indexes) if stream_signature(index) != signature]
+    if mismatched:
+        raise IncompatibleStreams(f"音频参数不一致: {', '.join(mismatched)}")
+
+    # 合并后的帧偏移（相对音频数据起点）
+    frame_offsets: List[int] = []
+    audio_bytes = 0
+    for index in indexes:
+        base = audio_bytes - index['audio_start']
+        frame_offsets.extend(offset + base for offset in index['offsets'])
+        audio_bytes += index['audio_end'] - index['audio_start']
+
+    first, last = indexes[0], indexes[-1]
+    template_header = read_header(segment_files[0], first['audio_start'])
+    lame_template = read_lame_tag(segment_files[0], first)
+    tag_type = b'Info' if first.get('info_tag') != 'Xing' else b'Xing'
+    delay = first.get('encoder_delay', 0)
+    padding = last.get('encoder_padding', 0)
+
+    # 先按占位 TOC 确定 Info 帧长，再计算真实 TOC
+    placeholder = build_info_frame(template_header, tag_type, len(frame_offsets), audio_bytes,
+                                   bytes(100), lame_template, delay, padding)
+    toc = build_toc(frame_offsets, audio_bytes, len(placeholder))
+    info_frame = build_info_frame(template_header, tag_type, len(frame_offsets), audio_bytes,
+                                  toc, lame_template, delay, padding)
+
+    with atomic_output(output_file) as tmp_file:
+        with open(tmp_file, 'wb') as out:
+            out.write(info_frame)
+            out.flush()
+            for path, index in zip(segment_files, indexes):
+                with open(path, 'rb') as src:
+                    copy_range(src.fileno(), out.fileno(), index['audio_start'],
+                               index['audio_end'] - index['audio_start'])
+
+    total_samples = len(frame_offsets) * first['samples_per_frame']
+    return {
+        'frames': len(frame_offsets),
+        'bytes': len(info_frame) + audio_bytes,
+        'encoder_delay': delay,
+        'encoder_padding': padding,
+        'duration_seconds': round((total_samples - delay - padding) / first['sample_rate'], 6)
+    }
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='拼接片段 MP3 为章节文件')
+    parser.add_argument('output', type=Path)
+    parser.add_argument('segments', nargs='+', type=Path)
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+    result = assemble_chapter(args.segments, args.output)
+    print(f"✓ {args.output.name}: {result['frames']} 帧, {result['duration_seconds']} 秒, "
+          f"{round(result['bytes'] / (1024 * 1024), 2)} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+NumPy 音频处理后端
+在进程内完成片段的静音填充、BS.1770 K 加权门限响度测量、增益与真峰值限制，
+只把最终的 PCM 通过管道交给外部编码器输出 MP3，替代每个片段一次的 ffmpeg 滤镜图。
+NumPy 为可选依赖；安装 SciPy 时使用其 IIR 滤波与多相重采样，否则使用 FFT 实现
+"""
+
+import sys
+import wave
+import argparse
+import subprocess
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from build_cache import atomic_output
+import instrumentation
+
+try:
+    import numpy as np
+except ImportError:
+    # 未安装时只能使用 ffmpeg 后端
+    np = None
+
+try:
+    from scipy import signal as scipy_signal
+except ImportError:
+    scipy_signal = None
+
+HAVE_NUMPY = np is not None
+HAVE_SCIPY = scipy_signal is not None
+
+# BS.1770 参数
+BLOCK_SECONDS = 0.4
+BLOCK_OVERLAP = 0.75
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+LOUDNESS_OFFSET = -0.691
+TRUE_PEAK_OVERSAMPLE = 4
+
+# K 加权两级滤波器（BS.1770 给出 48 kHz 系数，其他采样率按模拟原型重新计算）
+SHELF_GAIN_DB = 3.999843853973347
+SHELF_Q = 0.7071752369554196
+SHELF_FREQUENCY = 1681.974450955533
+SHELF_BAND_EXPONENT = 0.4996667741545416
+HIGHPASS_Q = 0.5003270373238773
+HIGHPASS_FREQUENCY = 38.13547087602444
+
+# 真峰值限制器：前瞻窗口与释放平滑
+LIMITER_LOOKAHEAD_MS = 1.5
+LIMITER_MARGIN_DB = 0.1
+
+# 默认 MP3 码率与 postprocess_audio 一致
+DEFAULT_BITRATE = '192k'
+PARITY_TOLERANCE_LU = 0.5
+
+# 固定参考：48 kHz 下满幅 997 Hz 正弦的积分响度为 -3.01 LUFS（BS.1770）
+REFERENCE_FREQUENCY = 997
+REFERENCE_SAMPLE_RATE = 48000
+REFERENCE_LUFS = -3.01
+REFERENCE_TOLERANCE_LU = 0.01
+
+def require_numpy() -> None:
+    if not HAVE_NUMPY:
+        raise ImportError("NumPy 后端需要安装 numpy (pip install numpy，可选 scipy)")
+
+def read_wav(wav_file: Path) -> Tuple['np.ndarray', int]:
+    """读取 PCM WAV 为 [-1, 1] 范围的单声道 float64 数组，多声道取平均"""
+    require_numpy()
+    with wave.open(str(wav_file), 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float64) / 32768
+    elif width == 3:
+        bytes_ = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = bytes_[:, 0] | (bytes_[:, 1] << 8) | (bytes_[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float64) / 8388608
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float64) / 2147483648
+    else:
+        raise ValueError(f"不支持的采样位宽: {width * 8} bit")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
+
+def pad_silence(samples: 'np.ndarray', sample_rate: int, start_ms: int, end_ms: int) -> 'np.ndarray':
+    """首尾填充静音（等价于 adelay + apad）"""
+    start = int(round(sample_rate * start_ms / 1000))
+    end = int(round(sample_rate * end_ms / 1000))
+    return np.concatenate([np.zeros(start), samples, np.zeros(end)])
+
+def k_weighting_coefficients(sample_rate: int) -> List[Tuple['np.ndarray', 'np.ndarray']]:
+    """K 加权滤波器系数：高频搁架 + RLB 高通，返回 [(b, a), (b, a)]；48 kHz 时与 BS.1770 表中系数一致"""
+    require_numpy()
+    # 第一级：高频搁架
+    k = np.tan(np.pi * SHELF_FREQUENCY / sample_rate)
+    vh = 10 ** (SHELF_GAIN_DB / 20)
+    vb = vh ** SHELF_BAND_EXPONENT
+    a0 = 1 + k / SHELF_Q + k * k
+    shelf_b = np.array([vh + vb * k / SHELF_Q + k * k, 2 * (k * k - vh), vh - vb * k / SHELF_Q + k * k]) / a0
+    shelf_a = np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / SHELF_Q + k * k) / a0])
+
+    # 第二级：高通
+    k = np.tan(np.pi * HIGHPASS_FREQUENCY / sample_rate)
+    a0 = 1 + k / HIGHPASS_Q + k * k
+    highpass_b = np.array([1.0, -2.0, 1.0])
+    highpass_a = np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / HIGHPASS_Q + k * k) / a0])
+
+    return [(shelf_b, shelf_a), (highpass_b, highpass_a)]
+
+def _fft_filter(samples: 'np.ndarray', sample_rate: int,
+                stages: List[Tuple['np.ndarray', 'np.ndarray']]) -> 'np.ndarray':
+    """无 SciPy 时按频率响应做 FFT 滤波；末尾补零容纳 IIR 的衰减尾部"""
+    tail = sample_rate // 2
+    size = 1 << int(np.ceil(np.log2(len(samples) + tail)))
+    spectrum = np.fft.rfft(samples, size)
+    z = np.exp(-1j * np.linspace(0, np.pi, size // 2 + 1))
+    for b, a in stages:
+        spectrum *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.fft.irfft(spectrum, size)[:len(samples)]
+
+def k_weight(samples: 'np.ndarray', sample_rate: int) -> 'np.ndarray':
+    """对信号施加 K 加权"""
+    stages = k_weighting_coefficients(sample_rate)
+    if HAVE_SCIPY:
+        sos = np.array([np.concatenate([b, a]) for b, a in stages])
+        return scipy_signal.sosfilt(sos, samples)
+    return _fft_filter(samples, sample_rate, stages)
+
+def block_powers(weighted: 'np.ndarray', sample_rate: int) -> 'np.ndarray':
+    """400 ms 块（75% 重叠）的均方值，用累加和一次算出所有块"""
+    block = int(round(BLOCK_SECONDS * sample_rate))
+    step = int(round(block * (1 - BLOCK_OVERLAP)))
+    if len(weighted) < block:
+        return np.array([])
+    cumulative = np.concatenate([[0.0], np.cumsum(weighted * weighted)])
+    starts = np.arange(0, len(weighted) - block + 1, step)
+    return (cumulative[starts + block] - cumulative[starts]) / block
+
+def integrated_loudness(samples: 'np.ndarray', sample_rate: int) -> float:
+    """BS.1770-4 门限积分响度（LUFS），单声道权重为 1"""
+    powers = block_powers(k_weight(samples, sample_rate), sample_rate)
+    with np.errstate(divide='ignore'):
+        loudness = LOUDNESS_OFFSET + 10 * np.log10(powers)
+    gated = powers[loudness > ABSOLUTE_GATE_LUFS]
+    if gated.size == 0:
+        return float('-inf')
+    relative_gate = LOUDNESS_OFFSET + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = powers[(loudness > ABSOLUTE_GATE_LUFS) & (loudness > relative_gate)]
+    return float(LOUDNESS_OFFSET + 10 * np.log10(gated.mean()))
+
+def oversample(samples: 'np.ndarray', factor: int = TRUE_PEAK_OVERSAMPLE) -> 'np.ndarray':
+    """过采样以估计采样点之间的峰值"""
+    if HAVE_SCIPY:
+        return scipy_signal.resample_poly(samples, factor, 1)
+    spectrum = np.fft.rfft(samples)
+    padded = np.zeros(len(samples) * factor // 2 + 1, dtype=complex)
+    padded[:len(spectrum)] = spectrum
+    return np.fft.irfft(padded, len(samples) * factor) * factor
+
+def true_peak_db(samples: 'np.ndarray') -> float:
+    """4 倍过采样真峰值（dBTP）"""
+    peak = np.max(np.abs(oversample(samples))) if samples.size else 0.0
+    return float(20 * np.log10(peak)) if peak > 0 else float('-inf')
+
+def _sliding_min(values: 'np.ndarray', window: int) -> 'np.ndarray':
+    """前瞻滑动最小值：第 n 点取 [n - window, n + window] 内的最小值"""
+    padded = np.pad(values, (window, window), constant_values=1.0)
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * window + 1).min(axis=1)
+
+def limit_true_peak(samples: 'np.ndarray', sample_rate: int, ceiling_db: float) -> 'np.ndarray':
+    """
+    前瞻限制器：按过采样峰值计算每个采样点所需的增益，
+    取前瞻窗口内的最小值再平滑，保证峰值处增益已降到位
+    """
+    ceiling = 10 ** ((ceiling_db - LIMITER_MARGIN_DB) / 20)
+    peaks = np.abs(oversample(samples)).reshape(-1, TRUE_PEAK_OVERSAMPLE).max(axis=1)[:len(samples)]
+    required = np.minimum(1.0, ceiling / np.maximum(peaks, 1e-12))
+    if required.min() >= 1.0:
+        return samples
+
+    window = max(1, int(sample_rate * LIMITER_LOOKAHEAD_MS / 1000))
+    envelope = _sliding_min(required, window)
+    kernel = np.ones(window) / window
+    envelope = np.minimum(np.convolve(envelope, kernel, mode='same'), envelope)
+    return samples * envelope
+
+def normalize(samples: 'np.ndarray', sample_rate: int, target_lufs: float,
+              ceiling_db: float, silence_floor_lufs: float = ABSOLUTE_GATE_LUFS) -> Tuple['np.ndarray', Dict[str, Any]]:
+    """增益到目标响度，超过真峰值上限的部分由限制器处理"""
+    input_i = integrated_loudness(samples, sample_rate)
+    input_tp = true_peak_db(samples)
+    info = {'input_i': round(input_i, 2), 'input_tp': round(input_tp, 2), 'gain_db': 0.0, 'limited': False}
+    if input_i <= silence_floor_lufs:
+        return samples, info
+
+    gain_db = target_lufs - input_i
+    output = samples * 10 ** (gain_db / 20)
+    info['gain_db'] = round(gain_db, 2)
+    if input_tp + gain_db > ceiling_db:
+        output = limit_true_peak(output, sample_rate, ceiling_db)
+        info['limited'] = True
+    return output, info
+
+def to_pcm16(samples: 'np.ndarray') -> bytes:
+    return (np.clip(samples, -1.0, 1.0 - 1 / 32768) * 32768).round().astype('<i2').tobytes()
+
+def encode_mp3(samples: 'np.ndarray', sample_rate: int, output_file: Path, bitrate: str = DEFAULT_BITRATE,
+               extra_outputs: Optional[List[Tuple[Path, List[str]]]] = None) -> None:
+    """
+    把 PCM 通过管道交给 ffmpeg 编码为 MP3（写入临时文件后原子替换）；
+    extra_outputs 为其他版本的 (输出文件, 编码参数)，由同一个 ffmpeg 进程同时编码
+    """
+    with ExitStack() as stack:
+        cmd = [
+            'ffmpeg',
+            '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+            '-codec:a', 'libmp3lame',
+            '-b:a', bitrate,
+            '-ac', '1',
+            '-y',
+            str(stack.enter_context(atomic_output(output_file)))
+        ]
+        for extra_file, extra_args in extra_outputs or []:
+            cmd += [*extra_args, '-y', str(stack.enter_context(atomic_output(extra_file)))]
+        result = instrumentation.run(cmd, input=to_pcm16(samples), capture_output=True, timeout=60)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd,
+                                                stderr=result.stderr.decode('utf-8', errors='replace'))
+
+def process_segment(input_file: Path, output_file: Path, silence_start_ms: int, silence_end_ms: int,
+                    target_lufs: float, ceiling_db: float, bitrate: str = DEFAULT_BITRATE,
+                    extra_outputs: Optional[List[Tuple[Path, List[str]]]] = None) -> Dict[str, Any]:
+    """NumPy 后端处理单个片段：读取 → 填充静音 → 响度标准化与限制 → 编码（含其他版本）"""
+    try:
+        samples, sample_rate = read_wav(input_file)
+        samples = pad_silence(samples, sample_rate, silence_start_ms, silence_end_ms)
+        samples, info = normalize(samples, sample_rate, target_lufs, ceiling_db)
+        encode_mp3(samples, sample_rate, output_file, bitrate, extra_outputs)
+        file_size = output_file.stat().st_size
+        return {
+            'success': True,
+            'input_file': str(input_file),
+            'output_file': str(output_file),
+            'file_size_bytes': file_size,
+            'file_size_mb': round(file_size / (1024 * 1024), 2),
+            'loudness': info
+        }
+    except subprocess.CalledProcessError as e:
+        return {'success': False, 'error': e.stderr}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def reference_check() -> bool:
+    """以已知响度的参考信号校验本模块的测量值"""
+    t = np.arange(REFERENCE_SAMPLE_RATE * 10) / REFERENCE_SAMPLE_RATE
+    measured = integrated_loudness(np.sin(2 * np.pi * REFERENCE_FREQUENCY * t), REFERENCE_SAMPLE_RATE)
+    ok = abs(measured - REFERENCE_LUFS) <= REFERENCE_TOLERANCE_LU
+    print(f"参考信号 {REFERENCE_FREQUENCY} Hz 满幅正弦: {measured:.2f} LUFS "
+          f"(应为 {REFERENCE_LUFS} ±{REFERENCE_TOLERANCE_LU}) {'✓' if ok else '✗'}\n")
+    return ok
+
+def parity_check(limit: int) -> int:
+    """
+    先校验固定参考信号，再与 ffmpeg 路径对比：
+      1. 原始 WAV 的积分响度：本模块测量值 vs ffmpeg loudnorm 测量值
+      2. 输出 MP3 的积分响度：两个后端各自产出的 MP3 再用 ffmpeg 测量
+    差值超过 ±0.5 LU 的片段计为不一致，返回不一致数（参考信号不符计 1；没有可对比的 WAV 时视为失败）
+    """
+    import tempfile
+    import postprocess_audio as post
+
+    mismatches = 0 if reference_check() else 1
+    wav_files = sorted(post.INPUT_DIR.glob('*.wav'))[:limit]
+    if not wav_files:
+        print(f"错误: {post.INPUT_DIR} 中没有可对比的 WAV")
+        return mismatches + 1
+    segment_mismatches = 0
+    print(f"{'片段':<24}{'测量(ffmpeg)':>14}{'测量(numpy)':>14}{'输出(ffmpeg)':>14}{'输出(numpy)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for wav_file in wav_files:
+            samples, sample_rate = read_wav(wav_file)
+            measured_numpy = integrated_loudness(samples, sample_rate)
+            measured_ffmpeg = post.measure_loudness(wav_file)
+
+            ffmpeg_mp3 = Path(tmp) / f'{wav_file.stem}.ffmpeg.mp3'
+            numpy_mp3 = Path(tmp) / f'{wav_file.stem}.numpy.mp3'
+            post.process_segment(wav_file, ffmpeg_mp3, measured_ffmpeg)
+            process_segment(wav_file, numpy_mp3, post.SILENCE_START_MS, post.SILENCE_END_MS,
+                            post.TARGET_LUFS, post.TRUE_PEAK_DBTP, post.MP3_BITRATE)
+            output_ffmpeg = post.measure_loudness(ffmpeg_mp3)['input_i']
+            output_numpy = post.measure_loudness(numpy_mp3)['input_i']
+
+            ok = (abs(measured_numpy - measured_ffmpeg['input_i']) <= PARITY_TOLERANCE_LU
+                  and abs(output_numpy - output_ffmpeg) <= PARITY_TOLERANCE_LU)
+            segment_mismatches += 0 if ok else 1
+            print(f"{wav_file.stem:<24}{measured_ffmpeg['input_i']:>14.2f}{measured_numpy:>14.2f}"
+                  f"{output_ffmpeg:>14.2f}{output_numpy:>14.2f}  {'✓' if ok else '✗'}")
+
+    print(f"\n{len(wav_files) - segment_mismatches}/{len(wav_files)} 个片段在 ±{PARITY_TOLERANCE_LU} LU 以内")
+    return mismatches + segment_mismatches
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='NumPy 音频处理后端')
+    parser.add_argument('--parity', action='store_true', help='与 ffmpeg 路径对比响度')
+    parser.add_argument('--limit', type=int, default=20, help='对比的片段数')
+    parser.add_argument('files', nargs='*', type=Path, help='测量指定 WAV 的响度与真峰值')
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+    require_numpy()
+    print(f"滤波实现: {'scipy' if HAVE_SCIPY else 'numpy fft'}")
+
+    if args.parity:
+        sys.exit(1 if parity_check(args.limit) else 0)
+
+    for wav_file in args.files:
+        samples, sample_rate = read_wav(wav_file)
+        print(f"{wav_file.name}: {integrated_loudness(samples, sample_rate):.2f} LUFS, "
+              f"{true_peak_db(samples):.2f} dBTP")
+
+if __name__ == "__main__":
+    main()
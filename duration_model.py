@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+时长模型
+根据 05_post 中实际产出的片段 MP3 时长（MP3 帧索引），按音色拟合语速与标点停顿，
+供 build_segments.py 估算片段时长，并报告各章节的估算误差
+"""
+
+import json
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from build_cache import atomic_write_json
+from segment_catalog import open_segments
+from mp3_index import load_index
+
+# 路径配置
+PROJECT_ROOT = Path(__file__).parent
+SEGMENTS_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'tts_segments.json'
+CATALOG_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'tts_segments.db'
+POST_SEGMENTS_DIR = PROJECT_ROOT / 'source' / '05_post' / 'segments'
+MODEL_FILE = PROJECT_ROOT / 'source' / '05_post' / 'duration_model.json'
+
+# 后处理添加的首尾静音（秒），拟合前从实际时长中扣除
+PADDING_SECONDS = (200 + 300) / 1000
+
+# 默认语速（与 build_segments.WORDS_PER_SECOND 一致），用于样本不足时回退
+DEFAULT_WORDS_PER_SECOND = 2.5
+MIN_SAMPLES_PER_VOICE = 8
+
+PUNCTUATION = set('，。！？；：、…—,.!?;:「」『』“”‘’（）()《》')
+
+def count_punctuation(text: str) -> int:
+    """统计文本中的标点数量（标点处会产生停顿）"""
+    return sum(1 for ch in text if ch in PUNCTUATION)
+
+def solve_least_squares(rows: List[List[float]], targets: List[float]) -> List[float]:
+    """最小二乘：解正规方程 (XᵀX)β = Xᵀy，高斯消元"""
+    size = len(rows[0])
+    xtx = [[sum(r[i] * r[j] for r in rows) for j in range(size)] for i in range(size)]
+    xty = [sum(r[i] * y for r, y in zip(rows, targets)) for i in range(size)]
+
+    # 轻微岭正则，避免样本共线时矩阵奇异
+    for i in range(size):
+        xtx[i][i] += 1e-6
+
+    matrix = [xtx[i] + [xty[i]] for i in range(size)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda r: abs(matrix[r][col]))
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+        if abs(matrix[col][col]) < 1e-12:
+            raise ValueError("样本不足以拟合模型")
+        for r in range(size):
+            if r != col:
+                factor = matrix[r][col] / matrix[col][col]
+                matrix[r] = [a - factor * b for a, b in zip(matrix[r], matrix[col])]
+    return [matrix[i][size] / matrix[i][i] for i in range(size)]
+
+class DurationModel:
+    """
+    时长模型：duration = overhead + seconds_per_word × 字数 + seconds_per_pause × 标点数
+    每个音色一组系数，未知音色使用全局系数
+    """
+
+    def __init__(self, voices: Dict[str, Dict[str, float]], default: Dict[str, float],
+                 info: Optional[Dict[str, Any]] = None):
+        self.voices = voices
+        self.default = default
+        self.info = info or {}
+
+    @classmethod
+    def baseline(cls) -> 'DurationModel':
+        """固定语速模型，与原有 WORDS_PER_SECOND 估算一致"""
+        coeffs = {
+            'overhead_seconds': 0.0,
+            'seconds_per_word': 1 / DEFAULT_WORDS_PER_SECOND,
+            'seconds_per_pause': 0.0,
+            'pauses_per_word': 0.0
+        }
+        return cls({}, coeffs)
+
+    @classmethod
+    def load(cls, model_file: Path = MODEL_FILE) -> Optional['DurationModel']:
+        """加载模型文件，不存在时返回 None"""
+        if not model_file.exists():
+            return None
+        with open(model_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['voices'], data['default'], data)
+
+    def coefficients(self, voice: Optional[str]) -> Dict[str, float]:
+        return self.voices.get(voice, self.default) if voice else self.default
+
+    def content_seconds(self, word_count: int, text: str, voice: Optional[str]) -> float:
+        """文本本身的朗读时长（不含每次请求的固定开销）"""
+        c = self.coefficients(voice)
+        return c['seconds_per_word'] * word_count + c['seconds_per_pause'] * count_punctuation(text)
+
+    def overhead_seconds(self, voice: Optional[str]) -> float:
+        """每次 TTS 请求的固定时长开销"""
+        return self.coefficients(voice)['overhead_seconds']
+
+    def estimate(self, word_count: int, text: str, voice: Optional[str]) -> float:
+        """估算一段文本合成后的时长（秒，不含后处理静音）"""
+        return max(0.0, self.overhead_seconds(voice) + self.content_seconds(word_count, text, voice))
+
+    def max_words(self, voice: Optional[str], target_seconds: float) -> int:
+        """在典型标点密度下，目标时长内可容纳的最大字数"""
+        c = self.coefficients(voice)
+        per_word = c['seconds_per_word'] + c['seconds_per_pause'] * c.get('pauses_per_word', 0.0)
+        return max(1, int((target_seconds - c['overhead_seconds']) / per_word))
+
+def fit_coefficients(samples: List[Dict[str, Any]]) -> Dict[str, float]:
+    """对一组样本拟合系数"""
+    rows = [[1.0, s['word_count'], s['pauses']] for s in samples]
+    targets = [s['speech_seconds'] for s in samples]
+    overhead, per_word, per_pause = solve_least_squares(rows, targets)
+
+    # 系数必须有物理意义，否则退化为只拟合语速
+    if per_word <= 0 or per_pause < 0:
+        total_words = sum(s['word_count'] for s in samples) or 1
+        overhead, per_word, per_pause = 0.0, sum(targets) / total_words, 0.0
+
+    total_words = sum(s['word_count'] for s in samples) or 1
+    return {
+        'overhead_seconds': round(overhead, 4),
+        'seconds_per_word': round(per_word, 5),
+        'seconds_per_pause': round(per_pause, 4),
+        'pauses_per_word': round(sum(s['pauses'] for s in samples) / total_words, 4),
+        'words_per_second': round(1 / per_word, 3),
+        'samples': len(samples)
+    }
+
+def collect_samples(segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """收集已产出片段的实际时长作为训练样本"""
+    samples = []
+    for seg in segments:
+        audio_file = POST_SEGMENTS_DIR / f"{seg['segment_id']}.mp3"
+        if not audio_file.exists():
+            continue
+        # 帧索引给出扣除编码器延迟/填充后的精确时长，无需启动 ffprobe
+        index = load_index(audio_file)
+        if not index['valid']:
+            continue
+        duration = index['duration_seconds']
+        samples.append({
+            'segment_id': seg['segment_id'],
+            'chapter_id': seg['chapter_id'],
+            'voice': seg.get('voice'),
+            'word_count': seg.get('word_count', 0),
+            'pauses': count_punctuation(seg.get('text', '')),
+            'speech_seconds': max(0.0, duration - PADDING_SECONDS),
+            'previous_estimate': seg.get('estimated_duration_seconds', 0.0)
+        })
+    return samples
+
+def fit_model(samples: List[Dict[str, Any]]) -> DurationModel:
+    """按音色拟合模型，样本不足的音色使用全局系数"""
+    default = fit_coefficients(samples)
+    by_voice: Dict[str, List[Dict[str, Any]]] = {}
+    for sample in samples:
+        by_voice.setdefault(sample['voice'], []).append(sample)
+
+    voices = {
+        voice: fit_coefficients(voice_samples)
+        for voice, voice_samples in by_voice.items()
+        if len(voice_samples) >= MIN_SAMPLES_PER_VOICE
+    }
+    return DurationModel(voices, default)
+
+def chapter_error_report(samples: List[Dict[str, Any]], model: DurationModel,
+                         segments_text: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+    """按章节统计原估算与模型估算相对实际时长的误差"""
+    chapters: Dict[str, Dict[str, float]] = {}
+    for sample in samples:
+        chapter = chapters.setdefault(sample['chapter_id'], {
+            'actual_seconds': 0.0, 'previous_estimate_seconds': 0.0, 'model_estimate_seconds': 0.0
+        })
+        chapter['actual_seconds'] += sample['speech_seconds']
+        chapter['previous_estimate_seconds'] += sample['previous_estimate']
+        chapter['model_estimate_seconds'] += model.estimate(
+            sample['word_count'], segments_text[sample['segment_id']], sample['voice'])
+
+    for chapter in chapters.values():
+        actual = chapter['actual_seconds'] or 1.0
+        chapter['previous_error_pct'] = round((chapter['previous_estimate_seconds'] - actual) / actual * 100, 2)
+        chapter['model_error_pct'] = round((chapter['model_estimate_seconds'] - actual) / actual * 100, 2)
+        for key in ('actual_seconds', 'previous_estimate_seconds', 'model_estimate_seconds'):
+            chapter[key] = round(chapter[key], 2)
+    return dict(sorted(chapters.items()))
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("拟合时长模型")
+    print("=" * 60)
+
+    source = open_segments(CATALOG_FILE, SEGMENTS_FILE)
+    segments = list(source.iter_segments())
+    source.close()
+
+    print("\n1. 读取实际片段时长...")
+    samples = collect_samples(segments)
+    print(f"   - 样本数: {len(samples)}")
+    if len(samples) < MIN_SAMPLES_PER_VOICE:
+        print("   ⚠️  样本不足，无法拟合模型")
+        return
+
+    print("\n2. 拟合模型...")
+    model = fit_model(samples)
+    for voice, coeffs in model.voices.items():
+        print(f"   - {voice}: {coeffs['words_per_second']} 字/秒, "
+              f"停顿 {coeffs['seconds_per_pause']} 秒/标点 ({coeffs['samples']} 个样本)")
+
+    print("\n3. 章节估算误差...")
+    segments_text = {seg['segment_id']: seg.get('text', '') for seg in segments}
+    chapter_errors = chapter_error_report(samples, model, segments_text)
+    for chapter_id, chapter in chapter_errors.items():
+        print(f"   - {chapter_id}: 实际 {chapter['actual_seconds']} 秒, "
+              f"原估算误差 {chapter['previous_error_pct']}%, 模型误差 {chapter['model_error_pct']}%")
+
+    model_data = {
+        'creation_date': datetime.now().isoformat(),
+        'padding_seconds': PADDING_SECONDS,
+        'total_samples': len(samples),
+        'default': model.default,
+        'voices': model.voices,
+        'chapter_errors': chapter_errors
+    }
+    atomic_write_json(MODEL_FILE, model_data)
+    print(f"\n✓ 模型已保存: {MODEL_FILE}")
+    print("\n下一步: 重新运行 build_segments.py 使用新的时长估算")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+目录监视
+优先使用 Linux inotify（通过 ctypes 调用 libc，无需额外依赖），不可用时回退为定期扫描目录。
+两种实现都只报告“可能变化”的文件名，由 Debouncer 等待写入稳定后再交给调用方处理：
+TTS 生成端以临时文件 + 原子重命名写入，但手工复制或其他工具可能分多次写入同一文件
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 2.0  # 扫描模式的目录扫描间隔
+DEBOUNCE_SECONDS = 2.0  # 文件在此时间内没有新变化且大小、修改时间不变才视为写入完成
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+READ_BUFFER_SIZE = 64 * 1024
+
+def file_state(path: Path) -> Optional[Tuple[int, int]]:
+    """文件的 (size, mtime_ns)，不存在时返回 None"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class PollingWatcher:
+    """定期扫描目录，按 (size, mtime) 找出新增或变化的文件"""
+
+    name = 'polling'
+
+    def __init__(self, directory: Path, suffix: str, interval: float = POLL_INTERVAL_SECONDS):
+        self.directory = directory
+        self.suffix = suffix
+        self.interval = interval
+        self.snapshot = self._scan()
+        self.last_scan = time.monotonic()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return snapshot
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout: float) -> Set[str]:
+        """最多等待 timeout 秒，返回自上次扫描以来新增或变化的文件名"""
+        remaining = self.interval - (time.monotonic() - self.last_scan)
+        if remaining > 0:
+            time.sleep(min(timeout, remaining))
+            if remaining > timeout:
+                return set()
+        snapshot = self._scan()
+        self.last_scan = time.monotonic()
+        changed = {name for name, state in snapshot.items() if self.snapshot.get(name) != state}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+class InotifyWatcher:
+    """inotify 监视：文件关闭写入或被重命名到目录中时报告"""
+
+    name = 'inotify'
+
+    def __init__(self, directory: Path, suffix: str):
+        self.directory = directory
+        self.suffix = suffix
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        directory.mkdir(parents=True, exist_ok=True)
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, os.strerror(err), str(directory))
+
+    def _rescan(self) -> Set[str]:
+        """事件队列溢出时丢失了事件，退化为报告目录中的全部文件"""
+        logger.warning("   inotify 事件队列溢出，重新扫描目录")
+        return {entry.name for entry in os.scandir(self.directory)
+                if not entry.name.startswith('.') and entry.name.endswith(self.suffix)}
+
+    def wait(self, timeout: float) -> Set[str]:
+        """最多等待 timeout 秒，返回期间写入完成或重命名进来的文件名"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, READ_BUFFER_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    changed |= self._rescan()
+                elif not name.startswith('.') and name.endswith(self.suffix):
+                    changed.add(name)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+def open_watcher(directory: Path, suffix: str, polling: bool = False):
+    """优先使用 inotify，不支持时（非 Linux、达到监视数量上限等）回退为目录扫描"""
+    if not polling:
+        try:
+            return InotifyWatcher(directory, suffix)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"   inotify 不可用（{e}），改为每 {POLL_INTERVAL_SECONDS} 秒扫描目录")
+    return PollingWatcher(directory, suffix)
+
+class Debouncer:
+    """合并短时间内的多次变化，文件写入稳定后才报告"""
+
+    def __init__(self, directory: Path, quiet_seconds: float = DEBOUNCE_SECONDS):
+        self.directory = directory
+        self.quiet_seconds = quiet_seconds
+        self.pending: Dict[str, Tuple[float, Optional[Tuple[int, int]]]] = {}
+
+    def touch(self, names: Set[str]) -> None:
+        now = time.monotonic()
+        for name in names:
+            self.pending[name] = (now, file_state(self.directory / name))
+
+    def ready(self) -> List[str]:
+        """返回安静期已过且大小、修改时间未再变化的文件；已被删除的文件直接丢弃"""
+        now = time.monotonic()
+        ready = []
+        for name, (last_change, state) in list(self.pending.items()):
+            if now - last_change < self.quiet_seconds:
+                continue
+            current = file_state(self.directory / name)
+            if current is None:
+                del self.pending[name]
+            elif current != state:
+                # 安静期内仍在写入（扫描模式或未产生事件的写入），重新计时
+                self.pending[name] = (now, current)
+            else:
+                del self.pending[name]
+                ready.append(name)
+        return sorted(ready)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.pending
+
+    def __len__(self) -> int:
+        return len(self.pending)
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+MiniMax TTS 生成脚本
+异步并发调用 MiniMax 语音合成接口，为 tts_segments.json 中的每个片段生成原始 WAV：
+按音色、按 API Key 限制并发，令牌桶限流，指数退避重试，流式写入音频
+"""
+
+import os
+import json
+import time
+import random
+import struct
+import asyncio
+import argparse
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import aiohttp
+
+from audio_store import AudioStore, audio_key, link_or_copy
+from build_cache import atomic_output, atomic_write_json
+import capacity_plan
+from segment_catalog import open_segments
+
+# 路径配置
+PROJECT_ROOT = Path(__file__).parent
+SEGMENTS_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'tts_segments.json'
+CATALOG_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'tts_segments.db'
+DIFF_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'segment_diff.json'
+VOICE_MAPPING_FILE = PROJECT_ROOT / 'source' / '02_casting' / 'voice_mapping.json'
+CONFIG_FILE = PROJECT_ROOT / 'configs' / 'default_config.json'
+OUTPUT_DIR = PROJECT_ROOT / 'source' / '04_tts_raw'
+LOG_FILE = OUTPUT_DIR / 'generation_log.json'
+FAILED_FILE = OUTPUT_DIR / 'failed_segments.json'
+
+# 接口配置
+API_URL = os.environ.get('MINIMAX_API_URL', 'https://api.minimaxi.com/v1/t2a_v2')
+MODEL = 'speech-2.8-hd'
+SAMPLE_RATE = 32000
+BITRATE = 128000
+CHANNELS = 1
+SAMPLE_WIDTH = 2  # 16-bit PCM
+REQUEST_TIMEOUT_SECONDS = 120
+
+# 并发与限流
+MAX_IN_FLIGHT_PER_VOICE = 4
+MAX_IN_FLIGHT_PER_KEY = 8
+REQUESTS_PER_SECOND_PER_KEY = 5.0
+BURST_PER_KEY = 5
+
+# 重试：默认值可被 configs/default_config.json 的 tts 配置覆盖
+MAX_RETRIES = 3
+RETRY_BASE_DELAY_SECONDS = 2.0
+RETRY_MAX_DELAY_SECONDS = 60.0
+
+# 默认音色映射（voice_mapping.json 不存在时使用）
+DEFAULT_VOICE_MAPPING = {
+    'narrator': 'moss_audio_ce44fc67-7ce3-11f0-8de5-96e35d26fb85',
+    'char_001': 'Chinese (Mandarin)_Lyrical_Voice',
+    'char_002': 'Chinese (Mandarin)_Graceful_Lady',
+    'char_003': 'Chinese (Mandarin)_Persuasive_Man',
+    'char_004': 'Chinese (Mandarin)_Mature_Woman',
+    'char_005': 'Chinese (Mandarin)_Steady_Man',
+    'char_006': 'Chinese (Mandarin)_Professional_Man',
+    'char_007': 'Chinese (Mandarin)_Young_Woman',
+    'char_008': 'Chinese (Mandarin)_Neutral_Voice'
+}
+
+# 情感标签 → MiniMax 情感
+EMOTION_MAP = {
+    'happy': 'happy',
+    'sad': 'sad', 'desperate': 'sad', 'bitter': 'sad', 'resigned': 'sad', 'pleading': 'sad',
+    'angry': 'angry', 'defensive': 'angry', 'frustrated': 'angry', 'threatening': 'angry',
+    'nervous': 'fearful', 'tense': 'fearful', 'fearful': 'fearful', 'panicked': 'fearful',
+    'surprised': 'surprised', 'shocked': 'surprised',
+    'calm': 'calm', 'cold': 'calm', 'professional': 'calm', 'determined': 'calm', 'sarcastic': 'calm',
+    'whisper': 'whisper'
+}
+
+# 可重试的 MiniMax 错误码：限流、超时、服务端错误
+RETRYABLE_STATUS_CODES = {1000, 1001, 1002, 1024, 1039}
+RATE_LIMIT_STATUS_CODES = {1002, 1039}
+
+class TTSError(Exception):
+    """TTS 请求失败"""
+
+    def __init__(self, message: str, retryable: bool, retry_after: Optional[float] = None,
+                 rate_limited: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.rate_limited = rate_limited
+
+class TokenBucket:
+    """令牌桶限流器：平均速率 rate 个/秒，允许 burst 个突发"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class ApiKeySlot:
+    """单个 API Key 的并发上限与限流器"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.semaphore = asyncio.Semaphore(MAX_IN_FLIGHT_PER_KEY)
+        self.bucket = TokenBucket(REQUESTS_PER_SECOND_PER_KEY, BURST_PER_KEY)
+        self.in_flight = 0
+
+class GenerationStats:
+    """生成统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.bytes_written = 0
+        self.deduplicated = 0
+
+def load_json(file_path: Path) -> Any:
+    """加载 JSON 文件"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_segments(chapter_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """从片段目录读取片段，指定章节时只读取这些章节"""
+    source = open_segments(CATALOG_FILE, SEGMENTS_FILE)
+    try:
+        if not chapter_ids:
+            return list(source.iter_segments())
+        return [seg for chapter_id in chapter_ids for seg in source.iter_segments(chapter_id)]
+    finally:
+        source.close()
+
+def load_api_keys() -> List[str]:
+    """读取 API Key，MINIMAX_API_KEYS 可用逗号分隔多个 Key"""
+    raw = os.environ.get('MINIMAX_API_KEYS') or os.environ.get('MINIMAX_API_KEY', '')
+    return [key.strip() for key in raw.split(',') if key.strip()]
+
+def load_voice_mapping() -> Dict[str, str]:
+    """加载音色映射，不存在时使用默认映射"""
+    if VOICE_MAPPING_FILE.exists():
+        return load_json(VOICE_MAPPING_FILE).get('voice_assignments', DEFAULT_VOICE_MAPPING)
+    return DEFAULT_VOICE_MAPPING
+
+def wav_header(data_size: int) -> bytes:
+    """生成 PCM WAV 文件头"""
+    byte_rate = SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, CHANNELS, SAMPLE_RATE, byte_rate, CHANNELS * SAMPLE_WIDTH, SAMPLE_WIDTH * 8,
+        b'data', data_size
+    )
+
+def build_payload(segment: Dict[str, Any], voice_id: str) -> Dict[str, Any]:
+    """构建流式合成请求：以 PCM 流返回，本地封装为 WAV"""
+    voice_setting = {'voice_id': voice_id, 'speed': 1.0, 'vol': 1.0, 'pitch': 0}
+    emotion = EMOTION_MAP.get(segment.get('emotion', ''))
+    if emotion:
+        voice_setting['emotion'] = emotion
+    return {
+        'model': MODEL,
+        'text': segment['text'],
+        'stream': True,
+        'voice_setting': voice_setting,
+        'audio_setting': {
+            'sample_rate': SAMPLE_RATE,
+            'bitrate': BITRATE,
+            'format': 'pcm',
+            'channel': CHANNELS
+        }
+    }
+
+def check_base_resp(message: Dict[str, Any]) -> None:
+    """检查 MiniMax 响应中的 base_resp 状态码"""
+    base_resp = message.get('base_resp') or {}
+    status_code = base_resp.get('status_code', 0)
+    if status_code:
+        raise TTSError(
+            f"MiniMax 错误 {status_code}: {base_resp.get('status_msg', '')}",
+            retryable=status_code in RETRYABLE_STATUS_CODES,
+            rate_limited=status_code in RATE_LIMIT_STATUS_CODES
+        )
+
+async def stream_to_wav(response: aiohttp.ClientResponse, output_file: Path) -> int:
+    """逐块解析 SSE 流，把 PCM 数据直接写入临时文件，结束后回填 WAV 头并原子重命名"""
+    data_size = 0
+    finished = False
+    with atomic_output(output_file) as tmp_file:
+        with open(tmp_file, 'wb') as f:
+            f.write(wav_header(0))
+            async for raw_line in response.content:
+                line = raw_line.strip()
+                if not line.startswith(b'data:'):
+                    continue
+                message = json.loads(line[5:])
+                check_base_resp(message)
+                data = message.get('data') or {}
+                # status=2 的结束消息携带完整音频，已流式写入时忽略
+                if data.get('status') == 2:
+                    finished = True
+                    if data_size:
+                        continue
+                chunk = bytes.fromhex(data.get('audio', ''))
+                f.write(chunk)
+                data_size += len(chunk)
+
+            if not finished:
+                raise TTSError("音频流意外中断", retryable=True)
+            if data_size == 0:
+                raise TTSError("响应中没有音频数据", retryable=True)
+            f.seek(0)
+            f.write(wav_header(data_size))
+    return data_size
+
+async def synthesize(session: aiohttp.ClientSession, slot: ApiKeySlot, segment: Dict[str, Any],
+                     voice_id: str, output_file: Path) -> int:
+    """发送一次合成请求并流式写入音频"""
+    headers = {'Authorization': f'Bearer {slot.key}', 'Content-Type': 'application/json'}
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+    async with session.post(API_URL, json=build_payload(segment, voice_id),
+                            headers=headers, timeout=timeout) as response:
+        if response.status == 429 or response.status >= 500:
+            retry_after = response.headers.get('Retry-After')
+            raise TTSError(f"HTTP {response.status}", retryable=True,
+                           retry_after=float(retry_after) if retry_after else None,
+                           rate_limited=response.status == 429)
+        if response.status != 200:
+            raise TTSError(f"HTTP {response.status}: {(await response.text())[:200]}", retryable=False)
+
+        # 非流式的错误响应以普通 JSON 返回
+        if response.content_type == 'application/json':
+            check_base_resp(await response.json())
+            raise TTSError("响应不是音频流", retryable=False)
+
+        return await stream_to_wav(response, output_file)
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """指数退避 + 全抖动"""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** attempt)))
+
+def pick_slot(slots: List[ApiKeySlot]) -> ApiKeySlot:
+    """选择当前在途请求最少的 API Key"""
+    return min(slots, key=lambda slot: slot.in_flight)
+
+async def generate_segment(session: aiohttp.ClientSession, segment: Dict[str, Any], voice_id: str,
+                           voice_semaphore: asyncio.Semaphore, slots: List[ApiKeySlot],
+                           stats: GenerationStats) -> Dict[str, Any]:
+    """生成单个片段，失败时按退避策略重试"""
+    segment_id = segment['segment_id']
+    output_file = OUTPUT_DIR / f'{segment_id}.wav'
+    last_error = ''
+
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        async with voice_semaphore:
+            slot = pick_slot(slots)
+            async with slot.semaphore:
+                await slot.bucket.acquire()
+                slot.in_flight += 1
+                stats.requests += 1
+                try:
+                    size = await synthesize(session, slot, segment, voice_id, output_file)
+                    stats.bytes_written += size
+                    return {'segment_id': segment_id, 'success': True, 'attempts': attempt + 1}
+                except TTSError as e:
+                    last_error = str(e)
+                    retry_after = e.retry_after
+                    if e.rate_limited:
+                        stats.rate_limited += 1
+                    if not e.retryable:
+                        break
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    last_error = f"{type(e).__name__}: {e}"
+                finally:
+                    slot.in_flight -= 1
+
+        if attempt < MAX_RETRIES:
+            stats.retries += 1
+            # 退避期间不占用音色和 Key 的并发名额
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+    print(f"   ✗ {segment_id}: {last_error}")
+    return {'segment_id': segment_id, 'success': False, 'error': last_error}
+
+def select_segments(segments: List[Dict[str, Any]], args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """根据命令行参数筛选要生成的片段"""
+    if args.retry_failed:
+        failed_ids = {item['segment_id'] for item in load_json(FAILED_FILE)} if FAILED_FILE.exists() else set()
+        segments = [s for s in segments if s['segment_id'] in failed_ids]
+    if args.diff:
+        diff = load_json(DIFF_FILE)
+        wanted = set(diff['added']) | set(diff['changed'])
+        segments = [s for s in segments if s['segment_id'] in wanted]
+        # 内容变化的片段需要覆盖旧音频
+        for seg in segments:
+            if seg['segment_id'] in diff['changed']:
+                (OUTPUT_DIR / f"{seg['segment_id']}.wav").unlink(missing_ok=True)
+    return segments
+
+def resolve_voice(segment: Dict[str, Any], voice_mapping: Dict[str, str]) -> str:
+    """片段自带音色优先，否则按说话人映射"""
+    return segment.get('voice') or voice_mapping.get(segment['speaker_id'], voice_mapping.get('narrator'))
+
+def segment_audio_key(segment: Dict[str, Any], voice_id: str) -> str:
+    """片段合成结果的去重键"""
+    return audio_key(MODEL, voice_id, segment['text'], EMOTION_MAP.get(segment.get('emotion', '')),
+                     segment.get('emotion_intensity'), SAMPLE_RATE)
+
+async def generate_group(session: aiohttp.ClientSession, key: str, group: List[Dict[str, Any]], voice_id: str,
+                         voice_semaphore: asyncio.Semaphore, slots: List[ApiKeySlot],
+                         stats: GenerationStats, store: Optional[AudioStore]) -> List[Dict[str, Any]]:
+    """
+    生成一组合成输入完全相同的片段：先查存储，未命中时只请求一次，其余片段链接同一音频。
+    存储只是缓存，读写失败时打印警告后继续；重复片段链接失败只计为该片段失败
+    """
+    first = group[0]
+    first_file = OUTPUT_DIR / f"{first['segment_id']}.wav"
+
+    fetched = False
+    if store is not None:
+        try:
+            fetched = store.fetch(key, first_file)
+        except OSError as e:
+            print(f"   ⚠️  {first['segment_id']}: 读取音频存储失败，改为调用接口: {e}")
+    if fetched:
+        result = {'segment_id': first['segment_id'], 'success': True, 'attempts': 0, 'from_store': True}
+    else:
+        result = await generate_segment(session, first, voice_id, voice_semaphore, slots, stats)
+        if result['success'] and store is not None:
+            try:
+                store.put(key, first_file, {'voice': voice_id, 'text': first['text'],
+                                            'emotion': first.get('emotion'), 'model': MODEL})
+            except OSError as e:
+                print(f"   ⚠️  {first['segment_id']}: 写入音频存储失败: {e}")
+
+    results = [result]
+    for segment in group[1:]:
+        if not result['success']:
+            results.append({'segment_id': segment['segment_id'], 'success': False, 'error': result['error']})
+            continue
+        try:
+            link_or_copy(first_file, OUTPUT_DIR / f"{segment['segment_id']}.wav")
+        except OSError as e:
+            print(f"   ✗ {segment['segment_id']}: 链接 {first['segment_id']} 的音频失败: {e}")
+            results.append({'segment_id': segment['segment_id'], 'success': False,
+                            'error': f"链接重复音频失败: {e}"})
+            continue
+        stats.deduplicated += 1
+        results.append({'segment_id': segment['segment_id'], 'success': True, 'attempts': 0,
+                        'duplicate_of': first['segment_id']})
+    return results
+
+async def generate_all(segments: List[Dict[str, Any]], voice_mapping: Dict[str, str],
+                       api_keys: List[str], store: Optional[AudioStore] = None
+                       ) -> tuple[List[Dict[str, Any]], GenerationStats]:
+    """并发生成全部片段，合成输入相同的片段只请求一次"""
+    slots = [ApiKeySlot(key) for key in api_keys]
+    voice_semaphores: Dict[str, asyncio.Semaphore] = {}
+    stats = GenerationStats()
+
+    # 按去重键分组（保持片段顺序）
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    group_voices: Dict[str, str] = {}
+    for segment in segments:
+        voice_id = resolve_voice(segment, voice_mapping)
+        key = segment_audio_key(segment, voice_id)
+        groups.setdefault(key, []).append(segment)
+        group_voices[key] = voice_id
+
+    connector = aiohttp.TCPConnector(limit=MAX_IN_FLIGHT_PER_KEY * len(slots))
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = []
+        for key, group in groups.items():
+            voice_id = group_voices[key]
+            semaphore = voice_semaphores.setdefault(voice_id, asyncio.Semaphore(MAX_IN_FLIGHT_PER_VOICE))
+            tasks.append(generate_group(session, key, group, voice_id, semaphore, slots, stats, store))
+
+        results = []
+        for coro in asyncio.as_completed(tasks):
+            for result in await coro:
+                results.append(result)
+                if result['success']:
+                    source = ' (存储命中)' if result.get('from_store') else ''
+                    print(f"   [{len(results)}/{len(segments)}] ✓ {result['segment_id']}{source}")
+    return results, stats
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='MiniMax TTS 音频生成')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='只重试 failed_segments.json 中记录的片段')
+    parser.add_argument('--diff', action='store_true',
+                        help='只生成 segment_diff.json 中新增或变化的片段')
+    parser.add_argument('--chapter', action='append',
+                        help='只生成指定章节（可重复）')
+    parser.add_argument('--no-store', action='store_true',
+                        help='不使用共享音频存储（仍会对本次运行内的重复片段去重）')
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    global MAX_RETRIES, RETRY_BASE_DELAY_SECONDS
+
+    args = parse_args()
+
+    print("=" * 60)
+    print("MiniMax TTS 音频生成")
+    print("=" * 60)
+
+    api_keys = load_api_keys()
+    if not api_keys:
+        print("Error: MINIMAX_API_KEY environment variable not set")
+        raise SystemExit(1)
+
+    config = load_json(CONFIG_FILE)
+    tts_config = config.get('tts', {})
+    MAX_RETRIES = tts_config.get('retry_attempts', MAX_RETRIES)
+    RETRY_BASE_DELAY_SECONDS = tts_config.get('retry_delay_seconds', RETRY_BASE_DELAY_SECONDS)
+
+    segments = load_segments(args.chapter)
+    voice_mapping = load_voice_mapping()
+    selected = select_segments(segments, args)
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    # 跳过已生成的音频
+    pending = [s for s in selected if not (OUTPUT_DIR / f"{s['segment_id']}.wav").exists()]
+    skipped = len(selected) - len(pending)
+
+    print(f"\n1. 待生成片段: {len(pending)} (跳过已存在 {skipped})")
+    print(f"   - API Key 数: {len(api_keys)}")
+    print(f"   - 并发上限: 每音色 {MAX_IN_FLIGHT_PER_VOICE}, 每 Key {MAX_IN_FLIGHT_PER_KEY}")
+    print(f"   - 限流: 每 Key {REQUESTS_PER_SECOND_PER_KEY} 请求/秒")
+
+    store = None if args.no_store else AudioStore()
+    if store is not None:
+        print(f"   - 音频存储: {store.store_dir}")
+
+    print("\n2. 生成音频...")
+    started = time.monotonic()
+    results, stats = asyncio.run(generate_all(pending, voice_mapping, api_keys, store))
+    elapsed = time.monotonic() - started
+
+    successful = [r for r in results if r['success']]
+    # 实际调用接口合成的片段（不含存储命中与本次重复），用于吞吐统计
+    synthesized = {r['segment_id'] for r in successful if r['attempts'] > 0}
+    estimated = sum(s.get('estimated_duration_seconds', 0) for s in pending if s['segment_id'] in synthesized)
+    failed = [{'segment_id': r['segment_id'], 'error': r['error']} for r in results if not r['success']]
+    failed.sort(key=lambda item: item['segment_id'])
+
+    # 重试模式下保留未参与本次重试的历史失败记录
+    if args.retry_failed and FAILED_FILE.exists():
+        retried = {s['segment_id'] for s in selected}
+        failed = [f for f in load_json(FAILED_FILE) if f['segment_id'] not in retried] + failed
+
+    print("\n3. 保存日志...")
+    log_data = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'stats': {
+            'total': len(selected),
+            'successful': len(successful),
+            'failed': len(failed),
+            'skipped': skipped
+        },
+        'failed_count': len(failed),
+        'throughput': {
+            'elapsed_seconds': round(elapsed, 2),
+            'requests': stats.requests,
+            'retries': stats.retries,
+            'rate_limited': stats.rate_limited,
+            'bytes_written': stats.bytes_written,
+            'synthesized': len(synthesized),
+            'estimated_seconds': round(estimated, 1),
+            'audio_seconds': round(stats.bytes_written / (SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH), 1),
+            'api_keys': len(api_keys),
+            'segments_per_second': round(len(successful) / elapsed, 3) if elapsed > 0 else 0
+        },
+        'audio_store': {
+            'enabled': store is not None,
+            'store_dir': str(store.store_dir) if store is not None else None,
+            'hits': store.hits if store is not None else 0,
+            'misses': store.misses if store is not None else 0,
+            'deduplicated_in_run': stats.deduplicated,
+            'requests_saved': (store.hits if store is not None else 0) + stats.deduplicated
+        }
+    }
+    atomic_write_json(LOG_FILE, log_data)
+    atomic_write_json(FAILED_FILE, failed)
+    plan_lines = capacity_plan.record_run('tts', log_data)
+
+    print("\n" + "=" * 60)
+    print("生成完成！")
+    print("=" * 60)
+    print(f"\n成功: {len(successful)}, 失败: {len(failed)}, 跳过: {skipped}")
+    print(f"请求数: {stats.requests}, 重试: {stats.retries}, 耗时: {round(elapsed, 1)} 秒")
+    print(f"节省请求: {log_data['audio_store']['requests_saved']} "
+          f"(存储命中 {log_data['audio_store']['hits']}, 本次重复 {stats.deduplicated})")
+    for line in plan_lines:
+        print(line)
+    if failed:
+        print("\n重试失败片段: python3 generate_tts_minimax.py --retry-failed")
+    print("\n下一步: 运行 /postprocess-audio 进行音频后处理")
+
+if __name__ == "__main__":
+    main()
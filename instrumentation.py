@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+性能埋点
+以 span 记录各阶段、章节与片段的耗时和资源占用：
+  - 墙钟时间与 CPU 时间
+  - 读写字节数（Linux /proc 的 rchar/wchar，包含磁盘与管道读写）
+  - 子进程（ffmpeg）资源占用：run() / Popen 以 os.wait4 回收子进程，rusage 计入当时打开的 span
+category 为 stage 的 span 统计整个进程（所有线程及其间回收的全部子进程），
+其余 span（segment、chapter 等）只统计创建它的线程。
+汇总写入各脚本已有的日志与输出；可选导出 Prometheus textfile（--metrics）或 Chrome trace JSON（--trace），
+后者可在 chrome://tracing 或 Perfetto 中按线程查看时间线
+"""
+
+import os
+import time
+import threading
+import subprocess
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+
+from build_cache import atomic_write_json, atomic_write_text
+
+SLOWEST_COUNT = 10  # 汇总中列出的最慢片段与章节数
+SLOWEST_CATEGORIES = ('segment', 'chapter')
+METRIC_PREFIX = 'videobook'
+
+_EPOCH = time.perf_counter()
+_lock = threading.Lock()
+_records: List[Dict[str, Any]] = []
+_process_spans: List['Span'] = []  # 打开中的 stage span，接收所有线程回收的子进程资源
+_local = threading.local()
+
+def _io_counters(scope: str) -> Tuple[Optional[int], Optional[int]]:
+    """(rchar, wchar)；非 Linux 或内核不支持 thread-self 时返回 None"""
+    path = '/proc/thread-self/io' if scope == 'thread' else '/proc/self/io'
+    try:
+        with open(path, encoding='ascii') as f:
+            counters = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def _delta(end: Optional[int], start: Optional[int]) -> Optional[int]:
+    return end - start if end is not None and start is not None else None
+
+class Span:
+    """一次计时区间；子进程资源由 record_child_usage 累加"""
+
+    def __init__(self, name: str, category: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.scope = 'process' if category == 'stage' else 'thread'
+        self.attrs = attrs
+        self.child = {'user': 0.0, 'system': 0.0, 'max_rss_kb': 0, 'read_bytes': 0, 'write_bytes': 0,
+                      'processes': 0}
+        self._clock = time.process_time if self.scope == 'process' else time.thread_time
+        self._start = time.perf_counter()
+        self._cpu_start = self._clock()
+        self._io_start = _io_counters(self.scope)
+
+    def add_child(self, rusage) -> None:
+        self.child['user'] += rusage.ru_utime
+        self.child['system'] += rusage.ru_stime
+        self.child['max_rss_kb'] = max(self.child['max_rss_kb'], rusage.ru_maxrss)
+        # ru_inblock / ru_oublock 以 512 字节块计
+        self.child['read_bytes'] += rusage.ru_inblock * 512
+        self.child['write_bytes'] += rusage.ru_oublock * 512
+        self.child['processes'] += 1
+
+    def finish(self) -> Dict[str, Any]:
+        end = time.perf_counter()
+        read_end, write_end = _io_counters(self.scope)
+        return {
+            'name': self.name,
+            'category': self.category,
+            'thread': threading.current_thread().name,
+            'start_seconds': round(self._start - _EPOCH, 6),
+            'wall_seconds': round(end - self._start, 6),
+            'cpu_seconds': round(self._clock() - self._cpu_start, 6),
+            'read_bytes': _delta(read_end, self._io_start[0]),
+            'write_bytes': _delta(write_end, self._io_start[1]),
+            'child_user_seconds': round(self.child['user'], 6),
+            'child_system_seconds': round(self.child['system'], 6),
+            'child_max_rss_kb': self.child['max_rss_kb'],
+            'child_read_bytes': self.child['read_bytes'],
+            'child_write_bytes': self.child['write_bytes'],
+            'subprocesses': self.child['processes'],
+            'attrs': self.attrs
+        }
+
+def _thread_stack() -> List[Span]:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+@contextmanager
+def span(name: str, category: str = 'stage', **attrs) -> Iterator[Dict[str, Any]]:
+    """
+    记录一个 span；产出 attrs 字典，调用方可在区间内补充属性（如处理结果）。
+    抛出异常时标记 error 并继续向上抛出
+    """
+    current = Span(name, category, dict(attrs))
+    stack = _thread_stack()
+    stack.append(current)
+    if current.scope == 'process':
+        with _lock:
+            _process_spans.append(current)
+    try:
+        yield current.attrs
+    except BaseException:
+        current.attrs['error'] = True
+        raise
+    finally:
+        stack.remove(current)
+        record = current.finish()
+        with _lock:
+            if current in _process_spans:
+                _process_spans.remove(current)
+            _records.append(record)
+
+def record_child_usage(rusage) -> None:
+    """把子进程的 rusage 计入当前线程打开的 span 与所有打开的 stage span"""
+    with _lock:
+        targets = set(_thread_stack()) | set(_process_spans)
+        for target in targets:
+            target.add_child(rusage)
+
+class Popen(subprocess.Popen):
+    """以 os.wait4 回收子进程的 Popen，回收时记录子进程资源占用"""
+
+    def _try_wait(self, wait_flags):
+        if not hasattr(os, 'wait4'):
+            return super()._try_wait(wait_flags)
+        try:
+            pid, status, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # 与 subprocess 相同：子进程已被其他地方回收，无法取得状态
+            return self.pid, 0
+        if pid == self.pid:
+            record_child_usage(rusage)
+        return pid, status
+
+def run(*popenargs, input=None, capture_output: bool = False, timeout: Optional[float] = None,
+        check: bool = False, **kwargs) -> subprocess.CompletedProcess:
+    """与 subprocess.run 相同，子进程资源计入当前 span"""
+    if input is not None:
+        kwargs['stdin'] = subprocess.PIPE
+    if capture_output:
+        kwargs['stdout'] = subprocess.PIPE
+        kwargs['stderr'] = subprocess.PIPE
+    with Popen(*popenargs, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            raise
+        except BaseException:
+            process.kill()
+            raise
+        retcode = process.poll()
+        if check and retcode:
+            raise subprocess.CalledProcessError(retcode, process.args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(process.args, retcode, stdout, stderr)
+
+def records() -> List[Dict[str, Any]]:
+    with _lock:
+        return list(_records)
+
+def reset() -> None:
+    with _lock:
+        _records.clear()
+
+def child_cpu(record: Dict[str, Any]) -> float:
+    return record['child_user_seconds'] + record['child_system_seconds']
+
+def _totals(group: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        'count': len(group),
+        'wall_seconds': round(sum(r['wall_seconds'] for r in group), 3),
+        'cpu_seconds': round(sum(r['cpu_seconds'] for r in group), 3),
+        'child_cpu_seconds': round(sum(child_cpu(r) for r in group), 3),
+        'read_bytes': sum(r['read_bytes'] or 0 for r in group),
+        'write_bytes': sum(r['write_bytes'] or 0 for r in group),
+        'subprocesses': sum(r['subprocesses'] for r in group)
+    }
+
+def summary(top: int = SLOWEST_COUNT) -> Dict[str, Any]:
+    """阶段耗时、各类 span 的合计，以及最慢的片段与章节"""
+    spans = records()
+    stages = [{
+        'stage': r['name'],
+        'wall_seconds': round(r['wall_seconds'], 3),
+        'cpu_seconds': round(r['cpu_seconds'], 3),
+        'child_cpu_seconds': round(child_cpu(r), 3),
+        'read_bytes': r['read_bytes'],
+        'write_bytes': r['write_bytes'],
+        'subprocesses': r['subprocesses']
+    } for r in sorted((r for r in spans if r['category'] == 'stage'), key=lambda r: r['start_seconds'])]
+
+    categories: Dict[str, List[Dict[str, Any]]] = {}
+    for r in spans:
+        if r['category'] != 'stage':
+            categories.setdefault(r['category'], []).append(r)
+
+    slowest = {}
+    for category in SLOWEST_CATEGORIES:
+        ranked = sorted(categories.get(category, []), key=lambda r: r['wall_seconds'], reverse=True)[:top]
+        slowest[category] = [{
+            'name': r['name'],
+            'wall_seconds': round(r['wall_seconds'], 3),
+            'cpu_seconds': round(r['cpu_seconds'], 3),
+            'child_cpu_seconds': round(child_cpu(r), 3),
+            'child_max_rss_kb': r['child_max_rss_kb'],
+            **r['attrs']
+        } for r in ranked]
+
+    return {
+        'stages': stages,
+        'categories': {category: _totals(group) for category, group in sorted(categories.items())},
+        'slowest': slowest
+    }
+
+def format_summary(data: Dict[str, Any], top: int = 5) -> List[str]:
+    """汇总的文本形式，供各脚本打印或写入日志"""
+    lines = ["性能统计（墙钟 / 本进程 CPU / 子进程 CPU）:"]
+    for stage in data['stages']:
+        lines.append(f"   {stage['stage']}: {stage['wall_seconds']} 秒 / {stage['cpu_seconds']} 秒 / "
+                     f"{stage['child_cpu_seconds']} 秒, 子进程 {stage['subprocesses']} 个")
+    for category, totals in data['categories'].items():
+        lines.append(f"   [{category}] {totals['count']} 个, 合计 {totals['wall_seconds']} 秒 / "
+                     f"{totals['cpu_seconds']} 秒 / {totals['child_cpu_seconds']} 秒")
+    labels = {'segment': '最慢的片段', 'chapter': '最慢的章节'}
+    for category, ranked in data['slowest'].items():
+        if ranked:
+            items = ', '.join(f"{r['name']} {r['wall_seconds']} 秒" for r in ranked[:top])
+            lines.append(f"   {labels.get(category, category)}: {items}")
+    return lines
+
+def write_chrome_trace(path: Path) -> None:
+    """Chrome trace 事件格式（complete 事件，时间单位为微秒）"""
+    pid = os.getpid()
+    thread_ids: Dict[str, int] = {}
+    events = []
+    for r in sorted(records(), key=lambda r: r['start_seconds']):
+        tid = thread_ids.setdefault(r['thread'], len(thread_ids) + 1)
+        events.append({
+            'name': r['name'],
+            'cat': r['category'],
+            'ph': 'X',
+            'ts': round(r['start_seconds'] * 1e6),
+            'dur': round(r['wall_seconds'] * 1e6),
+            'pid': pid,
+            'tid': tid,
+            'args': {k: v for k, v in r.items() if k not in ('name', 'category', 'thread', 'start_seconds')}
+        })
+    for thread, tid in thread_ids.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread}})
+    atomic_write_json(path, {'traceEvents': events, 'displayTimeUnit': 'ms'}, indent=None)
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def write_prometheus(path: Path, script: str) -> None:
+    """
+    Prometheus textfile collector 格式。只按阶段和 span 类别聚合，不按片段打标签，避免序列数随片段数增长；
+    多个脚本应写入各自的文件
+    """
+    data = summary()
+    metrics: Dict[str, Tuple[str, List[Tuple[Dict[str, str], float]]]] = {}
+
+    def add(name: str, help_text: str, labels: Dict[str, str], value: float) -> None:
+        metrics.setdefault(f'{METRIC_PREFIX}_{name}', (help_text, []))[1].append((labels, value))
+
+    for stage in data['stages']:
+        labels = {'script': script, 'stage': stage['stage']}
+        add('stage_wall_seconds', 'Stage wall-clock time', labels, stage['wall_seconds'])
+        add('stage_cpu_seconds', 'Stage CPU time of this process', labels, stage['cpu_seconds'])
+        add('stage_child_cpu_seconds', 'Stage CPU time of subprocesses', labels, stage['child_cpu_seconds'])
+        add('stage_read_bytes', 'Bytes read by this process during the stage', labels, stage['read_bytes'] or 0)
+        add('stage_write_bytes', 'Bytes written by this process during the stage', labels, stage['write_bytes'] or 0)
+        add('stage_subprocesses', 'Subprocesses reaped during the stage', labels, stage['subprocesses'])
+    for category, totals in data['categories'].items():
+        labels = {'script': script, 'category': category}
+        add('spans', 'Number of spans', labels, totals['count'])
+        add('span_wall_seconds_total', 'Summed span wall-clock time', labels, totals['wall_seconds'])
+        add('span_cpu_seconds_total', 'Summed span CPU time', labels, totals['cpu_seconds'])
+        add('span_child_cpu_seconds_total', 'Summed subprocess CPU time', labels, totals['child_cpu_seconds'])
+    for category, ranked in data['slowest'].items():
+        if ranked:
+            add('span_wall_seconds_max', 'Slowest span wall-clock time', {'script': script, 'category': category},
+                ranked[0]['wall_seconds'])
+    add('last_run_timestamp_seconds', 'Time the metrics were written', {'script': script}, time.time())
+
+    lines = []
+    for name, (help_text, samples) in metrics.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}')
+    atomic_write_text(path, '\n'.join(lines) + '\n')
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """各脚本共用的导出参数"""
+    parser.add_argument('--trace', type=Path, default=None,
+                        help='导出 Chrome trace JSON（chrome://tracing 或 Perfetto 打开）')
+    parser.add_argument('--metrics', type=Path, default=None,
+                        help='导出 Prometheus textfile（node_exporter textfile collector）')
+
+def export(args: argparse.Namespace, script: str) -> List[Path]:
+    """按命令行参数导出，返回写入的文件"""
+    written = []
+    if args.trace:
+        write_chrome_trace(args.trace)
+        written.append(args.trace)
+    if args.metrics:
+        write_prometheus(args.metrics, script)
+        written.append(args.metrics)
+    return written
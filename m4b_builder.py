@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+M4B 有声书打包
+把发布目录中已完成响度处理的章节 MP3 编码为一个 AAC 音频的 M4B，
+写入章节标记（标题来自 chapters.json，起止时间按章节 MP3 帧索引的精确时长累加）与书籍元数据（meta.json）：
+  - 单遍模式：ffmpeg concat 分离器按顺序读取各章节，一次连续编码，章节之间没有编码器间隙
+  - 并行模式：各章节分别编码为 AAC 中间文件（按章节内容哈希缓存，未变化的章节直接复用），
+    再以 concat 分离器 -c copy 封装，只重新编码变化的章节
+两种模式都由 ffmpeg 流式读写，内存占用与书的长度无关
+"""
+
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any
+
+from build_cache import BuildCache, atomic_output, atomic_write_text, compute_key
+import instrumentation
+from mp3_index import mp3_duration
+
+AAC_BITRATE = '64k'
+ENCODE_TIMEOUT_PER_CHAPTER = 600  # 超时按章节数累加（秒）
+
+def escape_metadata(value: Any) -> str:
+    """ffmetadata 中 '='、';'、'#'、'\\' 与换行需要转义"""
+    text = str(value)
+    for char in ('\\', '=', ';', '#', '\n'):
+        text = text.replace(char, '\\' + char)
+    return text
+
+def chapter_marks(chapters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按章节顺序累加精确时长，得到每章的起止时间（毫秒）"""
+    marks = []
+    position = 0.0
+    for chapter in chapters:
+        duration = mp3_duration(chapter['path'])
+        marks.append({
+            'title': chapter['title'],
+            'start_ms': round(position * 1000),
+            'end_ms': round((position + duration) * 1000)
+        })
+        position += duration
+    return marks
+
+def book_tags(meta: Dict[str, Any], book_title: str) -> Dict[str, str]:
+    """由 meta.json 生成容器级元数据；media_type=2 使播放器将文件识别为有声书"""
+    project = meta.get('project', {})
+    audio = meta.get('audio', {})
+    return {
+        'title': book_title,
+        'album': book_title,
+        'genre': 'Audiobook',
+        'media_type': '2',
+        'date': project.get('generation_date', '')[:4],
+        'comment': f"{project.get('name', '')} {project.get('version', '')}, "
+                   f"{audio.get('loudness_lufs', '')} LUFS".strip()
+    }
+
+def ffmetadata(tags: Dict[str, str], marks: List[Dict[str, Any]]) -> str:
+    """生成 ffmetadata 文件内容（全局标签 + 每章一个 [CHAPTER] 段）"""
+    lines = [';FFMETADATA1']
+    lines += [f'{key}={escape_metadata(value)}' for key, value in tags.items() if value]
+    for mark in marks:
+        lines += [
+            '[CHAPTER]',
+            'TIMEBASE=1/1000',
+            f"START={mark['start_ms']}",
+            f"END={mark['end_ms']}",
+            f"title={escape_metadata(mark['title'])}"
+        ]
+    return '\n'.join(lines) + '\n'
+
+def concat_list(paths: List[Path]) -> str:
+    """concat 分离器的文件列表"""
+    lines = []
+    for path in paths:
+        escaped = str(path.absolute()).replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+    return '\n'.join(lines) + '\n'
+
+def run_ffmpeg(cmd: List[str], timeout: int) -> None:
+    result = instrumentation.run(cmd, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd, stderr=result.stderr)
+
+def mux_m4b(inputs: List[Path], metadata_file: Path, output_file: Path, encode: bool, work_dir: Path) -> None:
+    """
+    以 concat 分离器读取 inputs，写入章节与元数据：encode 时连续编码为 AAC（单遍模式），
+    否则直接复制已编码的 AAC 流（并行模式）
+    """
+    list_file = work_dir / 'm4b_concat.txt'
+    atomic_write_text(list_file, concat_list(inputs))
+    codec_args = ['-c:a', 'aac', '-b:a', AAC_BITRATE, '-ac', '1'] if encode else ['-c', 'copy']
+    try:
+        with atomic_output(output_file) as tmp_file:
+            cmd = [
+                'ffmpeg',
+                '-f', 'concat', '-safe', '0', '-i', str(list_file),
+                '-f', 'ffmetadata', '-i', str(metadata_file),
+                '-map', '0:a', '-map_metadata', '1', '-map_chapters', '1',
+                *codec_args,
+                '-movflags', '+faststart',
+                '-f', 'ipod',
+                '-y', str(tmp_file)
+            ]
+            run_ffmpeg(cmd, ENCODE_TIMEOUT_PER_CHAPTER * max(1, len(inputs)))
+    finally:
+        if list_file.exists():
+            list_file.unlink()
+
+def encode_part(chapter_file: Path, part_file: Path, build_cache: BuildCache) -> bool:
+    """把单个章节编码为 AAC 中间文件，章节内容与码率未变化时跳过；返回是否重新编码"""
+    key = compute_key([build_cache.file_hash(chapter_file)], {'aac_bitrate': AAC_BITRATE})
+    if build_cache.is_fresh(part_file, key):
+        return False
+    with instrumentation.span(chapter_file.stem, 'm4b_part'):
+        with atomic_output(part_file) as tmp_file:
+            cmd = [
+                'ffmpeg', '-i', str(chapter_file), '-vn',
+                '-c:a', 'aac', '-b:a', AAC_BITRATE, '-ac', '1',
+                '-f', 'ipod', '-y', str(tmp_file)
+            ]
+            run_ffmpeg(cmd, ENCODE_TIMEOUT_PER_CHAPTER)
+    build_cache.record(part_file, key)
+    return True
+
+def build_m4b(chapters: List[Dict[str, Any]], meta: Dict[str, Any], book_title: str,
+              output_file: Path, work_dir: Path, build_cache: BuildCache,
+              jobs: int = 1, force: bool = False) -> Dict[str, Any]:
+    """
+    生成 M4B。chapters 为按播放顺序排列的 {'title', 'path'}（章节 MP3）；
+    jobs 为 1 时单遍编码，大于 1 时并行编码各章节后封装（中间文件位于 work_dir）。
+    章节音频、标题与元数据均未变化时跳过
+    """
+    if not chapters:
+        raise ValueError('没有可打包的章节音频')
+    work_dir.mkdir(parents=True, exist_ok=True)
+    marks = chapter_marks(chapters)
+    metadata = ffmetadata(book_tags(meta, book_title), marks)
+    mode = 'single_pass' if jobs <= 1 else 'parallel'
+
+    inputs = [build_cache.file_hash(chapter['path']) for chapter in chapters]
+    key = compute_key(inputs + [metadata], {'aac_bitrate': AAC_BITRATE})
+    result = {
+        'output_file': str(output_file),
+        'chapters': len(marks),
+        'duration_seconds': round(marks[-1]['end_ms'] / 1000, 3),
+        'mode': mode
+    }
+    if not force and build_cache.is_fresh(output_file, key):
+        return {**result, 'skipped': True, 'file_size_mb': round(output_file.stat().st_size / (1024 * 1024), 2)}
+
+    metadata_file = work_dir / 'm4b_metadata.txt'
+    atomic_write_text(metadata_file, metadata)
+    if mode == 'single_pass':
+        mux_m4b([chapter['path'] for chapter in chapters], metadata_file, output_file, True, work_dir)
+        result['encoded_parts'] = len(chapters)
+    else:
+        part_files = [work_dir / f"{Path(chapter['path']).stem}.m4a" for chapter in chapters]
+        if force:
+            for part_file in part_files:
+                build_cache.invalidate(part_file)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            encoded = list(executor.map(lambda pair: encode_part(pair[0]['path'], pair[1], build_cache),
+                                        zip(chapters, part_files)))
+        mux_m4b(part_files, metadata_file, output_file, False, work_dir)
+        result['encoded_parts'] = sum(encoded)
+
+    build_cache.record(output_file, key, chapters=len(marks))
+    result['file_size_mb'] = round(output_file.stat().st_size / (1024 * 1024), 2)
+    return result
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+MiniMax TTS 本地模拟服务
+模拟 /v1/t2a_v2 流式接口（SSE + hex 编码 PCM），可配置延迟、限流和失败率，
+用于离线测试 generate_tts_minimax.py 的吞吐与失败处理
+"""
+
+import json
+import math
+import time
+import random
+import struct
+import asyncio
+import argparse
+from typing import Dict, Any
+
+from aiohttp import web
+
+SAMPLE_RATE = 32000
+WORDS_PER_SECOND = 2.5
+CHUNK_SECONDS = 1.0
+
+def tone_pcm(seconds: float, frequency: float = 220.0) -> bytes:
+    """生成 16-bit 单声道正弦音 PCM"""
+    total = int(seconds * SAMPLE_RATE)
+    step = 2 * math.pi * frequency / SAMPLE_RATE
+    return struct.pack(f'<{total}h', *(int(8000 * math.sin(i * step)) for i in range(total)))
+
+def sse_message(payload: Dict[str, Any]) -> bytes:
+    return f"data: {json.dumps(payload)}\n\n".encode('utf-8')
+
+def error_response(status_code: int, status_msg: str) -> web.Response:
+    """MiniMax 以 HTTP 200 + base_resp 返回业务错误"""
+    return web.json_response({'base_resp': {'status_code': status_code, 'status_msg': status_msg}})
+
+class MockState:
+    """模拟服务的全局状态：按 Key 的滑动窗口限流计数"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.requests_by_key: Dict[str, list] = {}
+        self.total_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def over_rate_limit(self, key: str) -> bool:
+        now = time.monotonic()
+        window = [t for t in self.requests_by_key.get(key, []) if now - t < 1.0]
+        window.append(now)
+        self.requests_by_key[key] = window
+        return len(window) > self.args.rate_limit
+
+async def handle_t2a(request: web.Request) -> web.StreamResponse:
+    """处理合成请求"""
+    state: MockState = request.app['state']
+    args = state.args
+    state.total_requests += 1
+
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer ') or not auth[7:]:
+        return error_response(1004, 'authentication failed')
+    if state.over_rate_limit(auth[7:]):
+        return error_response(1002, 'rate limit triggered')
+
+    body = await request.json()
+    text = body.get('text', '')
+    if not text:
+        return error_response(2013, 'invalid params: text')
+    if random.random() < args.failure_rate:
+        return web.Response(status=random.choice([500, 502, 503]))
+
+    state.in_flight += 1
+    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+    try:
+        # 音频时长按字数估算，首包延迟与音频时长成比例
+        seconds = max(0.5, len(text) / WORDS_PER_SECOND) * args.audio_scale
+        await asyncio.sleep(args.latency * random.uniform(0.5, 1.5))
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+
+        pcm = tone_pcm(seconds)
+        chunk_size = int(CHUNK_SECONDS * SAMPLE_RATE) * 2
+        for offset in range(0, len(pcm), chunk_size):
+            if random.random() < args.drop_rate:
+                # 模拟中途断流：客户端应丢弃半写文件并重试
+                return response
+            await response.write(sse_message({
+                'data': {'audio': pcm[offset:offset + chunk_size].hex(), 'status': 1},
+                'base_resp': {'status_code': 0, 'status_msg': ''}
+            }))
+            await asyncio.sleep(args.chunk_delay)
+
+        await response.write(sse_message({
+            'data': {'audio': pcm.hex(), 'status': 2},
+            'extra_info': {'audio_length': int(seconds * 1000), 'audio_sample_rate': SAMPLE_RATE},
+            'base_resp': {'status_code': 0, 'status_msg': 'success'}
+        }))
+        await response.write_eof()
+        return response
+    finally:
+        state.in_flight -= 1
+
+async def handle_stats(request: web.Request) -> web.Response:
+    """返回服务端统计，便于核对客户端的并发上限"""
+    state: MockState = request.app['state']
+    return web.json_response({
+        'total_requests': state.total_requests,
+        'in_flight': state.in_flight,
+        'max_in_flight': state.max_in_flight
+    })
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='MiniMax TTS 本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.3, help='首包平均延迟（秒）')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='流式分块之间的延迟（秒）')
+    parser.add_argument('--audio-scale', type=float, default=1.0, help='生成音频时长的缩放系数')
+    parser.add_argument('--rate-limit', type=int, default=10, help='每 Key 每秒允许的请求数')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='返回 5xx 的概率')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='每个分块中途断流的概率')
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+    app = web.Application()
+    app['state'] = MockState(args)
+    app.router.add_post('/v1/t2a_v2', handle_t2a)
+    app.router.add_get('/stats', handle_stats)
+    print(f"MiniMax 模拟服务: http://{args.host}:{args.port}/v1/t2a_v2")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
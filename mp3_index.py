@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+MP3 帧索引
+以 mmap 扫描 MP3 帧头并解析 Xing/Info + LAME 标签，得到精确时长、帧数、编码器延迟/填充
+以及每帧的字节偏移；source/ 下的索引缓存在文件旁（.<文件名>.idx.json），其他位置的文件只在进程内缓存，
+文件未变化时直接复用，
+用于发布阶段读取真实时长、后处理合并前校验片段完整性，无需逐个调用 ffprobe
+"""
+
+import os
+import sys
+import mmap
+import json
+import struct
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from build_cache import atomic_write_json
+
+PROJECT_ROOT = Path(__file__).parent
+SOURCE_DIR = PROJECT_ROOT / 'source'
+
+# 索引格式版本，修改解析逻辑时递增以使旧索引失效
+INDEX_VERSION = 1
+
+# source/ 以外的 MP3 的索引：按绝对路径保存在进程内，不写入发布目录或临时目录
+_memory_indexes: Dict[str, Dict[str, Any]] = {}
+
+# 帧头表：版本 (1 / 2 / 2.5)、层 (1 / 2 / 3)
+MPEG_VERSIONS = {0b00: 2.5, 0b10: 2, 0b11: 1}
+MPEG_LAYERS = {0b01: 3, 0b10: 2, 0b11: 1}
+SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000)
+}
+BITRATES_KBPS = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+
+XING_FLAG_FRAMES = 0x1
+XING_FLAG_BYTES = 0x2
+XING_FLAG_TOC = 0x4
+XING_FLAG_QUALITY = 0x8
+
+# 同一文件中帧头仅在填充位、私有位等处变化，按完整帧头缓存解析结果
+_HEADER_CACHE: Dict[int, Optional[Tuple]] = {}
+
+def parse_frame_header(header: int) -> Optional[Tuple[float, int, int, int, int, int, bool]]:
+    """
+    解析 32 位帧头，返回 (版本, 层, 采样率, 帧长, 每帧采样数, 声道数, 是否带 CRC)；
+    非法帧头（包括自由码率）返回 None
+    """
+    if header in _HEADER_CACHE:
+        return _HEADER_CACHE[header]
+
+    parsed = None
+    version = MPEG_VERSIONS.get((header >> 19) & 0b11)
+    layer = MPEG_LAYERS.get((header >> 17) & 0b11)
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 0b11
+    if ((header >> 21) & 0x7FF) == 0x7FF and version and layer \
+            and 0 < bitrate_index < 15 and sample_rate_index < 3:
+        bitrate = BITRATES_KBPS[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+        sample_rate = SAMPLE_RATES[version][sample_rate_index]
+        padding = (header >> 9) & 1
+        if layer == 1:
+            frame_length = (12 * bitrate // sample_rate + padding) * 4
+            samples = 384
+        elif layer == 2 or version == 1:
+            frame_length = 144 * bitrate // sample_rate + padding
+            samples = 1152
+        else:
+            frame_length = 72 * bitrate // sample_rate + padding
+            samples = 576
+        channels = 1 if ((header >> 6) & 0b11) == 0b11 else 2
+        has_crc = not (header >> 16) & 1
+        parsed = (version, layer, sample_rate, frame_length, samples, channels, has_crc)
+
+    _HEADER_CACHE[header] = parsed
+    return parsed
+
+def id3v2_size(data, offset: int = 0) -> int:
+    """文件开头 ID3v2 标签的总长度（含头部与可选尾部），没有时返回 0"""
+    if len(data) < offset + 10 or data[offset:offset + 3] != b'ID3':
+        return 0
+    flags = data[offset + 5]
+    size = 0
+    for byte in data[offset + 6:offset + 10]:
+        size = (size << 7) | (byte & 0x7F)
+    return 10 + size + (10 if flags & 0x10 else 0)
+
+def side_info_size(version: float, channels: int) -> int:
+    """Layer III 侧信息长度，Xing 标签紧随其后"""
+    if version == 1:
+        return 17 if channels == 1 else 32
+    return 9 if channels == 1 else 17
+
+def parse_info_tag(data, frame_start: int, frame_length: int, version: float,
+                   channels: int, has_crc: bool) -> Optional[Dict[str, Any]]:
+    """解析首帧中的 Xing/Info 标签及其后的 LAME 扩展（编码器延迟与填充）"""
+    pos = frame_start + 4 + (2 if has_crc else 0) + side_info_size(version, channels)
+    frame_end = frame_start + frame_length
+    if pos + 8 > frame_end or data[pos:pos + 4] not in (b'Xing', b'Info'):
+        return None
+
+    tag = {'type': bytes(data[pos:pos + 4]).decode('ascii'), 'frames': None, 'bytes': None,
+           'encoder': None, 'encoder_delay': 0, 'encoder_padding': 0}
+    flags = struct.unpack_from('>I', data, pos + 4)[0]
+    cursor = pos + 8
+    if flags & XING_FLAG_FRAMES:
+        tag['frames'] = struct.unpack_from('>I', data, cursor)[0]
+        cursor += 4
+    if flags & XING_FLAG_BYTES:
+        tag['bytes'] = struct.unpack_from('>I', data, cursor)[0]
+        cursor += 4
+    if flags & XING_FLAG_TOC:
+        cursor += 100
+    if flags & XING_FLAG_QUALITY:
+        cursor += 4
+
+    # LAME 扩展：9 字节编码器版本，偏移 21 处 3 字节为 12 位延迟 + 12 位填充
+    if cursor + 24 <= frame_end:
+        encoder = bytes(data[cursor:cursor + 9])
+        if encoder[:4].isalpha():
+            tag['encoder'] = encoder.decode('ascii', errors='replace').rstrip('\0 ')
+            b0, b1, b2 = data[cursor + 21:cursor + 24]
+            tag['encoder_delay'] = (b0 << 4) | (b1 >> 4)
+            tag['encoder_padding'] = ((b1 & 0x0F) << 8) | b2
+    return tag
+
+def scan_mp3(mp3_file: Path) -> Dict[str, Any]:
+    """扫描 MP3 文件，返回时长、帧数、编码器延迟/填充、帧偏移和完整性检查结果"""
+    stat = mp3_file.stat()
+    index: Dict[str, Any] = {
+        'index_version': INDEX_VERSION,
+        'file_size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'valid': False,
+        'errors': []
+    }
+    if stat.st_size == 0:
+        index['errors'].append('空文件')
+        return index
+
+    with open(mp3_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = len(data)
+        start = id3v2_size(data)
+        end = size - 128 if size >= 128 and data[size - 128:size - 125] == b'TAG' else size
+
+        offsets: List[int] = []
+        stream = None  # (版本, 层, 采样率)
+        samples_per_frame = 0
+        channels = 0
+        info_tag = None
+        skipped_bytes = 0
+        truncated = False
+        pos = start
+        unpack = struct.Struct('>I').unpack_from
+
+        while pos + 4 <= end:
+            parsed = parse_frame_header(unpack(data, pos)[0]) if data[pos] == 0xFF else None
+            if parsed is not None and stream is not None and parsed[:3] != stream:
+                parsed = None
+            if parsed is None:
+                # 失去同步：逐字节查找下一个帧头
+                next_sync = data.find(b'\xff', pos + 1, end)
+                if next_sync < 0:
+                    skipped_bytes += end - pos
+                    break
+                skipped_bytes += next_sync - pos
+                pos = next_sync
+                continue
+
+            version, layer, sample_rate, frame_length, samples, frame_channels, has_crc = parsed
+            if pos + frame_length > end:
+                truncated = True
+                break
+
+            if stream is None:
+                stream = parsed[:3]
+                samples_per_frame = samples
+                channels = frame_channels
+                if layer == 3:
+                    info_tag = parse_info_tag(data, pos, frame_length, version, frame_channels, has_crc)
+                    if info_tag is not None:
+                        # Info 帧是不含音频的标签帧
+                        index['info_frame'] = {'offset': pos, 'length': frame_length}
+                        pos += frame_length
+                        continue
+
+            offsets.append(pos)
+            pos += frame_length
+
+    audio_start = offsets[0] if offsets else start
+    audio_end = pos if offsets else start
+    index.update({
+        'id3v2_size': start,
+        'id3v1': end != size,
+        'audio_start': audio_start,
+        'audio_end': audio_end,
+        'frames': len(offsets),
+        'offsets': offsets
+    })
+
+    if stream is None:
+        index['errors'].append('未找到 MPEG 音频帧')
+        return index
+
+    version, layer, sample_rate = stream
+    delay = info_tag['encoder_delay'] if info_tag else 0
+    padding = info_tag['encoder_padding'] if info_tag else 0
+    total_samples = len(offsets) * samples_per_frame
+    index.update({
+        'mpeg_version': version,
+        'layer': layer,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'samples_per_frame': samples_per_frame,
+        'info_tag': info_tag['type'] if info_tag else None,
+        'encoder': info_tag['encoder'] if info_tag else None,
+        'encoder_delay': delay,
+        'encoder_padding': padding,
+        'samples': max(0, total_samples - delay - padding),
+        'duration_seconds': round(max(0, total_samples - delay - padding) / sample_rate, 6)
+    })
+
+    if skipped_bytes:
+        index['errors'].append(f'{skipped_bytes} 字节无法解析为帧')
+    if truncated:
+        index['errors'].append('最后一帧不完整')
+    if info_tag and info_tag['frames'] is not None and info_tag['frames'] != len(offsets):
+        index['errors'].append(f"Info 标签声明 {info_tag['frames']} 帧，实际 {len(offsets)} 帧")
+    if not offsets:
+        index['errors'].append('没有音频帧')
+    index['valid'] = not index['errors']
+    return index
+
+def index_path_for(mp3_file: Path) -> Optional[Path]:
+    """
+    索引缓存路径：source/ 下的 MP3 使用同目录的隐藏文件；
+    其他位置（发布目录、临时目录）不写缓存文件，返回 None
+    """
+    path = Path(mp3_file).resolve()
+    if not path.is_relative_to(SOURCE_DIR.resolve()):
+        return None
+    return path.with_name(f'.{path.name}.idx.json')
+
+def is_current(index: Dict[str, Any], stat: os.stat_result) -> bool:
+    return index.get('index_version') == INDEX_VERSION and index.get('file_size') == stat.st_size \
+        and index.get('mtime_ns') == stat.st_mtime_ns
+
+def load_index(mp3_file: Path, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    读取帧索引：缓存与文件大小、修改时间一致时直接复用，否则重新扫描并写回缓存；
+    source/ 以外的文件只缓存在本进程内
+    """
+    cache_file = index_path_for(mp3_file)
+    stat = mp3_file.stat()
+    if use_cache and cache_file is None:
+        cached = _memory_indexes.get(str(Path(mp3_file).resolve()))
+        if cached is not None and is_current(cached, stat):
+            return cached
+    elif use_cache and cache_file.exists():
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if is_current(cached, stat):
+                return cached
+        except (OSError, ValueError):
+            pass
+
+    index = scan_mp3(mp3_file)
+    if cache_file is None:
+        _memory_indexes[str(Path(mp3_file).resolve())] = index
+        return index
+    try:
+        atomic_write_json(cache_file, index, indent=None)
+    except OSError:
+        # 只读目录下无法缓存，不影响结果
+        pass
+    return index
+
+def mp3_duration(mp3_file: Path) -> float:
+    """精确时长（秒），已扣除编码器延迟与填充"""
+    index = load_index(mp3_file)
+    if 'duration_seconds' not in index:
+        raise ValueError(f"无法解析 MP3: {mp3_file.name}: {'; '.join(index['errors'])}")
+    return index['duration_seconds']
+
+def frame_at(index: Dict[str, Any], seconds: float) -> Tuple[int, int]:
+    """定位包含指定时间点的帧，返回 (帧序号, 字节偏移)，用于精确跳转"""
+    sample = int(seconds * index['sample_rate']) + index.get('encoder_delay', 0)
+    frame = min(max(0, sample // index['samples_per_frame']), index['frames'] - 1)
+    return frame, index['offsets'][frame]
+
+def summarize(index: Dict[str, Any]) -> Dict[str, Any]:
+    """不含帧偏移的摘要，便于打印和写入日志"""
+    return {key: value for key, value in index.items() if key != 'offsets'}
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='MP3 帧索引与完整性检查')
+    parser.add_argument('files', nargs='+', type=Path)
+    parser.add_argument('--no-cache', action='store_true', help='忽略已缓存的索引，重新扫描')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出摘要')
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+    summaries = {}
+    invalid = 0
+    for mp3_file in args.files:
+        index = load_index(mp3_file, use_cache=not args.no_cache)
+        summaries[str(mp3_file)] = summarize(index)
+        if not index['valid']:
+            invalid += 1
+        if not args.json:
+            status = '✓' if index['valid'] else '✗'
+            print(f"{status} {mp3_file.name}: {index.get('duration_seconds', 0)} 秒, {index['frames']} 帧, "
+                  f"延迟 {index.get('encoder_delay', 0)}, 填充 {index.get('encoder_padding', 0)}"
+                  + (f" ({'; '.join(index['errors'])})" if index['errors'] else ''))
+
+    if args.json:
+        print(json.dumps(summaries, ensure_ascii=False, indent=2))
+    if invalid:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
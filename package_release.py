@@ -6,9 +6,20 @@
 
 import json
 import os
+import argparse
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from alignment import alignment_path_for
+import artifact_store
+from audio_store import link_or_copy
+from build_cache import BuildCache, atomic_write_json, atomic_write_text, compute_key, file_lock
+import instrumentation
+import m4b_builder
+from mp3_index import load_index
+from renditions import load_renditions, post_dirs, release_path
 
 # 路径配置
 PROJECT_ROOT = Path(__file__).parent
@@ -21,12 +32,37 @@ CHAPTERS_FILE = SOURCE_DIR / '01_extracted' / 'chapters.json'
 VOICE_MAPPING_FILE = SOURCE_DIR / '02_casting' / 'voice_mapping.json'
 SEGMENT_MANIFEST_FILE = SOURCE_DIR / '03_segmentation' / 'segment_manifest.json'
 PROCESSING_LOG_FILE = SOURCE_DIR / '05_post' / 'processing_log.json'
+POST_DIR = SOURCE_DIR / '05_post'
+CONFIG_FILE = PROJECT_ROOT / 'configs' / 'default_config.json'
+
+# 全书 M4B 与其中间文件（并行模式下各章节的 AAC）
+M4B_FILE = RELEASE_DIR / 'audio' / 'full_book.m4b'
+M4B_WORK_DIR = POST_DIR / 'm4b'
+
+# 发布产物格式版本，修改生成逻辑时递增以使缓存失效
+RELEASE_FORMAT_VERSION = 5
+
+# 发布目录的校验文件，不参与校验本身
+CHECKSUM_FILES = ('SHA256SUMS', 'manifest.json')
+CHECKSUM_JOBS = os.cpu_count() or 1
+# segment_manifest.json 中每次构建都会变化、不影响发布内容的字段
+MANIFEST_VOLATILE_FIELDS = ('creation_date', 'performance')
+
+# 逐章发布时串行更新 chapters.json / meta.json
+_release_lock = threading.Lock()
 
 def load_json(file_path: Path) -> Dict[str, Any]:
     """加载 JSON 文件"""
     with open(file_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+def load_source_json(file_path: Path) -> Dict[str, Any]:
+    """
+    加载源数据与上游阶段的产物：文件未变化时复用进程内已解析的对象（逐章发布、
+    videobook.py 在同一进程运行多个阶段时不重复解析），返回的对象不得原地修改
+    """
+    return artifact_store.load_json(file_path)
+
 def format_duration(seconds: float) -> str:
     """格式化时长为可读格式"""
     hours = int(seconds // 3600)
@@ -48,18 +84,127 @@ def get_audio_file_info(file_path: Path) -> Dict[str, Any]:
         'file_size_mb': round(stat.st_size / (1024 * 1024), 2)
     }
 
+def audio_duration(audio_file: Path) -> Optional[float]:
+    """从 MP3 帧索引读取精确时长，文件缺失或损坏时返回 None"""
+    if not audio_file.exists():
+        return None
+    index = load_index(audio_file)
+    if not index['valid']:
+        print(f"   ⚠️  {audio_file.name} 不完整: {'; '.join(index['errors'])}")
+        return None
+    return index['duration_seconds']
+
+def release_renditions() -> List[Dict[str, Any]]:
+    """配置中的输出版本，第一个为主版本（audio/chapters）"""
+    config = load_source_json(CONFIG_FILE) if CONFIG_FILE.exists() else {}
+    return load_renditions(config)
+
+def link_chapter_audio(source: Path, target: Path) -> str:
+    """链接章节音频，MP3 章节的对齐索引（.align.json）随音频一起放到同一目录"""
+    method = link_or_copy(source, target)
+    source_alignment = alignment_path_for(source)
+    if source_alignment.exists():
+        link_or_copy(source_alignment, alignment_path_for(target))
+    return method
+
+def assemble_audio_tree(chapter_ids: List[str]) -> Dict[str, int]:
+    """
+    由 05_post 的章节音频组装发布目录：主版本链接到 audio/chapters，
+    其他版本链接到 audio/<版本>/（只处理主版本已发布的章节），对齐索引随音频一起链接。
+    优先硬链接，跨文件系统时使用 reflink，最后才复制；已是最新的文件不做任何操作。
+    返回各方式的文件数
+    """
+    counts: Dict[str, int] = {}
+    renditions = release_renditions()
+    primary_dir = post_dirs(POST_DIR, renditions[0])['chapters']
+    for chapter_id in chapter_ids:
+        source = primary_dir / f'{chapter_id}.mp3'
+        if source.exists():
+            method = link_chapter_audio(source, AUDIO_DIR / f'{chapter_id}.mp3')
+            counts[method] = counts.get(method, 0) + 1
+
+    published = [cid for cid in chapter_ids if (AUDIO_DIR / f'{cid}.mp3').exists()]
+    for rendition in renditions[1:]:
+        source_dir = post_dirs(POST_DIR, rendition)['chapters']
+        for chapter_id in published:
+            source = source_dir / f"{chapter_id}.{rendition['extension']}"
+            if source.exists():
+                method = link_chapter_audio(source, RELEASE_DIR / release_path(rendition, chapter_id))
+                counts[method] = counts.get(method, 0) + 1
+    return counts
+
+def release_files() -> List[Path]:
+    """发布目录中参与校验的文件（不含校验文件本身、隐藏文件与逐章发布的锁文件）"""
+    return sorted(
+        path for path in RELEASE_DIR.rglob('*')
+        if path.is_file() and path.name not in CHECKSUM_FILES and path.suffix != '.lock'
+        and not any(part.startswith('.') for part in path.relative_to(RELEASE_DIR).parts)
+    )
+
+def write_checksums(build_cache: BuildCache) -> Dict[str, Any]:
+    """
+    并行计算发布文件的 SHA-256（按大小与修改时间复用构建缓存中的记录），
+    写入 sha256sum 格式的 SHA256SUMS 与 manifest.json；内容未变化时不重写
+    """
+    files = release_files()
+    hashes = build_cache.hash_files(files, CHECKSUM_JOBS)
+    entries = []
+    for path in files:
+        entries.append({
+            'path': path.relative_to(RELEASE_DIR).as_posix(),
+            'size_bytes': path.stat().st_size,
+            'sha256': hashes[path]
+        })
+
+    checksums = ''.join(f"{entry['sha256']}  {entry['path']}\n" for entry in entries)
+    manifest = {
+        'algorithm': 'sha256',
+        'total_files': len(entries),
+        'total_size_bytes': sum(entry['size_bytes'] for entry in entries),
+        'files': entries
+    }
+    checksums_file = RELEASE_DIR / 'SHA256SUMS'
+    manifest_file = RELEASE_DIR / 'manifest.json'
+    unchanged = checksums_file.exists() and checksums_file.read_text(encoding='utf-8') == checksums
+    if not unchanged or not manifest_file.exists():
+        atomic_write_text(checksums_file, checksums)
+        atomic_write_json(manifest_file, manifest)
+    return {'files': len(entries), 'total_size_bytes': manifest['total_size_bytes'], 'rewritten': not unchanged}
+
+def rendition_summary(chapter_ids: List[str]) -> List[Dict[str, Any]]:
+    """meta.json 中的版本列表：编码参数、发布目录、已发布章节数与总大小"""
+    summary = []
+    for rendition in release_renditions():
+        files = [RELEASE_DIR / release_path(rendition, cid) for cid in chapter_ids]
+        files = [path for path in files if path.exists()]
+        summary.append({
+            'name': rendition['name'],
+            'format': rendition['format'],
+            'codec': rendition['encoder'],
+            'bitrate': rendition['bitrate'],
+            'directory': str(Path(release_path(rendition, 'x')).parent),
+            'primary': rendition['primary'],
+            'chapters': len(files),
+            'total_size_mb': round(sum(path.stat().st_size for path in files) / (1024 * 1024), 2)
+        })
+    return summary
+
 def generate_meta_json() -> Dict[str, Any]:
     """生成 meta.json"""
     print("生成 meta.json...")
 
     # 加载源数据
-    chapters_data = load_json(CHAPTERS_FILE)
-    voice_mapping = load_json(VOICE_MAPPING_FILE)
-    segment_manifest = load_json(SEGMENT_MANIFEST_FILE)
-    processing_log = load_json(PROCESSING_LOG_FILE)
-
-    # 计算总时长
-    total_duration = segment_manifest['total_duration_seconds']
+    chapters_data = load_source_json(CHAPTERS_FILE)
+    voice_mapping = load_source_json(VOICE_MAPPING_FILE)
+    segment_manifest = load_source_json(SEGMENT_MANIFEST_FILE)
+
+    # 计算总时长：已发布章节使用实际时长，其余章节使用片段估算
+    durations = {
+        ch['chapter_id']: audio_duration(AUDIO_DIR / f"{ch['chapter_id']}.mp3")
+        for ch in chapters_data.get('chapters', [])
+    }
+    total_duration = book_duration(chapters_data, segment_manifest,
+                                   {cid: d for cid, d in durations.items() if d is not None})
 
     # 统计字数
     total_word_count = sum(ch.get('word_count', 0) for ch in chapters_data.get('chapters', []))
@@ -92,6 +237,10 @@ def generate_meta_json() -> Dict[str, Any]:
             'target_loudness_lufs': -18,
             'characters_count': len(voice_mapping.get('voice_assignments', {}))
         },
+        'release': release_progress(
+            sum(1 for ch in chapters_data.get('chapters', []) if (AUDIO_DIR / f"{ch['chapter_id']}.mp3").exists()),
+            chapters_data.get('total_chapters', 0)),
+        'renditions': rendition_summary([ch['chapter_id'] for ch in chapters_data.get('chapters', [])]),
         'characters': []
     }
 
@@ -110,53 +259,145 @@ def generate_meta_json() -> Dict[str, Any]:
 
     return meta
 
+def chapter_entry(chapter: Dict[str, Any], segment_manifest: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """生成 chapters.json 中单个章节的条目，章节音频尚未发布时返回 None"""
+    chapter_id = chapter['chapter_id']
+    chapter_number = chapter['chapter_number']
+    title = chapter.get('title', f'Chapter {chapter_number}')
+
+    # 获取音频文件信息
+    audio_file = AUDIO_DIR / f'{chapter_id}.mp3'
+    if not audio_file.exists():
+        return None
+    file_info = get_audio_file_info(audio_file)
+
+    # 时长：优先读取 MP3 帧索引的实际时长；无法解析时回退到按片段累加的估算，
+    # 旧清单再回退到片段数 × 平均时长
+    segment_count = segment_manifest['segments_by_chapter'].get(chapter_id, 0)
+    duration_by_chapter = segment_manifest.get('duration_by_chapter', {})
+    estimated_duration = audio_duration(audio_file)
+    if estimated_duration is not None:
+        duration_source = 'audio'
+    elif chapter_id in duration_by_chapter:
+        estimated_duration = duration_by_chapter[chapter_id]
+        duration_source = 'estimate'
+    else:
+        avg_duration = segment_manifest['total_duration_seconds'] / segment_manifest['total_segments']
+        estimated_duration = segment_count * avg_duration
+        duration_source = 'estimate'
+
+    renditions = {rendition['name']: release_path(rendition, chapter_id) for rendition in release_renditions()
+                  if (RELEASE_DIR / release_path(rendition, chapter_id)).exists()}
+
+    alignment_file = alignment_path_for(audio_file)
+
+    return {
+        'chapter_number': chapter_number,
+        'chapter_id': chapter_id,
+        'title': title,
+        'audio_file': f'audio/chapters/{chapter_id}.mp3',
+        'alignment_file': f'audio/chapters/{alignment_file.name}' if alignment_file.exists() else None,
+        'renditions': renditions,
+        'duration_seconds': round(estimated_duration, 2),
+        'duration_formatted': format_duration(estimated_duration),
+        'duration_source': duration_source,
+        'word_count': chapter.get('word_count', 0),
+        'file_size_mb': file_info['file_size_mb'],
+        'segment_count': segment_count
+    }
+
 def generate_chapters_json() -> Dict[str, Any]:
     """生成 chapters.json"""
     print("生成 chapters.json...")
 
-    chapters_data = load_json(CHAPTERS_FILE)
-    segment_manifest = load_json(SEGMENT_MANIFEST_FILE)
+    chapters_data = load_source_json(CHAPTERS_FILE)
+    segment_manifest = load_source_json(SEGMENT_MANIFEST_FILE)
 
     chapters_list = []
-
     for chapter in chapters_data.get('chapters', []):
-        chapter_id = chapter['chapter_id']
-        chapter_number = chapter['chapter_number']
-        title = chapter.get('title', f'Chapter {chapter_number}')
-
-        # 获取音频文件信息
-        audio_file = AUDIO_DIR / f'{chapter_id}.mp3'
-        if audio_file.exists():
-            file_info = get_audio_file_info(audio_file)
-
-            # 估算时长（基于片段数）
-            segment_count = segment_manifest['segments_by_chapter'].get(chapter_id, 0)
-            avg_duration = segment_manifest['total_duration_seconds'] / segment_manifest['total_segments']
-            estimated_duration = segment_count * avg_duration
-
-            chapters_list.append({
-                'chapter_number': chapter_number,
-                'chapter_id': chapter_id,
-                'title': title,
-                'audio_file': f'audio/chapters/{chapter_id}.mp3',
-                'duration_seconds': round(estimated_duration, 2),
-                'duration_formatted': format_duration(estimated_duration),
-                'word_count': chapter.get('word_count', 0),
-                'file_size_mb': file_info['file_size_mb'],
-                'segment_count': segment_count
-            })
+        with instrumentation.span(chapter.get('chapter_id', ''), 'chapter'):
+            entry = chapter_entry(chapter, segment_manifest)
+        if entry is not None:
+            chapters_list.append(entry)
 
     return {
         'total_chapters': len(chapters_list),
         'chapters': chapters_list
     }
 
-def generate_readme() -> str:
-    """生成 README.md"""
-    print("生成 README.md...")
+def book_duration(chapters_data: Dict[str, Any], segment_manifest: Dict[str, Any],
+                  actual: Dict[str, float]) -> float:
+    """全书时长：有实际时长的章节用实际值，其余按片段估算；旧清单缺少章节估算时退回清单总时长"""
+    estimates = segment_manifest.get('duration_by_chapter', {})
+    chapter_ids = [ch['chapter_id'] for ch in chapters_data.get('chapters', [])]
+    if chapter_ids and all(cid in actual for cid in chapter_ids):
+        return round(sum(actual[cid] for cid in chapter_ids), 2)
+    if not estimates:
+        return segment_manifest['total_duration_seconds']
+    return round(sum(actual.get(cid, estimates.get(cid, 0)) for cid in chapter_ids), 2)
+
+def release_progress(published: int, total: int) -> Dict[str, Any]:
+    return {
+        'published_chapters': published,
+        'total_chapters': total,
+        'complete': published >= total,
+        'updated': datetime.now().isoformat()
+    }
 
-    meta = load_json(RELEASE_DIR / 'meta.json')
-    chapters = load_json(RELEASE_DIR / 'chapters.json')
+def publish_chapter(chapter_id: str, chapter_file: Path,
+                    rendition_files: Optional[Dict[str, Path]] = None) -> Dict[str, Any]:
+    """
+    逐章发布：把合并好的章节音频（及其他版本）链接到发布目录，
+    只替换 chapters.json 中该章节的条目，并更新 meta.json 的总时长、版本与发布进度。
+    读取-修改-写入在线程锁与跨进程文件锁内完成，工作队列的多个 worker 同时发布时不会丢失条目
+    """
+    with _release_lock, file_lock(RELEASE_DIR / 'chapters.json'):
+        AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+        link_chapter_audio(chapter_file, AUDIO_DIR / f'{chapter_id}.mp3')
+        renditions = {rendition['name']: rendition for rendition in release_renditions()}
+        for name, path in (rendition_files or {}).items():
+            link_chapter_audio(path, RELEASE_DIR / release_path(renditions[name], chapter_id))
+
+        chapters_data = load_source_json(CHAPTERS_FILE)
+        segment_manifest = load_source_json(SEGMENT_MANIFEST_FILE)
+        chapter = next(ch for ch in chapters_data.get('chapters', []) if ch['chapter_id'] == chapter_id)
+        entry = chapter_entry(chapter, segment_manifest)
+
+        # 发布目录的 chapters.json / meta.json 在这里原地更新，读取新副本而不使用共享的缓存对象
+        chapters_file = RELEASE_DIR / 'chapters.json'
+        entries = load_json(chapters_file).get('chapters', []) if chapters_file.exists() else []
+        entries = [e for e in entries if e['chapter_id'] != chapter_id] + [entry]
+        entries.sort(key=lambda e: e['chapter_number'])
+        artifact_store.write_json(chapters_file, {'total_chapters': len(entries), 'chapters': entries})
+
+        meta_file = RELEASE_DIR / 'meta.json'
+        if meta_file.exists():
+            meta = load_json(meta_file)
+            actual = {e['chapter_id']: e['duration_seconds'] for e in entries if e.get('duration_source') == 'audio'}
+            total_duration = book_duration(chapters_data, segment_manifest, actual)
+            meta['audio']['total_duration_seconds'] = total_duration
+            meta['audio']['total_duration_formatted'] = format_duration(total_duration)
+            meta['release'] = release_progress(len(entries), chapters_data.get('total_chapters', 0))
+            meta['renditions'] = rendition_summary([ch['chapter_id'] for ch in chapters_data.get('chapters', [])])
+        else:
+            meta = generate_meta_json()
+        artifact_store.write_json(meta_file, meta)
+
+        return entry
+
+def format_renditions(renditions: List[Dict[str, Any]]) -> str:
+    """README 中的版本列表，只有主版本时不输出"""
+    if len(renditions) <= 1:
+        return ''
+    lines = ['', '### 其他版本', '']
+    for rendition in renditions[1:]:
+        lines.append(f"- **{rendition['name']}**: {rendition['format']} {rendition['bitrate']}, "
+                     f"`{rendition['directory']}/` ({rendition['chapters']} 章, {rendition['total_size_mb']} MB)")
+    return '\n'.join(lines) + '\n'
+
+def generate_readme(meta: Dict[str, Any], chapters: Dict[str, Any]) -> str:
+    """由内存中的 meta.json / chapters.json 内容生成 README.md"""
+    print("生成 README.md...")
 
     readme = f"""# 有声书发布
 
@@ -173,7 +414,7 @@ def generate_readme() -> str:
 - **采样率**: {meta['audio']['sample_rate']}
 - **响度**: {meta['audio']['loudness_lufs']} LUFS (播客标准)
 - **真峰值**: {meta['audio']['true_peak_dbtp']} dBTP
-
+{format_renditions(meta.get('renditions', []))}
 ## 内容
 
 ### 章节列表
@@ -267,32 +508,114 @@ release/
 
     return readme
 
-def main():
+def manifest_content_key() -> str:
+    """
+    segment_manifest.json 的内容键：不含每次构建都会更新的生成时间与性能统计，
+    片段未变化的重新构建不会使发布元数据失效
+    """
+    manifest = load_source_json(SEGMENT_MANIFEST_FILE)
+    content = {key: value for key, value in manifest.items() if key not in MANIFEST_VOLATILE_FIELDS}
+    return compute_key([], content)
+
+def release_cache_key(build_cache: BuildCache) -> str:
+    """发布元数据的缓存键：源数据文件、章节音频与对齐索引的内容哈希"""
+    labeled = [(path.name, path) for path in (CHAPTERS_FILE, VOICE_MAPPING_FILE)]
+    labeled += [(audio_file.name, audio_file) for audio_file in sorted(AUDIO_DIR.glob('*.mp3'))]
+    # chapters.json 的 alignment_file 取决于对齐索引是否存在
+    labeled += [(align_file.name, align_file) for align_file in sorted(AUDIO_DIR.glob('*.align.json'))]
+    for rendition in release_renditions()[1:]:
+        rendition_dir = RELEASE_DIR / Path(release_path(rendition, 'x')).parent
+        labeled += [(f"{rendition['name']}/{audio_file.name}", audio_file)
+                    for audio_file in sorted(rendition_dir.glob(f"*.{rendition['extension']}"))]
+        labeled += [(f"{rendition['name']}/{align_file.name}", align_file)
+                    for align_file in sorted(rendition_dir.glob('*.align.json'))]
+    hashes = build_cache.hash_files([path for _, path in labeled], CHECKSUM_JOBS)
+    inputs = [f'{label}:{hashes[path]}' for label, path in labeled]
+    inputs.append(f'{SEGMENT_MANIFEST_FILE.name}:{manifest_content_key()}')
+    return compute_key(inputs, {'release_format_version': RELEASE_FORMAT_VERSION})
+
+def build_release_m4b(build_cache: BuildCache, meta: Dict[str, Any], jobs: int, force: bool) -> Dict[str, Any]:
+    """由 chapters.json 中已发布的章节生成全书 M4B（章节标题与顺序取自 chapters.json）"""
+    entries = load_source_json(RELEASE_DIR / 'chapters.json').get('chapters', [])
+    chapters = [{'title': entry['title'], 'path': RELEASE_DIR / entry['audio_file']} for entry in entries]
+    book_title = load_source_json(CHAPTERS_FILE).get('novel_title') or meta['project']['name']
+    return m4b_builder.build_m4b(chapters, meta, book_title, M4B_FILE, M4B_WORK_DIR, build_cache, jobs, force)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='打包发布')
+    parser.add_argument('--force', action='store_true',
+                        help='忽略构建缓存，重新生成所有发布元数据')
+    parser.add_argument('--m4b', action='store_true',
+                        help='同时生成带章节标记的全书 M4B（audio/full_book.m4b）')
+    parser.add_argument('--m4b-jobs', type=int, default=1,
+                        help='M4B 编码并行数：1 为整本书单遍编码，大于 1 时各章节并行编码后封装（默认 1）')
+    instrumentation.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """主函数"""
+    args = parse_args(argv)
+
     print("=" * 60)
     print("打包发布")
     print("=" * 60)
 
-    # 生成 meta.json
-    print("\n1. 生成元数据...")
-    meta = generate_meta_json()
-    with open(RELEASE_DIR / 'meta.json', 'w', encoding='utf-8') as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
-    print("   ✓ meta.json 已生成")
-
-    # 生成 chapters.json
-    print("\n2. 生成章节信息...")
-    chapters = generate_chapters_json()
-    with open(RELEASE_DIR / 'chapters.json', 'w', encoding='utf-8') as f:
-        json.dump(chapters, f, ensure_ascii=False, indent=2)
-    print("   ✓ chapters.json 已生成")
-
-    # 生成 README.md
-    print("\n3. 生成文档...")
-    readme = generate_readme()
-    with open(RELEASE_DIR / 'README.md', 'w', encoding='utf-8') as f:
-        f.write(readme)
-    print("   ✓ README.md 已生成")
+    # 章节音频由后处理输出到 05_post（其他版本在 05_post/<版本>/chapters），链接到发布目录
+    chapter_ids = [ch['chapter_id'] for ch in load_source_json(CHAPTERS_FILE).get('chapters', [])]
+    with instrumentation.span('audio_tree'):
+        linked = assemble_audio_tree(chapter_ids)
+    labels = {'existing': '已是最新', 'hardlink': '硬链接', 'reflink': 'reflink', 'copy': '复制'}
+    if linked:
+        print("\n音频目录: " + ', '.join(f"{labels[method]} {count} 个" for method, count in linked.items()))
+
+    build_cache = BuildCache()
+    with instrumentation.span('cache_key'):
+        release_key = release_cache_key(build_cache)
+    outputs = [RELEASE_DIR / 'meta.json', RELEASE_DIR / 'chapters.json', RELEASE_DIR / 'README.md']
+
+    if not args.force and all(build_cache.is_fresh(path, release_key) for path in outputs):
+        print("\n源数据与章节音频均未变化，跳过元数据生成")
+        meta = load_source_json(RELEASE_DIR / 'meta.json')
+    else:
+        # 生成 meta.json
+        print("\n1. 生成元数据...")
+        with instrumentation.span('meta'):
+            meta = generate_meta_json()
+            artifact_store.write_json(RELEASE_DIR / 'meta.json', meta)
+        print("   ✓ meta.json 已生成")
+
+        # 生成 chapters.json
+        print("\n2. 生成章节信息...")
+        with instrumentation.span('chapters'):
+            chapters = generate_chapters_json()
+            artifact_store.write_json(RELEASE_DIR / 'chapters.json', chapters)
+        print("   ✓ chapters.json 已生成")
+
+        # 生成 README.md
+        print("\n3. 生成文档...")
+        with instrumentation.span('readme'):
+            readme = generate_readme(meta, chapters)
+            atomic_write_text(RELEASE_DIR / 'README.md', readme)
+        print("   ✓ README.md 已生成")
+
+        for path in outputs:
+            build_cache.record(path, release_key)
+
+    m4b = None
+    if args.m4b:
+        print("\n生成 M4B...")
+        with instrumentation.span('m4b'):
+            m4b = build_release_m4b(build_cache, meta, args.m4b_jobs, args.force)
+        status = '未变化，跳过' if m4b.get('skipped') else f"✓ 已生成（{m4b['mode']}，编码 {m4b['encoded_parts']} 个章节）"
+        print(f"   {status}: {m4b['chapters']} 个章节标记, {m4b['file_size_mb']} MB")
+
+    # 校验文件：未变化的文件复用缓存的哈希
+    with instrumentation.span('checksums'):
+        checksums = write_checksums(build_cache)
+    if build_cache.dirty:
+        build_cache.save()
+    print(f"\n{'已更新' if checksums['rewritten'] else '未变化'}: SHA256SUMS, manifest.json ({checksums['files']} 个文件)")
 
     # 验证
     print("\n4. 验证发布包...")
@@ -301,6 +624,10 @@ def main():
 
     total_size = sum(f.stat().st_size for f in audio_files)
     print(f"   ✓ 总大小: {round(total_size / (1024 * 1024), 2)} MB")
+    for rendition in meta.get('renditions', [])[1:]:
+        print(f"   ✓ {rendition['name']}: {rendition['chapters']} 个, {rendition['total_size_mb']} MB")
+    if m4b:
+        print(f"   ✓ M4B: {M4B_FILE.relative_to(RELEASE_DIR)}, {format_duration(m4b['duration_seconds'])}")
 
     # 报告
     print("\n" + "=" * 60)
@@ -310,6 +637,11 @@ def main():
     print(f"章节数: {len(audio_files)}")
     print(f"总大小: {round(total_size / (1024 * 1024), 2)} MB")
     print(f"总时长: {meta['audio']['total_duration_formatted']}")
+    print()
+    for line in instrumentation.format_summary(instrumentation.summary()):
+        print(line)
+    for path in instrumentation.export(args, 'package_release'):
+        print(f"   - 已导出: {path}")
     print("\n发布包已准备就绪，可以分发！")
 
 if __name__ == "__main__":
@@ -5,13 +5,29 @@
 """
 
 import os
+import re
 import json
+import time
+import argparse
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import logging
 
+import artifact_store
+from build_cache import BuildCache, atomic_output, atomic_write_json, compute_key, file_lock
+from segment_catalog import open_segments
+from mp3_index import load_index, mp3_duration
+from chapter_assembler import IncompatibleStreams, assemble_chapter
+import instrumentation
+from renditions import encoder_args, load_renditions
+from file_watcher import Debouncer, open_watcher
+from scene_index import SceneIndex
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -25,8 +41,11 @@ INPUT_DIR = PROJECT_ROOT / 'source' / '04_tts_raw'
 OUTPUT_SEGMENTS_DIR = PROJECT_ROOT / 'source' / '05_post' / 'segments'
 OUTPUT_CHAPTERS_DIR = PROJECT_ROOT / 'source' / '05_post' / 'chapters'
 SEGMENTS_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'tts_segments.json'
+CATALOG_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'tts_segments.db'
+SCENES_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'scenes.json'
 CONFIG_FILE = PROJECT_ROOT / 'configs' / 'default_config.json'
 LOG_FILE = PROJECT_ROOT / 'source' / '05_post' / 'processing_log.json'
+LOUDNESS_CACHE_FILE = PROJECT_ROOT / 'source' / '05_post' / 'loudness_cache.json'
 
 # 音频处理参数
 SILENCE_START_MS = 200
@@ -34,47 +53,214 @@ SILENCE_END_MS = 300
 TARGET_LUFS = -18
 TRUE_PEAK_DBTP = -1.0
 MP3_BITRATE = '192k'
+# 输出版本（见 renditions.py），启动时从配置读取；默认只有主版本
+RENDITIONS = load_renditions({})
+LOUDNESS_RANGE_LU = 11
+
+# 响度标准化模式
+# gain: 按缓存的测量值施加线性增益（最快）
+# linear: 使用测量值的线性模式 loudnorm
+# dynamic: 原始单遍动态 loudnorm
+LOUDNORM_MODES = ('gain', 'linear', 'dynamic')
+LOUDNORM_MODE = 'gain'
+SILENCE_FLOOR_LUFS = -70.0  # 低于此值视为静音，不施加增益
+
+# 处理后端
+# ffmpeg: 每个片段一次 ffmpeg 滤镜图（loudnorm 测量缓存 + 增益）
+# numpy: 进程内测量与增益/限制（dsp.py），ffmpeg 只负责编码
+AUDIO_BACKENDS = ('ffmpeg', 'numpy')
+AUDIO_BACKEND = 'ffmpeg'
+
+# 并发参数
+MEMORY_PER_JOB_MB = 256  # 单个 ffmpeg 进程预估内存占用
+MERGE_JOBS = 2  # 章节合并只涉及文件 I/O，使用独立的小线程池，不排在片段任务之后
+SCENE_JOBS = 4  # 每个章节任务内并行合并的场景数
+BATCH_TIMEOUT_PER_SEGMENT = 20  # 批量编码的超时按片段数累加（秒）
+WATCH_TICK_SECONDS = 0.5  # 监视模式检查文件事件与任务完成的间隔
 
 def load_config() -> Dict[str, Any]:
     """加载配置文件"""
-    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return artifact_store.load_json(CONFIG_FILE)
 
-def load_segments() -> Dict[str, Any]:
-    """加载片段元数据"""
-    with open(SEGMENTS_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def process_segment(input_file: Path, output_file: Path) -> Dict[str, Any]:
-    """处理单个音频片段"""
+def load_segments(chapter_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """加载片段索引（segment_id / chapter_id），指定章节时只读取这些章节"""
+    source = open_segments(CATALOG_FILE, SEGMENTS_FILE)
     try:
-        # 构建 ffmpeg 命令：添加静音 + 标准化响度 + 编码为 MP3
-        cmd = [
-            'ffmpeg',
-            '-i', str(input_file),
-            '-af', f'adelay={SILENCE_START_MS}|{SILENCE_START_MS},apad=pad_dur={SILENCE_END_MS}ms,loudnorm=I={TARGET_LUFS}:TP={TRUE_PEAK_DBTP}:LRA=11',
-            '-codec:a', 'libmp3lame',
-            '-b:a', MP3_BITRATE,
-            '-ac', '1',  # mono
-            '-y',  # 覆盖已存在的文件
-            str(output_file)
-        ]
+        if not chapter_ids:
+            return list(source.iter_index())
+        return [seg for chapter_id in chapter_ids for seg in source.iter_index(chapter_id)]
+    finally:
+        source.close()
+
+class LoudnessCache:
+    """响度测量缓存：以原始 WAV 内容哈希为键，持久化到磁盘"""
+
+    def __init__(self, cache_file: Path):
+        self.cache_file = cache_file
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if cache_file.exists():
+            try:
+                self.entries = self._read()
+            except (OSError, ValueError):
+                logger.warning(f"响度缓存损坏，已忽略: {cache_file}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, key: str, measurement: Dict[str, Any]) -> None:
+        with self._lock:
+            self.entries[key] = measurement
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        with open(self.cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get('entries', {})
+
+    def save(self, merge: bool = False) -> None:
+        """原子写入，避免中断时损坏缓存；merge 时在文件锁内与磁盘上的条目合并（多进程共享）"""
+        if not merge:
+            with self._lock:
+                data = {'updated': datetime.now().isoformat(), 'entries': dict(self.entries)}
+            atomic_write_json(self.cache_file, data)
+            return
+
+        with file_lock(self.cache_file):
+            try:
+                entries = self._read() if self.cache_file.exists() else {}
+            except (OSError, ValueError):
+                entries = {}
+            with self._lock:
+                entries.update(self.entries)
+                self.entries = entries
+                data = {'updated': datetime.now().isoformat(), 'entries': dict(entries)}
+            atomic_write_json(self.cache_file, data)
 
-        # 执行命令
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=60
+def measure_loudness(input_file: Path) -> Dict[str, Any]:
+    """第一遍：测量原始音频的积分响度、响度范围和真峰值"""
+    cmd = [
+        'ffmpeg',
+        '-hide_banner', '-nostats',
+        '-i', str(input_file),
+        '-af', f'loudnorm=I={TARGET_LUFS}:TP={TRUE_PEAK_DBTP}:LRA={LOUDNESS_RANGE_LU}:print_format=json',
+        '-f', 'null',
+        '-'
+    ]
+    result = instrumentation.run(cmd, capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError(f"响度测量失败: {result.stderr}")
+
+    # loudnorm 的 JSON 输出位于 stderr 末尾
+    match = re.search(r'\{[^{}]*"input_i"[^{}]*\}', result.stderr)
+    if not match:
+        raise RuntimeError(f"无法解析响度测量结果: {input_file.name}")
+    stats = json.loads(match.group(0))
+
+    return {
+        'input_i': float(stats['input_i']),
+        'input_tp': float(stats['input_tp']),
+        'input_lra': float(stats['input_lra']),
+        'input_thresh': float(stats['input_thresh'])
+    }
+
+def get_loudness(input_file: Path, cache: LoudnessCache, key: str) -> Dict[str, Any]:
+    """读取缓存的响度测量值（以 WAV 内容哈希为键），未命中时测量并写入缓存"""
+    measurement = cache.get(key)
+    if measurement is None:
+        with instrumentation.span(input_file.stem, 'loudness'):
+            measurement = measure_loudness(input_file)
+        cache.put(key, measurement)
+    return measurement
+
+def build_loudness_filter(measurement: Optional[Dict[str, Any]]) -> str:
+    """根据响度模式和测量值构建响度滤镜"""
+    if LOUDNORM_MODE == 'dynamic' or measurement is None:
+        return f'loudnorm=I={TARGET_LUFS}:TP={TRUE_PEAK_DBTP}:LRA={LOUDNESS_RANGE_LU}'
+
+    if LOUDNORM_MODE == 'linear':
+        return (
+            f'loudnorm=I={TARGET_LUFS}:TP={TRUE_PEAK_DBTP}:LRA={LOUDNESS_RANGE_LU}'
+            f":measured_I={measurement['input_i']}:measured_TP={measurement['input_tp']}"
+            f":measured_LRA={measurement['input_lra']}:measured_thresh={measurement['input_thresh']}"
+            ':linear=true'
         )
 
-        if result.returncode != 0:
-            logger.error(f"处理失败: {input_file.name}")
-            logger.error(result.stderr)
-            return {
-                'success': False,
-                'error': result.stderr
-            }
+    return f'volume={calculate_gain_db(measurement)}dB'
+
+def calculate_gain_db(measurement: Dict[str, Any]) -> float:
+    """计算线性增益：达到目标响度，同时保证真峰值不超过上限"""
+    if measurement['input_i'] <= SILENCE_FLOOR_LUFS:
+        return 0.0
+    gain = TARGET_LUFS - measurement['input_i']
+    gain = min(gain, TRUE_PEAK_DBTP - measurement['input_tp'])
+    return round(gain, 2)
+
+def segment_params() -> Dict[str, Any]:
+    """影响片段输出的全部处理参数，参与缓存键计算"""
+    return {
+        'silence_start_ms': SILENCE_START_MS,
+        'silence_end_ms': SILENCE_END_MS,
+        'target_lufs': TARGET_LUFS,
+        'true_peak_dbtp': TRUE_PEAK_DBTP,
+        'loudness_range_lu': LOUDNESS_RANGE_LU,
+        'loudnorm_mode': LOUDNORM_MODE,
+        'backend': AUDIO_BACKEND,
+        'mp3_bitrate': MP3_BITRATE,
+        'channels': 1
+    }
+
+def process_segment(input_file: Path, output_file: Path, loudness: Optional[Dict[str, Any]] = None,
+                    extra_outputs: Optional[List[Tuple[Path, List[str]]]] = None) -> Dict[str, Any]:
+    """
+    处理单个音频片段。
+    extra_outputs 为其他版本的 (输出文件, 编码参数)，经 asplit 与主版本共用一次解码和响度处理
+    """
+    try:
+        # 先写入临时文件，成功后原子重命名，避免留下半写的 MP3
+        with ExitStack() as stack:
+            tmp_file = stack.enter_context(atomic_output(output_file))
+            chain = f'adelay={SILENCE_START_MS}|{SILENCE_START_MS},apad=pad_dur={SILENCE_END_MS}ms,{build_loudness_filter(loudness)}'
+            if not extra_outputs:
+                # 构建 ffmpeg 命令：添加静音 + 标准化响度 + 编码为 MP3
+                cmd = [
+                    'ffmpeg',
+                    '-i', str(input_file),
+                    '-af', chain,
+                    '-codec:a', 'libmp3lame',
+                    '-b:a', MP3_BITRATE,
+                    '-ac', '1',  # mono
+                    '-y',  # 覆盖已存在的文件
+                    str(tmp_file)
+                ]
+            else:
+                labels = ''.join(f'[o{i}]' for i in range(len(extra_outputs) + 1))
+                cmd = [
+                    'ffmpeg',
+                    '-i', str(input_file),
+                    '-filter_complex', f'[0:a]{chain},asplit={len(extra_outputs) + 1}{labels}',
+                    '-map', '[o0]', '-codec:a', 'libmp3lame', '-b:a', MP3_BITRATE, '-ac', '1', '-y', str(tmp_file)
+                ]
+                for i, (extra_file, extra_args) in enumerate(extra_outputs, 1):
+                    extra_tmp = stack.enter_context(atomic_output(extra_file))
+                    cmd += ['-map', f'[o{i}]', *extra_args, '-y', str(extra_tmp)]
+
+            # 执行命令
+            result = instrumentation.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=60
+            )
+
+            if result.returncode != 0:
+                raise subprocess.CalledProcessError(result.returncode, cmd, stderr=result.stderr)
 
         # 获取输出文件信息
         file_size = output_file.stat().st_size
@@ -84,9 +270,14 @@ def process_segment(input_file: Path, output_file: Path) -> Dict[str, Any]:
             'input_file': str(input_file),
             'output_file': str(output_file),
             'file_size_bytes': file_size,
-            'file_size_mb': round(file_size / (1024 * 1024), 2)
+            'file_size_mb': round(file_size / (1024 * 1024), 2),
+            'loudnorm_mode': LOUDNORM_MODE
         }
 
+    except subprocess.CalledProcessError as e:
+        logger.error(f"处理失败: {input_file.name}")
+        logger.error(e.stderr)
+        return {'success': False, 'error': e.stderr}
     except subprocess.TimeoutExpired:
         logger.error(f"处理超时: {input_file.name}")
         return {'success': False, 'error': 'Timeout'}
@@ -94,153 +285,999 @@ def process_segment(input_file: Path, output_file: Path) -> Dict[str, Any]:
         logger.error(f"处理错误: {input_file.name} - {str(e)}")
         return {'success': False, 'error': str(e)}
 
-def merge_chapter(chapter_id: str, segment_ids: List[str]) -> Dict[str, Any]:
-    """合并片段为章节文件"""
+def default_jobs() -> int:
+    """根据 CPU 核数与可用内存计算默认并发数"""
+    cpu_count = os.cpu_count() or 1
+    try:
+        available_mb = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return cpu_count
+    return max(1, min(cpu_count, available_mb // MEMORY_PER_JOB_MB))
+
+def segment_file(segment_id: str, rendition: Optional[Dict[str, Any]] = None) -> Path:
+    """片段在某个版本下的输出路径，默认为主版本"""
+    if rendition is None or rendition['primary']:
+        return OUTPUT_SEGMENTS_DIR / f'{segment_id}.mp3'
+    return OUTPUT_SEGMENTS_DIR.parent / rendition['name'] / 'segments' / f"{segment_id}.{rendition['extension']}"
+
+def chapter_file(chapter_id: str, rendition: Optional[Dict[str, Any]] = None) -> Path:
+    """章节在某个版本下的输出路径，默认为主版本"""
+    if rendition is None or rendition['primary']:
+        return OUTPUT_CHAPTERS_DIR / f'{chapter_id}.mp3'
+    return OUTPUT_CHAPTERS_DIR.parent / rendition['name'] / 'chapters' / f"{chapter_id}.{rendition['extension']}"
+
+def scene_file(scene_id: str, rendition: Optional[Dict[str, Any]] = None) -> Path:
+    """场景在某个版本下的输出路径（章节拼接的中间产物），默认为主版本"""
+    if rendition is None or rendition['primary']:
+        return OUTPUT_CHAPTERS_DIR.parent / 'scenes' / f'{scene_id}.mp3'
+    return OUTPUT_CHAPTERS_DIR.parent / rendition['name'] / 'scenes' / f"{scene_id}.{rendition['extension']}"
+
+def rendition_params(rendition: Dict[str, Any]) -> Dict[str, Any]:
+    """版本输出的缓存参数；主版本与未引入多版本前保持一致，已有缓存继续有效"""
+    if rendition['primary']:
+        return segment_params()
+    return {**segment_params(), 'rendition': {k: rendition[k] for k in ('name', 'codec', 'bitrate')}}
+
+def validate_output(rendition: Dict[str, Any], output_file: Path) -> Optional[str]:
+    """校验编码输出：MP3 检查帧结构，其他格式只检查非空，返回错误描述"""
+    if rendition['codec'] == 'mp3':
+        index = load_index(output_file)
+        return None if index['valid'] else f"输出 MP3 不完整: {'; '.join(index['errors'])}"
+    if not output_file.exists() or output_file.stat().st_size == 0:
+        return f"输出为空: {output_file.name}"
+    return None
+
+def run_segment_job(segment: Dict[str, Any], loudness_cache: LoudnessCache,
+                    build_cache: BuildCache, force: bool = False) -> Dict[str, Any]:
+    """在工作线程中处理单个片段，异常只影响该片段；耗时与 ffmpeg 资源占用记录为 segment span"""
+    with instrumentation.span(segment['segment_id'], 'segment', chapter_id=segment['chapter_id']) as attrs:
+        job = segment_job(segment, loudness_cache, build_cache, force)
+        attrs['status'] = job['status']
+    return job
+
+def segment_job(segment: Dict[str, Any], loudness_cache: LoudnessCache,
+                build_cache: BuildCache, force: bool) -> Dict[str, Any]:
+    """处理单个片段：跳过未变化的片段，否则编码所有版本并校验输出"""
+    segment_id = segment['segment_id']
+    input_file = INPUT_DIR / f'{segment_id}.wav'
+    output_file = segment_file(segment_id)
+
+    if not input_file.exists():
+        # 没有原始音频时保留已有产物
+        if output_file.exists():
+            return {'segment_id': segment_id, 'status': 'skipped'}
+        return {'segment_id': segment_id, 'status': 'failed', 'error': '输入文件不存在'}
+
+    try:
+        # 输入内容与处理参数均未变化时跳过；任一版本过期时所有版本从同一次解码重新编码
+        input_hash = build_cache.file_hash(input_file)
+        keys = [compute_key([input_hash], rendition_params(rendition)) for rendition in RENDITIONS]
+        if not force and all(build_cache.is_fresh(segment_file(segment_id, rendition), key)
+                             for rendition, key in zip(RENDITIONS, keys)):
+            return {'segment_id': segment_id, 'status': 'skipped'}
+
+        extras = [(segment_file(segment_id, rendition), encoder_args(rendition)) for rendition in RENDITIONS[1:]]
+        if AUDIO_BACKEND == 'numpy':
+            # 测量与增益在同一次读取中完成，不需要响度缓存
+            import dsp
+            with instrumentation.span(segment_id, 'encode'):
+                result = dsp.process_segment(input_file, output_file, SILENCE_START_MS, SILENCE_END_MS,
+                                             TARGET_LUFS, TRUE_PEAK_DBTP, MP3_BITRATE, extras)
+        else:
+            loudness = None
+            if LOUDNORM_MODE != 'dynamic':
+                loudness = get_loudness(input_file, loudness_cache, input_hash)
+            with instrumentation.span(segment_id, 'encode'):
+                result = process_segment(input_file, output_file, loudness, extras)
+        if result['success']:
+            # 编码完成后建立帧索引：校验输出完整，并缓存供合并与发布使用
+            with instrumentation.span(segment_id, 'index'):
+                errors = [error for error in (validate_output(rendition, segment_file(segment_id, rendition))
+                                              for rendition in RENDITIONS) if error]
+                if not errors:
+                    result['duration_seconds'] = load_index(output_file)['duration_seconds']
+            if errors:
+                result = {'success': False, 'error': '; '.join(errors)}
+            else:
+                for rendition, key in zip(RENDITIONS, keys):
+                    build_cache.record(segment_file(segment_id, rendition), key, input_sha256=input_hash)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+
+    if result['success']:
+        return {'segment_id': segment_id, 'status': 'processed', 'result': result}
+    return {'segment_id': segment_id, 'status': 'failed', 'error': result.get('error', '')}
+
+def build_batch_filter(entries: List[Dict[str, Any]], with_chapter: bool) -> str:
+    """
+    构建整章的滤镜图：每个输入独立添加静音与响度处理，
+    需要重新编码的片段经 asplit 同时送往各版本的片段输出和章节拼接
+    """
+    count = len(RENDITIONS)
+    chains = []
+    for i, entry in enumerate(entries):
+        outputs = []
+        if entry['stale']:
+            outputs += [f'[s{i}_{r}]' for r in range(count)]
+        if with_chapter:
+            outputs += [f'[c{i}_{r}]' for r in range(count)]
+        chain = (f'[{i}:a]adelay={SILENCE_START_MS}|{SILENCE_START_MS},apad=pad_dur={SILENCE_END_MS}ms,'
+                 f"{build_loudness_filter(entry['loudness'])},aformat=channel_layouts=mono")
+        chains.append(chain + (f",asplit={len(outputs)}{''.join(outputs)}" if len(outputs) > 1 else outputs[0]))
+    if with_chapter:
+        for r in range(count):
+            labels = ''.join(f'[c{i}_{r}]' for i in range(len(entries)))
+            chains.append(f'{labels}concat=n={len(entries)}:v=0:a=1[chapter_{r}]')
+    return ';'.join(chains)
+
+def encode_chapter_batch(chapter_id: str, entries: List[Dict[str, Any]], with_chapter: bool) -> None:
+    """一个 ffmpeg 进程解码整章的原始 WAV，输出需要更新的片段，以及（可选）章节文件，覆盖所有版本"""
+    with ExitStack() as stack:
+        cmd = ['ffmpeg', '-hide_banner', '-nostats']
+        for entry in entries:
+            cmd += ['-i', str(entry['input_file'])]
+        cmd += ['-filter_complex', build_batch_filter(entries, with_chapter)]
+        for i, entry in enumerate(entries):
+            if entry['stale']:
+                for r, rendition in enumerate(RENDITIONS):
+                    tmp_file = stack.enter_context(atomic_output(segment_file(entry['segment_id'], rendition)))
+                    cmd += ['-map', f'[s{i}_{r}]', *encoder_args(rendition), '-y', str(tmp_file)]
+        if with_chapter:
+            for r, rendition in enumerate(RENDITIONS):
+                tmp_file = stack.enter_context(atomic_output(chapter_file(chapter_id, rendition)))
+                cmd += ['-map', f'[chapter_{r}]', *encoder_args(rendition), '-y', str(tmp_file)]
+
+        result = instrumentation.run(cmd, capture_output=True, text=True,
+                                     timeout=60 + BATCH_TIMEOUT_PER_SEGMENT * len(entries) * len(RENDITIONS))
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd, stderr=result.stderr)
+
+def run_chapter_batch_job(chapter_id: str, segments: List[Dict[str, Any]], loudness_cache: LoudnessCache,
+                          build_cache: BuildCache, force: bool = False) -> List[Dict[str, Any]]:
+    """
+    批量模式下在工作线程中处理一章：跳过未变化的片段，其余片段与章节文件由同一个 ffmpeg 输出。
+    缺少部分原始 WAV 时只输出片段，章节仍按帧拼接；批量编码失败时回退到逐片段处理
+    """
+    jobs = []
+    entries = []
+    all_inputs = True
+    for segment in segments:
+        segment_id = segment['segment_id']
+        input_file = INPUT_DIR / f'{segment_id}.wav'
+        if not input_file.exists():
+            all_inputs = False
+            if segment_file(segment_id).exists():
+                jobs.append({'segment_id': segment_id, 'status': 'skipped'})
+            else:
+                jobs.append({'segment_id': segment_id, 'status': 'failed', 'error': '输入文件不存在'})
+            continue
+        input_hash = build_cache.file_hash(input_file)
+        keys = [compute_key([input_hash], rendition_params(rendition)) for rendition in RENDITIONS]
+        entries.append({
+            'segment': segment,
+            'segment_id': segment_id,
+            'input_file': input_file,
+            'input_hash': input_hash,
+            'keys': keys,
+            'stale': force or not all(build_cache.is_fresh(segment_file(segment_id, rendition), key)
+                                      for rendition, key in zip(RENDITIONS, keys))
+        })
+
+    stale = [entry for entry in entries if entry['stale']]
+    jobs.extend({'segment_id': entry['segment_id'], 'status': 'skipped'} for entry in entries if not entry['stale'])
+    if not stale:
+        return jobs
+
+    with_chapter = all_inputs
+    used = entries if with_chapter else stale
+    try:
+        for entry in used:
+            entry['loudness'] = None
+            if LOUDNORM_MODE != 'dynamic':
+                entry['loudness'] = get_loudness(entry['input_file'], loudness_cache, entry['input_hash'])
+        with instrumentation.span(chapter_id, 'chapter_batch', segments=len(used), with_chapter=with_chapter):
+            encode_chapter_batch(chapter_id, used, with_chapter)
+    except Exception as e:
+        error = e.stderr if isinstance(e, subprocess.CalledProcessError) else str(e)
+        logger.warning(f"   {chapter_id}: 批量编码失败，改为逐片段处理 - {(error or '').strip()[-200:]}")
+        return jobs + [run_segment_job(entry['segment'], loudness_cache, build_cache, force) for entry in stale]
+
+    all_valid = True
+    for entry in stale:
+        segment_id = entry['segment_id']
+        output_file = segment_file(segment_id)
+        errors = [error for error in (validate_output(rendition, segment_file(segment_id, rendition))
+                                      for rendition in RENDITIONS) if error]
+        if errors:
+            all_valid = False
+            jobs.append({'segment_id': segment_id, 'status': 'failed', 'error': '; '.join(errors)})
+            continue
+        for rendition, key in zip(RENDITIONS, entry['keys']):
+            build_cache.record(segment_file(segment_id, rendition), key, input_sha256=entry['input_hash'])
+        file_size = output_file.stat().st_size
+        jobs.append({'segment_id': segment_id, 'status': 'processed', 'result': {
+            'success': True,
+            'input_file': str(entry['input_file']),
+            'output_file': str(output_file),
+            'file_size_bytes': file_size,
+            'file_size_mb': round(file_size / (1024 * 1024), 2),
+            'loudnorm_mode': LOUDNORM_MODE,
+            'duration_seconds': load_index(output_file)['duration_seconds'],
+            'batch': True
+        }})
+
+    # 章节文件与片段来自同一次解码，记录后合并阶段视为最新
+    if with_chapter and all_valid:
+        segment_ids = [entry['segment_id'] for entry in entries]
+        for rendition in RENDITIONS:
+            output_file = chapter_file(chapter_id, rendition)
+            inputs, corrupt = chapter_inputs(segment_ids, build_cache, rendition)
+            if not corrupt and validate_output(rendition, output_file) is None:
+                build_cache.record(output_file, compute_key(inputs, {'merge': 'batch_encode'}),
+                                   segment_count=len(inputs))
+    return jobs
+
+def merge_files(unit_id: str, input_files: List[Path], output_file: Path,
+                rendition: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    按顺序合并音频文件（片段合并为场景或章节，场景拼接为章节）：MP3 在进程内直接拼接帧，
+    音频参数不一致时回退到 ffmpeg concat；其他格式（Opus）直接使用 ffmpeg concat
+    """
+    if rendition is not None and rendition['codec'] != 'mp3':
+        return merge_files_ffmpeg(unit_id, input_files, output_file)
+    try:
+        result = assemble_chapter(input_files, output_file)
+    except IncompatibleStreams as e:
+        logger.warning(f"{unit_id}: {e}，改用 ffmpeg 合并")
+        return merge_files_ffmpeg(unit_id, input_files, output_file)
+    except Exception as e:
+        logger.error(f"合并错误: {unit_id} - {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+    return {
+        'success': True,
+        'output_file': str(output_file),
+        'file_size_mb': round(result['bytes'] / (1024 * 1024), 2),
+        'duration_seconds': result['duration_seconds']
+    }
+
+def merge_files_ffmpeg(unit_id: str, input_files: List[Path], output_file: Path) -> Dict[str, Any]:
+    """使用 ffmpeg concat 合并（需要重新封装时的回退路径）"""
+    filelist_path = output_file.parent / f'{unit_id}_filelist.txt'
     try:
         # 创建文件列表
-        filelist_path = OUTPUT_CHAPTERS_DIR / f'{chapter_id}_filelist.txt'
+        output_file.parent.mkdir(parents=True, exist_ok=True)
         with open(filelist_path, 'w') as f:
-            for seg_id in segment_ids:
-                seg_file = OUTPUT_SEGMENTS_DIR / f'{seg_id}.mp3'
-                if seg_file.exists():
-                    f.write(f"file '{seg_file.absolute()}'\n")
-
-        # 合并文件
-        output_file = OUTPUT_CHAPTERS_DIR / f'{chapter_id}.mp3'
-        cmd = [
-            'ffmpeg',
-            '-f', 'concat',
-            '-safe', '0',
-            '-i', str(filelist_path),
-            '-c', 'copy',
-            '-y',
-            str(output_file)
-        ]
+            for input_file in input_files:
+                f.write(f"file '{input_file.absolute()}'\n")
 
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=120
-        )
+        # 合并文件（写入临时文件后原子替换）
+        with atomic_output(output_file) as tmp_file:
+            cmd = [
+                'ffmpeg',
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', str(filelist_path),
+                '-c', 'copy',
+                '-y',
+                str(tmp_file)
+            ]
 
-        # 删除临时文件列表
-        filelist_path.unlink()
+            result = instrumentation.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=120
+            )
 
-        if result.returncode != 0:
-            logger.error(f"合并失败: {chapter_id}")
-            return {'success': False, 'error': result.stderr}
+            if result.returncode != 0:
+                raise subprocess.CalledProcessError(result.returncode, cmd, stderr=result.stderr)
 
         file_size = output_file.stat().st_size
 
         return {
             'success': True,
-            'chapter_id': chapter_id,
             'output_file': str(output_file),
             'file_size_mb': round(file_size / (1024 * 1024), 2)
         }
 
+    except subprocess.CalledProcessError as e:
+        logger.error(f"合并失败: {unit_id}")
+        return {'success': False, 'error': e.stderr}
+    except Exception as e:
+        logger.error(f"合并错误: {unit_id} - {str(e)}")
+        return {'success': False, 'error': str(e)}
+    finally:
+        # 删除临时文件列表
+        if filelist_path.exists():
+            filelist_path.unlink()
+
+def merge_chapter(chapter_id: str, segment_ids: List[str],
+                  rendition: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """直接由片段合并章节文件（章节不在 scenes.json 中时）"""
+    segment_files = [segment_file(seg_id, rendition) for seg_id in segment_ids]
+    segment_files = [path for path in segment_files if path.exists()]
+    return {'chapter_id': chapter_id, **merge_files(chapter_id, segment_files, chapter_file(chapter_id, rendition), rendition)}
+
+def chapter_inputs(segment_ids: List[str], build_cache: BuildCache,
+                   rendition: Optional[Dict[str, Any]] = None) -> Tuple[List[str], List[str]]:
+    """章节缓存键的输入（片段 ID 与文件哈希）；同时校验片段，返回损坏的片段"""
+    inputs = []
+    corrupt = []
+    for seg_id in segment_ids:
+        seg_file = segment_file(seg_id, rendition)
+        if seg_file.exists():
+            # 合并前校验片段帧结构，损坏的片段使其缓存失效，下次运行重新编码
+            if validate_output(rendition or RENDITIONS[0], seg_file):
+                build_cache.invalidate(seg_file)
+                corrupt.append(seg_id)
+                continue
+            inputs.append(f'{seg_id}:{build_cache.file_hash(seg_file)}')
+    return inputs, corrupt
+
+def merge_mode(rendition: Optional[Dict[str, Any]] = None) -> str:
+    return 'frame_concat' if rendition is None or rendition['codec'] == 'mp3' else 'ffmpeg_concat'
+
+def load_scene_index() -> Optional[SceneIndex]:
+    """scenes.json 的场景索引（解析结果由进程内产物缓存复用）"""
+    return SceneIndex.load(SCENES_FILE)
+
+def chapter_scenes(chapter_id: str, segment_ids: List[str]) -> List[Tuple[str, List[str]]]:
+    """
+    章节片段按场景分组 [(scene_id, [segment_id, ...])]；
+    没有 scenes.json、章节不在其中或只有一个场景时返回空列表，按整章合并
+    """
+    index = load_scene_index()
+    if index is None or chapter_id not in index.starts:
+        return []
+    records = {record['segment_id']: record for record in load_chapter_records(chapter_id)}
+    if any(seg_id not in records for seg_id in segment_ids):
+        return []
+    groups = index.group(chapter_id, [records[seg_id] for seg_id in segment_ids])
+    return groups if len(groups) > 1 else []
+
+# 同一产物同时只由一个线程合并（场景可能在片段完成时提前合并，与章节任务并发）
+_merge_locks: Dict[Path, threading.Lock] = {}
+_merge_locks_guard = threading.Lock()
+
+def merge_lock(output_file: Path) -> threading.Lock:
+    with _merge_locks_guard:
+        return _merge_locks.setdefault(output_file, threading.Lock())
+
+def run_scene_job(scene_id: str, segment_ids: List[str], build_cache: BuildCache, force: bool = False,
+                  rendition: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """合并场景（默认主版本）；场景内的片段均未变化时跳过"""
+    output_file = scene_file(scene_id, rendition)
+    try:
+        with merge_lock(output_file):
+            inputs, corrupt = chapter_inputs(segment_ids, build_cache, rendition)
+            if corrupt:
+                logger.error(f"合并跳过: {scene_id} 含损坏的片段 {', '.join(corrupt)}")
+                return {'success': False, 'scene_id': scene_id, 'error': f"损坏的片段: {', '.join(corrupt)}"}
+            key = compute_key(inputs, {'merge': merge_mode(rendition), 'unit': 'scene'})
+            if not force and build_cache.is_fresh(output_file, key):
+                return {'success': True, 'scene_id': scene_id, 'skipped': True}
+
+            with instrumentation.span(scene_id, 'scene', rendition=(rendition or RENDITIONS[0])['name']):
+                input_files = [segment_file(seg_id, rendition) for seg_id in segment_ids]
+                result = merge_files(scene_id, [path for path in input_files if path.exists()], output_file, rendition)
+            if result['success']:
+                build_cache.record(output_file, key, segment_count=len(inputs))
+            return {'scene_id': scene_id, **result}
+    except Exception as e:
+        logger.error(f"合并错误: {scene_id} - {str(e)}")
+        return {'success': False, 'scene_id': scene_id, 'error': str(e)}
+
+def run_scene_renditions(scene_id: str, segment_ids: List[str], build_cache: BuildCache) -> Dict[str, str]:
+    """场景的片段全部完成时提前合并各版本，章节任务到来时只需拼接；返回合并失败的版本及错误"""
+    errors = {}
+    for rendition in RENDITIONS:
+        result = run_scene_job(scene_id, segment_ids, build_cache, False, rendition)
+        if not result['success']:
+            errors[rendition['name']] = result.get('error', '合并失败')
+    return errors
+
+def stitch_chapter(chapter_id: str, scenes: List[Tuple[str, List[str]]], build_cache: BuildCache,
+                   force: bool = False, rendition: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """并行合并各场景（未变化的场景跳过），再把场景文件拼接为章节"""
+    output_file = chapter_file(chapter_id, rendition)
+    with ThreadPoolExecutor(max_workers=min(SCENE_JOBS, len(scenes))) as executor:
+        scene_results = list(executor.map(
+            lambda scene: run_scene_job(scene[0], scene[1], build_cache, force, rendition), scenes))
+    failed = [result['scene_id'] for result in scene_results if not result['success']]
+    scene_stats = {
+        'total': len(scenes),
+        'merged': sum(1 for result in scene_results if result['success'] and not result.get('skipped')),
+        'failed': failed
+    }
+    if failed:
+        logger.error(f"合并跳过: {chapter_id} 的场景 {', '.join(failed)} 合并失败")
+        return {'success': False, 'error': f"场景合并失败: {', '.join(failed)}", 'scenes': scene_stats}
+
+    scene_files = [scene_file(scene_id, rendition) for scene_id, _ in scenes]
+    inputs = [f'{scene_id}:{build_cache.file_hash(path)}' for (scene_id, _), path in zip(scenes, scene_files)]
+    key = compute_key(inputs, {'merge': merge_mode(rendition), 'unit': 'scene_stitch'})
+    if not force and build_cache.is_fresh(output_file, key):
+        run_alignment_job(chapter_id, [seg_id for _, ids in scenes for seg_id in ids], build_cache, rendition)
+        return {**skipped_chapter(chapter_id, output_file, 'scene_stitch'), 'scenes': scene_stats}
+
+    result = merge_files(chapter_id, scene_files, output_file, rendition)
+    if result['success']:
+        build_cache.record(output_file, key, scene_count=len(scenes))
+        run_alignment_job(chapter_id, [seg_id for _, ids in scenes for seg_id in ids], build_cache, rendition)
+    return {'chapter_id': chapter_id, **result, 'merge': 'scene_stitch', 'scenes': scene_stats}
+
+def skipped_chapter(chapter_id: str, output_file: Path, merge: str) -> Dict[str, Any]:
+    """未变化、跳过合并的章节结果"""
+    return {
+        'success': True,
+        'chapter_id': chapter_id,
+        'output_file': str(output_file),
+        'file_size_mb': round(output_file.stat().st_size / (1024 * 1024), 2),
+        'skipped': True,
+        'merge': merge
+    }
+
+def run_chapter_job(chapter_id: str, segment_ids: List[str], build_cache: BuildCache, force: bool = False,
+                    rendition: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    合并章节（默认主版本）：章节在 scenes.json 中时先合并场景再拼接，片段变化只重新合并所在场景；
+    否则由片段直接合并。参与合并的内容均未变化时跳过（包括批量模式已输出的章节）。
+    MP3 章节随后生成对齐索引（索引缺失或过期时，合并跳过也会补上）
+    """
+    output_file = chapter_file(chapter_id, rendition)
+    try:
+        inputs, corrupt = chapter_inputs(segment_ids, build_cache, rendition)
+        batch_key = compute_key(inputs, {'merge': 'batch_encode'})
+        if not force and not corrupt and build_cache.is_fresh(output_file, batch_key):
+            run_alignment_job(chapter_id, segment_ids, build_cache, rendition)
+            return skipped_chapter(chapter_id, output_file, 'batch_encode')
+
+        scenes = chapter_scenes(chapter_id, segment_ids)
+        if scenes:
+            return stitch_chapter(chapter_id, scenes, build_cache, force, rendition)
+
+        if corrupt:
+            logger.error(f"合并跳过: {chapter_id} 含损坏的片段 {', '.join(corrupt)}")
+            return {'success': False, 'error': f"损坏的片段: {', '.join(corrupt)}"}
+        key = compute_key(inputs, {'merge': merge_mode(rendition)})
+        if not force and build_cache.is_fresh(output_file, key):
+            run_alignment_job(chapter_id, segment_ids, build_cache, rendition)
+            return skipped_chapter(chapter_id, output_file, merge_mode(rendition))
+
+        result = merge_chapter(chapter_id, segment_ids, rendition)
+        if result['success']:
+            build_cache.record(output_file, key, segment_count=len(inputs))
+            run_alignment_job(chapter_id, segment_ids, build_cache, rendition)
+        return result
     except Exception as e:
         logger.error(f"合并错误: {chapter_id} - {str(e)}")
         return {'success': False, 'error': str(e)}
 
-def main():
+def load_chapter_records(chapter_id: str) -> List[Dict[str, Any]]:
+    """读取章节的完整片段记录（含文本与源片段 ID），生成对齐索引时使用"""
+    source = open_segments(CATALOG_FILE, SEGMENTS_FILE)
+    try:
+        return list(source.iter_segments(chapter_id))
+    finally:
+        source.close()
+
+def run_alignment_job(chapter_id: str, segment_ids: List[str], build_cache: BuildCache,
+                      rendition: Optional[Dict[str, Any]] = None) -> Optional[Path]:
+    """
+    为 MP3 章节生成对齐索引（与章节同名的 .align.json）；章节音频、片段与源文本均未变化时跳过。
+    Opus 等其他格式没有帧索引，不生成。失败只记录警告，不影响合并结果
+    """
+    if rendition is not None and rendition['codec'] != 'mp3':
+        return None
+    import alignment
+
+    audio_file = chapter_file(chapter_id, rendition)
+    output_file = alignment.alignment_path_for(audio_file)
+    try:
+        records = {record['segment_id']: record for record in load_chapter_records(chapter_id)}
+        segments = [records[seg_id] for seg_id in segment_ids
+                    if seg_id in records and segment_file(seg_id, rendition).exists()]
+        segment_files = [segment_file(segment['segment_id'], rendition) for segment in segments]
+        attributed = alignment.attributed_file(chapter_id)
+        inputs = [build_cache.file_hash(audio_file)]
+        if attributed.exists():
+            inputs.append(build_cache.file_hash(attributed))
+        inputs += [
+            f"{segment['segment_id']}:{build_cache.file_hash(path)}:{','.join(segment.get('source_segment_ids') or [])}"
+            f":{len(segment.get('text', ''))}"
+            for segment, path in zip(segments, segment_files)
+        ]
+        key = compute_key(inputs, {'alignment_version': alignment.ALIGNMENT_VERSION,
+                                   'silence_ms': [SILENCE_START_MS, SILENCE_END_MS]})
+        if build_cache.is_fresh(output_file, key):
+            return output_file
+
+        with instrumentation.span(chapter_id, 'align', segments=len(segments)):
+            index = alignment.build_alignment(chapter_id, audio_file, segments, segment_files,
+                                              alignment.source_texts(chapter_id), SILENCE_START_MS, SILENCE_END_MS)
+            alignment.write_alignment(index, output_file)
+        build_cache.record(output_file, key, segment_count=len(segments))
+        return output_file
+    except Exception as e:
+        logger.warning(f"   对齐索引 {chapter_id}: ✗ {str(e)}")
+        return None
+
+def chapter_order(chapter_ids: List[str], priority: List[str]) -> List[str]:
+    """处理顺序：优先列表中的章节在前（按列表顺序），其余章节按原顺序"""
+    first = [cid for cid in priority if cid in chapter_ids]
+    return first + [cid for cid in chapter_ids if cid not in first]
+
+def run_chapter_pipeline(chapter_id: str, segment_ids: List[str], build_cache: BuildCache,
+                         force: bool, publish: bool, failed: bool, started: float) -> Dict[str, Any]:
+    """章节最后一个片段完成后立即合并；开启逐章发布且片段全部成功时更新发布目录"""
+    with instrumentation.span(chapter_id, 'chapter', segments=len(segment_ids)) as attrs:
+        with instrumentation.span(chapter_id, 'merge', rendition=RENDITIONS[0]['name']):
+            result = run_chapter_job(chapter_id, segment_ids, build_cache, force)
+        # 其他版本在主版本之后合并，任一版本失败时不发布
+        rendition_files = {}
+        rendition_errors = {}
+        for rendition in RENDITIONS[1:]:
+            with instrumentation.span(chapter_id, 'merge', rendition=rendition['name']):
+                merged = run_chapter_job(chapter_id, segment_ids, build_cache, force, rendition)
+            if merged['success']:
+                rendition_files[rendition['name']] = chapter_file(chapter_id, rendition)
+            else:
+                logger.error(f"   合并 {chapter_id} ({rendition['name']}): ✗ 失败")
+                rendition_errors[rendition['name']] = merged.get('error', '合并失败')
+                failed = True
+        result['renditions'] = [RENDITIONS[0]['name']] + list(rendition_files)
+        if rendition_errors:
+            result['rendition_errors'] = rendition_errors
+        result['ready_seconds'] = round(time.monotonic() - started, 2)
+        if result['success']:
+            if result.get('skipped') and result.get('merge') == 'batch_encode':
+                logger.info(f"   合并 {chapter_id}: 已由批量编码输出 ({result['file_size_mb']} MB)")
+            elif result.get('skipped'):
+                logger.info(f"   合并 {chapter_id}: 未变化，跳过 ({result['file_size_mb']} MB)")
+            elif result.get('scenes'):
+                scenes = result['scenes']
+                logger.info(f"   合并 {chapter_id}: ✓ {result['file_size_mb']} MB，重新合并场景 "
+                            f"{scenes['merged']}/{scenes['total']} ({result['ready_seconds']} 秒)")
+            else:
+                logger.info(f"   合并 {chapter_id}: ✓ {result['file_size_mb']} MB ({result['ready_seconds']} 秒)")
+            if publish and not failed:
+                # 发布阶段的模块只在逐章发布时导入
+                import package_release
+                try:
+                    with instrumentation.span(chapter_id, 'publish'):
+                        package_release.publish_chapter(chapter_id, chapter_file(chapter_id), rendition_files)
+                    result['published'] = True
+                    logger.info(f"   发布 {chapter_id}: ✓")
+                except Exception as e:
+                    logger.error(f"   发布 {chapter_id}: ✗ {str(e)}")
+            elif publish:
+                logger.warning(f"   发布 {chapter_id}: 跳过（有片段或版本处理失败）")
+        else:
+            logger.error(f"   合并 {chapter_id}: ✗ 失败")
+        attrs['success'] = result['success']
+        attrs['skipped'] = bool(result.get('skipped'))
+    return result
+
+def build_processing_log(total_segments: int, processed_segments: List[Dict[str, Any]],
+                         failed_segments: List[str], segment_errors: Dict[str, str],
+                         merged_chapters: List[Dict[str, Any]], order: List[str],
+                         loudness_hits: int, loudness_misses: int, batch: bool = False) -> Dict[str, Any]:
+    """生成 processing_log.json 的内容（单机运行与工作队列共用）"""
+    total_size = sum(s.get('file_size_bytes', 0) for s in processed_segments)
+    ready_times = [r['ready_seconds'] for r in merged_chapters if r.get('ready_seconds') is not None]
+    # 主版本已合并、但有其他版本合并失败的章节
+    rendition_errors = {r['chapter_id']: r['rendition_errors'] for r in merged_chapters if r.get('rendition_errors')}
+    return {
+        'processing_date': datetime.now().isoformat(),
+        'segments_processed': len(processed_segments),
+        'segments_failed': len(failed_segments),
+        'chapters_created': len(merged_chapters),
+        'processing_stats': {
+            'total_segments': total_segments,
+            'successful_segments': len([s for s in processed_segments if not s.get('skipped')]),
+            'skipped_segments': len([s for s in processed_segments if s.get('skipped')]),
+            'total_output_size_mb': round(total_size / (1024 * 1024), 2),
+            'loudnorm_mode': LOUDNORM_MODE,
+            'backend': AUDIO_BACKEND,
+            'batch_encode': batch,
+            'renditions': [{k: r[k] for k in ('name', 'codec', 'bitrate')} for r in RENDITIONS],
+            'loudness_cache_hits': loudness_hits,
+            'loudness_cache_misses': loudness_misses,
+            'chapter_order': order,
+            'first_chapter_ready_seconds': min(ready_times) if ready_times else None,
+            'all_chapters_ready_seconds': max(ready_times) if ready_times else None,
+            'chapters_published': sum(1 for r in merged_chapters if r.get('published')),
+            'scenes_merged': sum(r['scenes']['merged'] for r in merged_chapters if r.get('scenes')),
+            'chapters_with_rendition_errors': len(rendition_errors)
+        },
+        'chapters': merged_chapters,
+        'failed_segments': failed_segments,
+        'segment_errors': segment_errors,
+        'rendition_errors': rendition_errors
+    }
+
+def encoded_audio_seconds(processed_segments: List[Dict[str, Any]]) -> float:
+    """本次重新编码的片段的音频总时长（秒），供容量规划统计吞吐"""
+    total = 0.0
+    for segment in processed_segments:
+        if segment.get('skipped'):
+            continue
+        try:
+            total += mp3_duration(segment_file(segment['segment_id']))
+        except (OSError, ValueError):
+            continue
+    return round(total, 1)
+
+def numpy_backend_available() -> bool:
+    """numpy 后端是否可用；dsp 加载 NumPy/SciPy 较慢，只在选用该后端时导入"""
+    import dsp
+    return dsp.HAVE_NUMPY
+
+def configure(loudnorm_mode: str, backend: str, config: Dict[str, Any]) -> None:
+    """设置本进程的处理参数（命令行与工作队列的 worker 共用）"""
+    global LOUDNORM_MODE, AUDIO_BACKEND, RENDITIONS, MP3_BITRATE
+    LOUDNORM_MODE = loudnorm_mode
+    AUDIO_BACKEND = backend
+    RENDITIONS = load_renditions(config)
+    MP3_BITRATE = RENDITIONS[0]['bitrate']
+
+def watch_segments(segments: List[Dict[str, Any]], order: List[str], jobs: int, force: bool, publish: bool,
+                   polling: bool = False, idle_timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    监视模式：与 TTS 生成同时运行。启动时处理已到达的 WAV，之后只处理新增或变化的 WAV，
+    并在章节全部片段就绪后重新合并受影响的章节。Ctrl+C 或空闲超时后退出并写入处理日志
+    """
+    segments_by_id = {segment['segment_id']: segment for segment in segments}
+    chapters: Dict[str, List[str]] = {}
+    for segment in segments:
+        chapters.setdefault(segment['chapter_id'], []).append(segment['segment_id'])
+
+    watcher = open_watcher(INPUT_DIR, '.wav', polling)
+    debouncer = Debouncer(INPUT_DIR)
+    loudness_cache = LoudnessCache(LOUDNESS_CACHE_FILE)
+    build_cache = BuildCache()
+    OUTPUT_SEGMENTS_DIR.mkdir(parents=True, exist_ok=True)
+    OUTPUT_CHAPTERS_DIR.mkdir(parents=True, exist_ok=True)
+    logger.info(f"   监视 {INPUT_DIR}（{watcher.name}），按 Ctrl+C 停止")
+
+    results: Dict[str, Dict[str, Any]] = {}  # 每个片段最近一次的处理结果
+    chapter_results: Dict[str, Dict[str, Any]] = {}
+    segment_futures = {}
+    merge_futures = {}
+    rerun = set()  # 处理期间 WAV 再次变化的片段
+    dirty = set(chapters)  # 有片段更新、需要重新合并的章节；启动时全部检查一遍（未变化的合并会跳过）
+    stats = {'events': 0, 'segments_encoded': 0, 'chapter_merges': 0}
+    started = time.monotonic()
+    last_activity = started
+
+    def submit(executor, segment_id: str, force_segment: bool = False) -> None:
+        segment_futures[executor.submit(run_segment_job, segments_by_id[segment_id], loudness_cache,
+                                        build_cache, force_segment)] = segment_id
+
+    def chapter_ready(chapter_id: str) -> bool:
+        """章节内所有片段都已有产物，且没有处理中或等待写入稳定的片段"""
+        busy = set(segment_futures.values()) | set(merge_futures.values())
+        return chapter_id not in busy and all(
+            segment_id not in busy and f'{segment_id}.wav' not in debouncer
+            and results.get(segment_id, {}).get('status') in ('processed', 'skipped')
+            for segment_id in chapters[chapter_id])
+
+    with instrumentation.span('watch', jobs=jobs, watcher=watcher.name), \
+            ThreadPoolExecutor(max_workers=jobs) as executor, \
+            ThreadPoolExecutor(max_workers=MERGE_JOBS) as merge_executor:
+        try:
+            # 已有 WAV 或已有产物的片段先检查一遍；其余片段等待 TTS 生成
+            for chapter_id in order:
+                for segment_id in chapters[chapter_id]:
+                    if (INPUT_DIR / f'{segment_id}.wav').exists() or segment_file(segment_id).exists():
+                        submit(executor, segment_id, force)
+
+            while True:
+                changed = {name for name in watcher.wait(WATCH_TICK_SECONDS) if name[:-len('.wav')] in segments_by_id}
+                if changed:
+                    stats['events'] += len(changed)
+                    debouncer.touch(changed)
+                    last_activity = time.monotonic()
+
+                for name in debouncer.ready():
+                    segment_id = name[:-len('.wav')]
+                    if segment_id in segment_futures.values():
+                        rerun.add(segment_id)
+                    else:
+                        logger.info(f"   收到 {segment_id}")
+                        submit(executor, segment_id)
+
+                for future in [f for f in segment_futures if f.done()]:
+                    segment_id = segment_futures.pop(future)
+                    job = future.result()
+                    results[segment_id] = job
+                    last_activity = time.monotonic()
+                    if job['status'] == 'processed':
+                        stats['segments_encoded'] += 1
+                        dirty.add(segments_by_id[segment_id]['chapter_id'])
+                        logger.info(f"   完成 {segment_id}")
+                    elif job['status'] == 'failed':
+                        logger.warning(f"   失败 {segment_id}: {job['error'].strip()[-200:]}")
+                    if segment_id in rerun:
+                        rerun.discard(segment_id)
+                        submit(executor, segment_id)
+
+                for future in [f for f in merge_futures if f.done()]:
+                    chapter_id = merge_futures.pop(future)
+                    chapter_results[chapter_id] = future.result()
+                    stats['chapter_merges'] += 1
+                    last_activity = time.monotonic()
+                    # 合并完成后保存缓存，中途停止时不必重新计算
+                    loudness_cache.save()
+                    build_cache.save()
+
+                for chapter_id in order:
+                    if chapter_id in dirty and chapter_ready(chapter_id):
+                        dirty.discard(chapter_id)
+                        merge_futures[merge_executor.submit(
+                            run_chapter_pipeline, chapter_id, chapters[chapter_id], build_cache, False,
+                            publish, False, started)] = chapter_id
+
+                idle = not (segment_futures or merge_futures or len(debouncer))
+                if idle and idle_timeout is not None and time.monotonic() - last_activity >= idle_timeout:
+                    logger.info(f"   {idle_timeout} 秒内没有新的 WAV，停止监视")
+                    break
+        except KeyboardInterrupt:
+            logger.info("\n   停止监视，等待处理中的任务完成...")
+        finally:
+            watcher.close()
+
+    for future, segment_id in segment_futures.items():
+        results[segment_id] = future.result()
+    for future, chapter_id in merge_futures.items():
+        chapter_results[chapter_id] = future.result()
+    loudness_cache.save()
+    build_cache.save()
+
+    processed_segments = []
+    failed_segments = []
+    segment_errors = {}
+    for segment_id, job in results.items():
+        if job['status'] == 'skipped':
+            processed_segments.append({'segment_id': segment_id, 'skipped': True})
+        elif job['status'] == 'processed':
+            processed_segments.append({'segment_id': segment_id, **job['result']})
+        else:
+            failed_segments.append(segment_id)
+            segment_errors[segment_id] = job['error']
+    merged_chapters = [chapter_results[cid] for cid in order
+                       if chapter_results.get(cid, {}).get('success')]
+    log_data = build_processing_log(len(segments), processed_segments, failed_segments, segment_errors,
+                                    merged_chapters, order, loudness_cache.hits, loudness_cache.misses)
+    log_data['watch'] = {
+        'watcher': watcher.name,
+        'duration_seconds': round(time.monotonic() - started, 2),
+        **stats,
+        # WAV 尚未到达的片段
+        'waiting_segments': len(segments) - len(results)
+    }
+    log_data['performance'] = instrumentation.summary()
+    artifact_store.write_json(LOG_FILE, log_data)
+    logger.info(f"   片段编码 {stats['segments_encoded']} 次, 章节合并 {stats['chapter_merges']} 次, "
+                f"等待中的片段 {log_data['watch']['waiting_segments']} 个")
+    logger.info(f"   ✓ 日志已保存: {LOG_FILE}")
+    return log_data
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='音频后处理')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='并发处理的片段数（默认根据 CPU 核数与内存自动计算）')
+    parser.add_argument('--loudnorm-mode', choices=LOUDNORM_MODES, default=LOUDNORM_MODE,
+                        help='响度标准化模式：gain/linear 使用缓存的测量值，dynamic 为单遍动态处理')
+    parser.add_argument('--backend', choices=AUDIO_BACKENDS, default=AUDIO_BACKEND,
+                        help='处理后端：ffmpeg 为逐片段滤镜图，numpy 在进程内完成响度处理（需要 NumPy）')
+    parser.add_argument('--batch', action='store_true',
+                        help='每章启动一个 ffmpeg，同一次解码输出该章的片段 MP3 与章节 MP3（仅 ffmpeg 后端）')
+    parser.add_argument('--force', action='store_true',
+                        help='忽略构建缓存，重新处理所有片段和章节')
+    parser.add_argument('--chapter', action='append', default=[],
+                        help='只处理指定章节（可重复指定）')
+    parser.add_argument('--priority', default='',
+                        help='优先处理的章节，逗号分隔（如 ch_003,ch_001），其余章节按顺序')
+    parser.add_argument('--publish', action='store_true',
+                        help='章节合并后立即发布到 release/，逐章更新 chapters.json 和 meta.json')
+    parser.add_argument('--watch', action='store_true',
+                        help='持续运行：监视 04_tts_raw，只处理新增或变化的 WAV 并重新合并受影响的章节')
+    parser.add_argument('--poll', action='store_true',
+                        help='监视模式下定期扫描目录，不使用 inotify（网络文件系统上 inotify 收不到其他机器的写入）')
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help='监视模式下连续多少秒没有新 WAV 且没有任务时退出（默认一直运行）')
+    instrumentation.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """主函数"""
+    args = parse_args(argv)
+    jobs = args.jobs if args.jobs and args.jobs > 0 else default_jobs()
+    config = load_config()
+    configure(args.loudnorm_mode, args.backend, config)
+    if AUDIO_BACKEND == 'numpy' and not numpy_backend_available():
+        logger.error("numpy 后端需要安装 NumPy（pip install numpy），或使用 --backend ffmpeg")
+        return
+    if args.batch and AUDIO_BACKEND != 'ffmpeg':
+        logger.error("--batch 只适用于 ffmpeg 后端")
+        return
+    if args.batch and args.watch:
+        logger.error("--watch 逐片段处理到达的 WAV，不能与 --batch 同时使用")
+        return
+
     logger.info("=" * 60)
     logger.info("音频后处理开始")
     logger.info("=" * 60)
 
     # 加载配置和片段信息
     logger.info("\n1. 加载配置...")
-    config = load_config()
-    segments_data = load_segments()
-    segments = segments_data['segments']
+    with instrumentation.span('load'):
+        segments = load_segments(args.chapter)
 
     logger.info(f"   - 总片段数: {len(segments)}")
     logger.info(f"   - 目标响度: {TARGET_LUFS} LUFS")
     logger.info(f"   - MP3 比特率: {MP3_BITRATE}")
+    logger.info(f"   - 输出版本: {', '.join(r['name'] for r in RENDITIONS)}")
+    logger.info(f"   - 处理后端: {AUDIO_BACKEND}")
+    logger.info(f"   - 响度模式: {LOUDNORM_MODE}")
+    logger.info(f"   - 批量编码: {'每章一个 ffmpeg' if args.batch else '否'}")
+    logger.info(f"   - 并发数: {jobs}")
 
-    # 处理所有片段
-    logger.info("\n2. 处理音频片段...")
+    # 按章节组织片段
+    chapters: Dict[str, List[str]] = {}
+    for segment in segments:
+        chapters.setdefault(segment['chapter_id'], []).append(segment['segment_id'])
+    order = chapter_order(list(chapters), [cid for cid in args.priority.split(',') if cid])
+    segments_by_id = {segment['segment_id']: segment for segment in segments}
+
+    if args.watch:
+        logger.info("\n2. 监视 TTS 输出并逐片段处理...")
+        log_data = watch_segments(segments, order, jobs, args.force, args.publish, args.poll, args.idle_timeout)
+        for line in instrumentation.format_summary(log_data['performance']):
+            logger.info(f"   {line}")
+        for path in instrumentation.export(args, 'postprocess_audio'):
+            logger.info(f"   ✓ 已导出: {path}")
+        return
+
+    # 按章节顺序提交片段任务；某章最后一个片段完成时立即提交该章的合并，不等待全书
+    logger.info("\n2. 处理音频片段并逐章合并...")
     processed_segments = []
     failed_segments = []
     total_size = 0
 
-    for i, segment in enumerate(segments, 1):
-        segment_id = segment['segment_id']
-        input_file = INPUT_DIR / f'{segment_id}.wav'
-        output_file = OUTPUT_SEGMENTS_DIR / f'{segment_id}.mp3'
+    OUTPUT_SEGMENTS_DIR.mkdir(parents=True, exist_ok=True)
+    OUTPUT_CHAPTERS_DIR.mkdir(parents=True, exist_ok=True)
+    segment_errors = {}
+    loudness_cache = LoudnessCache(LOUDNESS_CACHE_FILE)
+    build_cache = BuildCache()
+    remaining = {cid: len(ids) for cid, ids in chapters.items()}
+    # 批量模式下 --force 已重新编码章节，合并阶段不再重复
+    merge_force = args.force and not args.batch
+    failed_chapters = set()
+    merge_futures = {}
+    started = time.monotonic()
 
-        # 跳过已存在的文件
-        if output_file.exists():
-            logger.info(f"   [{i}/{len(segments)}] 跳过 {segment_id} (已存在)")
-            processed_segments.append({
-                'segment_id': segment_id,
-                'skipped': True
-            })
-            continue
+    # 场景的片段全部完成时提前合并该场景，章节任务到来时只需拼接；
+    # 批量模式直接输出章节，--force 时由章节任务统一重新合并
+    scene_of: Dict[str, str] = {}
+    scene_segments: Dict[str, List[str]] = {}
+    if not args.batch and not args.force:
+        for chapter_id in order:
+            for scene_id, scene_segment_ids in chapter_scenes(chapter_id, chapters[chapter_id]):
+                scene_segments[scene_id] = scene_segment_ids
+                scene_of.update(dict.fromkeys(scene_segment_ids, scene_id))
+    scene_remaining = {scene_id: len(ids) for scene_id, ids in scene_segments.items()}
+    failed_scenes = set()
+    scene_futures = {}
 
-        if not input_file.exists():
-            logger.warning(f"   [{i}/{len(segments)}] 输入文件不存在: {segment_id}")
-            failed_segments.append(segment_id)
-            continue
+    with instrumentation.span('process', jobs=jobs, batch=args.batch), \
+            ThreadPoolExecutor(max_workers=jobs) as executor, \
+            ThreadPoolExecutor(max_workers=MERGE_JOBS) as merge_executor:
+        if args.batch:
+            # 每章一个 ffmpeg 进程，章节内的片段结果一起返回
+            futures = {
+                executor.submit(run_chapter_batch_job, chapter_id,
+                                [segments_by_id[segment_id] for segment_id in chapters[chapter_id]],
+                                loudness_cache, build_cache, args.force): chapter_id
+                for chapter_id in order
+            }
+            completed = (job for future in as_completed(futures) for job in future.result())
+        else:
+            futures = {
+                executor.submit(run_segment_job, segments_by_id[segment_id], loudness_cache, build_cache, args.force):
+                    segment_id
+                for chapter_id in order for segment_id in chapters[chapter_id]
+            }
+            completed = (future.result() for future in as_completed(futures))
+        for i, job in enumerate(completed, 1):
+            segment_id = job['segment_id']
+            chapter_id = segments_by_id[segment_id]['chapter_id']
 
-        logger.info(f"   [{i}/{len(segments)}] 处理 {segment_id}...")
-        result = process_segment(input_file, output_file)
+            if job['status'] == 'skipped':
+                logger.info(f"   [{i}/{len(segments)}] 跳过 {segment_id} (未变化)")
+                processed_segments.append({
+                    'segment_id': segment_id,
+                    'skipped': True
+                })
+            elif job['status'] == 'processed':
+                logger.info(f"   [{i}/{len(segments)}] 完成 {segment_id}")
+                result = job['result']
+                total_size += result['file_size_bytes']
+                processed_segments.append({
+                    'segment_id': segment_id,
+                    **result
+                })
+            else:
+                logger.warning(f"   [{i}/{len(segments)}] 失败 {segment_id}: {job['error'].strip()[-200:]}")
+                failed_segments.append(segment_id)
+                segment_errors[segment_id] = job['error']
+                failed_chapters.add(chapter_id)
+                if segment_id in scene_of:
+                    failed_scenes.add(scene_of[segment_id])
 
-        if result['success']:
-            total_size += result['file_size_bytes']
-            processed_segments.append({
-                'segment_id': segment_id,
-                **result
-            })
-        else:
-            failed_segments.append(segment_id)
+            scene_id = scene_of.get(segment_id)
+            if scene_id is not None:
+                scene_remaining[scene_id] -= 1
+                if scene_remaining[scene_id] == 0 and scene_id not in failed_scenes:
+                    scene_futures[merge_executor.submit(
+                        run_scene_renditions, scene_id, scene_segments[scene_id], build_cache)] = scene_id
+
+            remaining[chapter_id] -= 1
+            if remaining[chapter_id] == 0:
+                merge_futures[merge_executor.submit(
+                    run_chapter_pipeline, chapter_id, chapters[chapter_id], build_cache, merge_force,
+                    args.publish, chapter_id in failed_chapters, started)] = chapter_id
+
+        chapter_results = {merge_futures[future]: future.result() for future in as_completed(merge_futures)}
+        # 提前合并场景的失败（章节任务会重试该场景，这里只记录）
+        scene_errors = {}
+        for future, scene_id in scene_futures.items():
+            try:
+                errors = future.result()
+            except Exception as e:
+                errors = {'all': str(e)}
+            if errors:
+                scene_errors[scene_id] = errors
+                logger.warning(f"   提前合并场景 {scene_id}: ✗ {', '.join(errors)}")
+
+    loudness_cache.save()
+    build_cache.save()
+    merged_chapters = [chapter_results[cid] for cid in order if chapter_results[cid]['success']]
+    ready_times = [r['ready_seconds'] for r in merged_chapters]
 
     logger.info(f"\n   ✓ 处理完成: {len(processed_segments)} 个片段")
     logger.info(f"   ✗ 失败: {len(failed_segments)} 个片段")
     logger.info(f"   总大小: {round(total_size / (1024 * 1024), 2)} MB")
-
-    # 按章节组织片段
-    logger.info("\n3. 合并章节...")
-    chapters = {}
-    for segment in segments:
-        chapter_id = segment['chapter_id']
-        if chapter_id not in chapters:
-            chapters[chapter_id] = []
-        chapters[chapter_id].append(segment['segment_id'])
-
-    merged_chapters = []
-    for chapter_id in sorted(chapters.keys()):
-        logger.info(f"   合并 {chapter_id}...")
-        result = merge_chapter(chapter_id, chapters[chapter_id])
-        if result['success']:
-            merged_chapters.append(result)
-            logger.info(f"      ✓ {result['file_size_mb']} MB")
-        else:
-            logger.error(f"      ✗ 失败")
+    logger.info(f"   响度缓存: 命中 {loudness_cache.hits}, 未命中 {loudness_cache.misses}")
+    logger.info(f"   合并章节: {len(merged_chapters)}/{len(chapters)}")
+    incomplete = [r['chapter_id'] for r in merged_chapters if r.get('rendition_errors')]
+    if incomplete:
+        logger.warning(f"   版本合并失败的章节: {', '.join(incomplete)}")
+    if ready_times:
+        logger.info(f"   首章就绪: {min(ready_times)} 秒, 全部就绪: {max(ready_times)} 秒")
 
     # 生成处理日志
-    logger.info("\n4. 生成处理日志...")
-    log_data = {
-        'processing_date': datetime.now().isoformat(),
-        'segments_processed': len(processed_segments),
-        'segments_failed': len(failed_segments),
-        'chapters_created': len(merged_chapters),
-        'processing_stats': {
-            'total_segments': len(segments),
-            'successful_segments': len([s for s in processed_segments if not s.get('skipped')]),
-            'skipped_segments': len([s for s in processed_segments if s.get('skipped')]),
-            'total_output_size_mb': round(total_size / (1024 * 1024), 2)
-        },
-        'chapters': merged_chapters,
-        'failed_segments': failed_segments
-    }
-
-    with open(LOG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(log_data, f, ensure_ascii=False, indent=2)
+    logger.info("\n3. 生成处理日志...")
+    log_data = build_processing_log(len(segments), processed_segments, failed_segments, segment_errors,
+                                    merged_chapters, order, loudness_cache.hits, loudness_cache.misses,
+                                    batch=args.batch)
+    log_data['processing_stats']['audio_seconds'] = encoded_audio_seconds(processed_segments)
+    log_data['processing_stats']['jobs'] = jobs
+    log_data['scene_errors'] = scene_errors
+    log_data['performance'] = instrumentation.summary()
+    artifact_store.write_json(LOG_FILE, log_data)
 
     logger.info(f"   ✓ 日志已保存: {LOG_FILE}")
+    import capacity_plan
+    for line in capacity_plan.record_run('post', log_data):
+        logger.info(f"   {line}")
+    for line in instrumentation.format_summary(log_data['performance']):
+        logger.info(f"   {line}")
+    for path in instrumentation.export(args, 'postprocess_audio'):
+        logger.info(f"   ✓ 已导出: {path}")
 
     # 报告结果
     logger.info("\n" + "=" * 60)
@@ -252,6 +1289,8 @@ def main():
     logger.info(f"\n输出位置:")
     logger.info(f"  - 片段: {OUTPUT_SEGMENTS_DIR}")
     logger.info(f"  - 章节: {OUTPUT_CHAPTERS_DIR}")
+    for rendition in RENDITIONS[1:]:
+        logger.info(f"  - {rendition['name']}: {chapter_file('', rendition).parent.parent}")
     logger.info(f"\n下一步: 运行 /package-release 打包最终发布")
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+输出版本（rendition）
+同一本书以多种编码发布，例如 192k MP3 供下载、64k MP3 与 48k Opus 供移动端流式播放。
+版本定义位于配置文件 audio_processing.renditions，所有版本由同一次解码与响度处理的音频分别编码。
+第一个版本为主版本（必须是 MP3）：输出到 05_post/segments、05_post/chapters，发布到 audio/chapters；
+其余版本输出到 05_post/<名称>/segments、05_post/<名称>/chapters，发布到 audio/<名称>/
+"""
+
+from pathlib import Path
+from typing import Dict, List, Any
+
+CODECS = {
+    'mp3': {'encoder': 'libmp3lame', 'extension': 'mp3', 'format': 'MP3'},
+    'opus': {'encoder': 'libopus', 'extension': 'opus', 'format': 'Opus'}
+}
+
+DEFAULT_RENDITIONS = [{'name': 'mp3_192k', 'codec': 'mp3', 'bitrate': '192k'}]
+
+def load_renditions(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """读取并校验版本定义，补全编码器、扩展名与主版本标记"""
+    specs = config.get('audio_processing', {}).get('renditions') or DEFAULT_RENDITIONS
+    renditions = []
+    names = set()
+    for i, spec in enumerate(specs):
+        name = spec['name']
+        codec = spec.get('codec', 'mp3')
+        if codec not in CODECS:
+            raise ValueError(f"未知的编码格式: {name} ({codec})，可选: {', '.join(CODECS)}")
+        if name in names:
+            raise ValueError(f"版本名称重复: {name}")
+        if i == 0 and codec != 'mp3':
+            raise ValueError(f"主版本必须为 MP3: {name}")
+        names.add(name)
+        renditions.append({
+            'name': name,
+            'codec': codec,
+            'bitrate': spec['bitrate'],
+            **CODECS[codec],
+            'primary': i == 0
+        })
+    return renditions
+
+def encoder_args(rendition: Dict[str, Any]) -> List[str]:
+    """该版本的 ffmpeg 编码参数（单声道）"""
+    return ['-codec:a', rendition['encoder'], '-b:a', rendition['bitrate'], '-ac', '1']
+
+def post_dirs(post_dir: Path, rendition: Dict[str, Any]) -> Dict[str, Path]:
+    """后处理目录下该版本的片段与章节目录"""
+    base = post_dir if rendition['primary'] else post_dir / rendition['name']
+    return {'segments': base / 'segments', 'chapters': base / 'chapters'}
+
+def release_path(rendition: Dict[str, Any], chapter_id: str) -> str:
+    """章节音频在发布目录中的相对路径"""
+    if rendition['primary']:
+        return f'audio/chapters/{chapter_id}.mp3'
+    return f"audio/{rendition['name']}/{chapter_id}.{rendition['extension']}"
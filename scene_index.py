@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+场景索引
+scenes.json 以源片段 ID 的区间（segment_range）划分每章的场景。源片段 ID 形如 ch_001_seg_008a，
+按 (序号, 切分后缀) 排序；每章的场景起点排成有序表，TTS 片段按其第一个源片段二分查找归入场景。
+后处理以场景为合并单元：片段变化只重新合并所在场景，章节由场景文件拼接
+"""
+
+import re
+import bisect
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+import artifact_store
+
+PROJECT_ROOT = Path(__file__).parent
+SCENES_FILE = PROJECT_ROOT / 'source' / '03_segmentation' / 'scenes.json'
+
+SOURCE_ID_PATTERN = re.compile(r'_seg_(\d+)([a-z]*)$')
+
+def source_key(source_id: str) -> Optional[Tuple[int, str]]:
+    """源片段 ID 的排序键 (序号, 切分后缀)，无法解析时返回 None"""
+    match = SOURCE_ID_PATTERN.search(source_id or '')
+    if not match:
+        return None
+    return int(match.group(1)), match.group(2)
+
+class SceneIndex:
+    """按章节保存场景起点的有序表"""
+
+    def __init__(self, scenes_data: Dict[str, Any]):
+        self.starts: Dict[str, List[Tuple[int, str]]] = {}
+        self.scene_ids: Dict[str, List[str]] = {}
+        for chapter in scenes_data.get('chapters', []):
+            bounds = []
+            for scene in chapter.get('scenes', []):
+                key = source_key(scene.get('segment_range', {}).get('start'))
+                if key is not None:
+                    bounds.append((key, scene['scene_id']))
+            bounds.sort()
+            if bounds:
+                self.starts[chapter['chapter_id']] = [key for key, _ in bounds]
+                self.scene_ids[chapter['chapter_id']] = [scene_id for _, scene_id in bounds]
+
+    @classmethod
+    def load(cls, scenes_file: Path = SCENES_FILE) -> Optional['SceneIndex']:
+        """读取 scenes.json，不存在时返回 None"""
+        if not scenes_file.exists():
+            return None
+        return cls(artifact_store.load_json(scenes_file))
+
+    def scene_for(self, chapter_id: str, source_id: str) -> Optional[str]:
+        """源片段所在的场景；早于第一个场景起点的片段归入第一个场景"""
+        starts = self.starts.get(chapter_id)
+        key = source_key(source_id)
+        if not starts or key is None:
+            return None
+        position = bisect.bisect_right(starts, key) - 1
+        return self.scene_ids[chapter_id][max(position, 0)]
+
+    def group(self, chapter_id: str, segments: List[Dict[str, Any]]) -> List[Tuple[str, List[str]]]:
+        """
+        把章节内按播放顺序排列的 TTS 片段分为 [(scene_id, [segment_id, ...])]。
+        没有源片段 ID 的片段跟随前一个片段；无法归入场景或同一场景不连续时返回空列表，
+        调用方退回按整章合并
+        """
+        groups: List[Tuple[str, List[str]]] = []
+        seen = set()
+        for segment in segments:
+            source_ids = segment.get('source_segment_ids') or []
+            if source_ids:
+                scene_id = self.scene_for(chapter_id, source_ids[0])
+            else:
+                scene_id = groups[-1][0] if groups else None
+            if scene_id is None:
+                return []
+            if groups and groups[-1][0] == scene_id:
+                groups[-1][1].append(segment['segment_id'])
+            elif scene_id in seen:
+                return []
+            else:
+                seen.add(scene_id)
+                groups.append((scene_id, [segment['segment_id']]))
+        return groups
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='查看 TTS 片段到场景的归属')
+    parser.add_argument('--chapter', action='append', help='只显示指定章节（可重复指定）')
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    from segment_catalog import open_segments
+
+    args = parse_args()
+    index = SceneIndex.load()
+    if index is None:
+        print(f"未找到 {SCENES_FILE}")
+        return
+    source = open_segments()
+    try:
+        for chapter_id in args.chapter or source.chapters():
+            groups = index.group(chapter_id, list(source.iter_segments(chapter_id)))
+            if not groups:
+                print(f"{chapter_id}: 无法按场景分组，按整章合并")
+                continue
+            for scene_id, segment_ids in groups:
+                print(f"{scene_id}: {len(segment_ids)} 个片段 ({segment_ids[0]} … {segment_ids[-1]})")
+    finally:
+        source.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+片段目录
+以 SQLite 保存 TTS 片段（按 chapter_id / speaker_id / segment_id 建索引），
+支持构建阶段流式写入、后续阶段按章节懒加载，并可导出兼容的 tts_segments.json
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+from build_cache import temp_path_for, atomic_output
+
+# 路径配置
+PROJECT_ROOT = Path(__file__).parent
+SEGMENTATION_DIR = PROJECT_ROOT / 'source' / '03_segmentation'
+CATALOG_FILE = SEGMENTATION_DIR / 'tts_segments.db'
+JSON_FILE = SEGMENTATION_DIR / 'tts_segments.json'
+
+WRITE_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    segment_id TEXT PRIMARY KEY,
+    chapter_id TEXT NOT NULL,
+    speaker_id TEXT,
+    sequence_number INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_segments_chapter ON segments (chapter_id, sequence_number);
+CREATE INDEX IF NOT EXISTS idx_segments_speaker ON segments (speaker_id);
+CREATE INDEX IF NOT EXISTS idx_segments_sequence ON segments (sequence_number);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class CatalogWriter:
+    """流式写入片段目录：先写临时库，关闭时原子替换，构建期间旧目录仍可读取"""
+
+    def __init__(self, catalog_file: Path = CATALOG_FILE):
+        self.catalog_file = catalog_file
+        self.tmp_file = temp_path_for(catalog_file)
+        self.conn: Optional[sqlite3.Connection] = None
+        self.pending: List[Tuple[str, str, Optional[str], int, str]] = []
+        self.count = 0
+
+    def __enter__(self) -> 'CatalogWriter':
+        self.catalog_file.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.tmp_file)
+        self.conn.execute('PRAGMA journal_mode = OFF')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.executescript(SCHEMA)
+        return self
+
+    def add(self, segment: Dict[str, Any]) -> None:
+        """追加一个片段，按批提交"""
+        self.pending.append((
+            segment['segment_id'],
+            segment['chapter_id'],
+            segment.get('speaker_id'),
+            segment['sequence_number'],
+            json.dumps(segment, ensure_ascii=False)
+        ))
+        self.count += 1
+        if len(self.pending) >= WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.pending:
+            self.conn.executemany('INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?)', self.pending)
+            self.pending = []
+
+    def set_meta(self, meta: Dict[str, Any]) -> None:
+        """写入目录级元数据（创建时间、统计、章节指纹等）"""
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+            [(key, json.dumps(value, ensure_ascii=False)) for key, value in meta.items()]
+        )
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.flush()
+                self.conn.commit()
+            self.conn.close()
+            if exc_type is None:
+                os.replace(self.tmp_file, self.catalog_file)
+        finally:
+            if self.tmp_file.exists():
+                self.tmp_file.unlink()
+
+class SegmentCatalog:
+    """只读片段目录，按需查询"""
+
+    def __init__(self, catalog_file: Path = CATALOG_FILE):
+        self.catalog_file = catalog_file
+        self.conn = sqlite3.connect(f'file:{catalog_file}?mode=ro', uri=True)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def meta(self) -> Dict[str, Any]:
+        return {key: json.loads(value) for key, value in self.conn.execute('SELECT key, value FROM meta ORDER BY rowid')}
+
+    def chapters(self) -> List[str]:
+        return [row[0] for row in self.conn.execute(
+            'SELECT chapter_id FROM segments GROUP BY chapter_id ORDER BY MIN(sequence_number)')]
+
+    def iter_segments(self, chapter_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """按顺序逐个返回片段；指定章节时只读取该章节"""
+        if chapter_id is None:
+            rows = self.conn.execute('SELECT data FROM segments ORDER BY sequence_number')
+        else:
+            rows = self.conn.execute(
+                'SELECT data FROM segments WHERE chapter_id = ? ORDER BY sequence_number', (chapter_id,))
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def iter_index(self, chapter_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """只返回 segment_id / chapter_id / speaker_id，不解析片段正文"""
+        query = 'SELECT segment_id, chapter_id, speaker_id FROM segments'
+        params: Tuple = ()
+        if chapter_id is not None:
+            query += ' WHERE chapter_id = ?'
+            params = (chapter_id,)
+        for segment_id, chapter, speaker_id in self.conn.execute(query + ' ORDER BY sequence_number', params):
+            yield {'segment_id': segment_id, 'chapter_id': chapter, 'speaker_id': speaker_id}
+
+    def get(self, segment_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute('SELECT data FROM segments WHERE segment_id = ?', (segment_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_speaker(self, speaker_id: str) -> Iterator[Dict[str, Any]]:
+        for (data,) in self.conn.execute(
+                'SELECT data FROM segments WHERE speaker_id = ? ORDER BY sequence_number', (speaker_id,)):
+            yield json.loads(data)
+
+    def count_by_chapter(self) -> Dict[str, int]:
+        return dict(self.conn.execute(
+            'SELECT chapter_id, COUNT(*) FROM segments GROUP BY chapter_id ORDER BY MIN(sequence_number)'))
+
+class JsonSegmentSource:
+    """兼容旧的 tts_segments.json，提供与 SegmentCatalog 相同的读取接口"""
+
+    def __init__(self, json_file: Path = JSON_FILE):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.segments = data.pop('segments', [])
+        self.header = data
+
+    def close(self) -> None:
+        pass
+
+    def meta(self) -> Dict[str, Any]:
+        return self.header
+
+    def chapters(self) -> List[str]:
+        return list(dict.fromkeys(s['chapter_id'] for s in self.segments))
+
+    def iter_segments(self, chapter_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        for segment in self.segments:
+            if chapter_id is None or segment['chapter_id'] == chapter_id:
+                yield segment
+
+    def iter_index(self, chapter_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        for segment in self.iter_segments(chapter_id):
+            yield {k: segment.get(k) for k in ('segment_id', 'chapter_id', 'speaker_id')}
+
+    def get(self, segment_id: str) -> Optional[Dict[str, Any]]:
+        return next((s for s in self.segments if s['segment_id'] == segment_id), None)
+
+    def iter_speaker(self, speaker_id: str) -> Iterator[Dict[str, Any]]:
+        for segment in self.segments:
+            if segment.get('speaker_id') == speaker_id:
+                yield segment
+
+    def count_by_chapter(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for segment in self.segments:
+            counts[segment['chapter_id']] = counts.get(segment['chapter_id'], 0) + 1
+        return counts
+
+def open_segments(catalog_file: Path = CATALOG_FILE, json_file: Path = JSON_FILE):
+    """优先打开 SQLite 目录，不存在时回退到 tts_segments.json"""
+    if catalog_file.exists():
+        return SegmentCatalog(catalog_file)
+    return JsonSegmentSource(json_file)
+
+def export_json(source, json_file: Path = JSON_FILE) -> int:
+    """流式导出兼容的 tts_segments.json（与原格式一致，indent=2）"""
+    count = 0
+    with atomic_output(json_file) as tmp_file:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            header = json.dumps(source.meta(), ensure_ascii=False, indent=2)
+            f.write(header[:-2] + (',\n' if header != '{}' else '{\n') + '  "segments": [')
+            for segment in source.iter_segments():
+                body = json.dumps(segment, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+                f.write((',\n    ' if count else '\n    ') + body)
+                count += 1
+            f.write('\n  ]\n}' if count else ']\n}')
+    return count
+
+def import_json(json_file: Path = JSON_FILE, catalog_file: Path = CATALOG_FILE) -> int:
+    """把已有的 tts_segments.json 导入为目录"""
+    source = JsonSegmentSource(json_file)
+    with CatalogWriter(catalog_file) as writer:
+        for segment in source.iter_segments():
+            writer.add(segment)
+        writer.set_meta(source.meta())
+    return writer.count
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='TTS 片段目录工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='从目录导出 tts_segments.json')
+    export_parser.add_argument('--output', type=Path, default=JSON_FILE)
+    subparsers.add_parser('import', help='把 tts_segments.json 导入为目录')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        catalog = SegmentCatalog(CATALOG_FILE)
+        count = export_json(catalog, args.output)
+        catalog.close()
+        print(f"✓ 已导出 {count} 个片段: {args.output}")
+    else:
+        count = import_json(JSON_FILE, CATALOG_FILE)
+        print(f"✓ 已导入 {count} 个片段: {CATALOG_FILE}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+片段装箱
+在"单一说话人"和"单片段容量上限"两个约束下，把归属片段打包为尽可能少的 TTS 请求
+"""
+
+import re
+import statistics
+from typing import List, Dict, Any, Callable, Tuple, Union
+
+# 中文断句标点（句末），以及句末可能紧随的右引号/括号
+SENTENCE_PATTERN = re.compile(r'[^。！？；!?;…]*(?:[。！？；!?;]+|…+)[」』”’）)]*|[^。！？；!?;…]+$')
+# 句内停顿标点，用于切分仍然过长的单句
+CLAUSE_PATTERN = re.compile(r'[^，、,：:]*[，、,：:]+|[^，、,：:]+$')
+
+def split_sentences(text: str) -> List[str]:
+    """按中文句末标点切分文本，保留标点"""
+    return [s for s in SENTENCE_PATTERN.findall(text) if s]
+
+def split_text(text: str, max_words: int) -> List[str]:
+    """将文本切分为不超过 max_words 字的若干段：优先句末标点，其次句内停顿，最后硬切"""
+    units = []
+    for sentence in split_sentences(text):
+        if len(sentence) <= max_words:
+            units.append(sentence)
+            continue
+        for clause in CLAUSE_PATTERN.findall(sentence):
+            while len(clause) > max_words:
+                units.append(clause[:max_words])
+                clause = clause[max_words:]
+            if clause:
+                units.append(clause)
+
+    # 相邻小段合并回不超过上限的块
+    pieces = []
+    current = ''
+    for unit in units:
+        if current and len(current) + len(unit) > max_words:
+            pieces.append(current)
+            current = unit
+        else:
+            current += unit
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_oversized(segment: Dict[str, Any], max_words: int) -> List[Dict[str, Any]]:
+    """拆分超过容量上限的归属片段，字数按文本长度比例分摊"""
+    word_count = segment.get('word_count', 0)
+    text = segment.get('text', '')
+    if word_count <= max_words or not text:
+        return [segment]
+
+    # 归属片段的 word_count 与字符数不完全一致，按比例换算字符上限
+    max_chars = max(1, int(max_words * len(text) / word_count))
+    pieces = split_text(text, max_chars)
+    if len(pieces) <= 1:
+        return [segment]
+
+    parts = []
+    for index, piece in enumerate(pieces, 1):
+        parts.append({
+            **segment,
+            'text': piece,
+            'word_count': max(1, round(word_count * len(piece) / len(text))),
+            'split_part': index,
+            'split_total': len(pieces)
+        })
+    return parts
+
+def speaker_runs(segments: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """将连续相同说话人的片段划为一个 run"""
+    runs = []
+    for seg in segments:
+        if runs and runs[-1][0].get('speaker_id') == seg.get('speaker_id'):
+            runs[-1].append(seg)
+        else:
+            runs.append([seg])
+    return runs
+
+def greedy_pack(weights: List[float], capacity: float) -> List[Tuple[int, int]]:
+    """贪心装箱（原有策略）：依次装入，超出容量时另起一组。返回 [start, end) 区间"""
+    groups = []
+    start = 0
+    total = 0.0
+    for i, weight in enumerate(weights):
+        if i > start and total + weight > capacity:
+            groups.append((start, i))
+            start = i
+            total = 0.0
+        total += weight
+    if weights:
+        groups.append((start, len(weights)))
+    return groups
+
+def optimal_pack(weights: List[float], capacity: float) -> List[Tuple[int, int]]:
+    """
+    最优连续装箱：先最小化组数，再在组数相同的方案中最小化各组时长的平方和（即方差最小）。
+    动态规划 O(n²)，n 为单个说话人 run 内的片段数
+    """
+    n = len(weights)
+    if n == 0:
+        return []
+
+    prefix = [0.0]
+    for weight in weights:
+        prefix.append(prefix[-1] + weight)
+
+    # best[i] = (组数, 平方和, 上一组起点)，对应前 i 个片段的最优划分
+    best: List[Tuple[float, float, int]] = [(0, 0.0, -1)] + [(float('inf'), float('inf'), -1)] * n
+    for end in range(1, n + 1):
+        for start in range(end - 1, -1, -1):
+            load = prefix[end] - prefix[start]
+            # 单个超限片段只能独占一组
+            if load > capacity and end - start > 1:
+                break
+            count, squares, _ = best[start]
+            candidate = (count + 1, squares + load * load, start)
+            if candidate[:2] < best[end][:2]:
+                best[end] = candidate
+
+    groups = []
+    end = n
+    while end > 0:
+        start = best[end][2]
+        groups.append((start, end))
+        end = start
+    groups.reverse()
+    return groups
+
+PACKERS: Dict[str, Callable[[List[float], float], List[Tuple[int, int]]]] = {
+    'greedy': greedy_pack,
+    'optimal': optimal_pack
+}
+
+def pack_segments(segments: List[Dict[str, Any]],
+                  capacity: Union[float, Callable[[List[Dict[str, Any]]], float]],
+                  weight: Callable[[Dict[str, Any]], float],
+                  strategy: str = 'optimal') -> List[List[Dict[str, Any]]]:
+    """按说话人 run 装箱，返回每个 TTS 请求包含的归属片段列表；capacity 可按 run 计算"""
+    packer = PACKERS[strategy]
+    groups = []
+    for run in speaker_runs(segments):
+        weights = [weight(seg) for seg in run]
+        run_capacity = capacity(run) if callable(capacity) else capacity
+        for start, end in packer(weights, run_capacity):
+            groups.append(run[start:end])
+    return groups
+
+def plan_stats(durations: List[float], limit: float) -> Dict[str, Any]:
+    """统计一个装箱方案的请求数与时长分布（没有请求时时长统计为 None）"""
+    if not durations:
+        return {
+            'requests': 0,
+            'mean_duration_seconds': None,
+            'stdev_duration_seconds': None,
+            'min_duration_seconds': None,
+            'max_duration_seconds': None,
+            'over_limit': 0
+        }
+    return {
+        'requests': len(durations),
+        'mean_duration_seconds': round(statistics.mean(durations), 2),
+        'stdev_duration_seconds': round(statistics.pstdev(durations), 2),
+        'min_duration_seconds': round(min(durations), 2),
+        'max_duration_seconds': round(max(durations), 2),
+        'over_limit': sum(1 for d in durations if d > limit)
+    }
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+流水线统一入口
+  python3 videobook.py run build|post|release|all [--from 阶段] [--to 阶段]
+  python3 videobook.py run release -- --m4b           # 单个阶段：-- 之后的参数原样传给该阶段
+  python3 videobook.py run all --release-args=--m4b   # 多个阶段：以 = 连接以 - 开头的参数
+  python3 videobook.py plan [capacity_plan.py 的参数]
+在同一进程中依次运行各阶段：配置与阶段之间传递的 JSON 产物（segment_manifest.json、
+processing_log.json、meta.json 等）保存在进程内的产物缓存中，下游阶段直接使用，不再读回解析；
+各阶段的模块只在运行到该阶段时才导入。
+TTS 生成（generate_tts_minimax.py）调用外部付费接口，不在此入口中，仍需单独运行；
+plan 按历史吞吐预测一本书的请求数、CPU 时间、体积与各阶段耗时（见 capacity_plan.py）
+"""
+
+import sys
+import time
+import shlex
+import argparse
+import importlib
+from typing import Dict, List, Optional
+
+import artifact_store
+
+# 阶段名称 -> (模块, 说明)，按执行顺序排列
+STAGES = {
+    'build': ('build_segments', '构建 TTS 片段'),
+    'post': ('postprocess_audio', '音频后处理'),
+    'release': ('package_release', '打包发布')
+}
+
+def stage_range(target: str, first: Optional[str] = None, last: Optional[str] = None) -> List[str]:
+    """要运行的阶段：all 时按 --from / --to 截取，否则只运行指定阶段"""
+    names = list(STAGES)
+    if target != 'all':
+        if first or last:
+            raise ValueError('--from / --to 只能与 all 一起使用')
+        return [target]
+    start = names.index(first) if first else 0
+    end = names.index(last) if last else len(names) - 1
+    if start > end:
+        raise ValueError(f'--from {first} 在 --to {last} 之后')
+    return names[start:end + 1]
+
+def run_stage(name: str, argv: List[str]) -> float:
+    """导入并运行一个阶段（各阶段的 main 接受参数列表），返回耗时（秒）"""
+    module_name, _ = STAGES[name]
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    # 各阶段的性能统计只包含本阶段的记录
+    importlib.import_module('instrumentation').reset()
+    module.main(argv)
+    return time.perf_counter() - started
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='有声书流水线')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help='在同一进程中运行一个或多个阶段')
+    run.add_argument('stage', choices=[*STAGES, 'all'], help='要运行的阶段，all 为全部')
+    run.add_argument('--from', dest='first', choices=list(STAGES), help='从该阶段开始（仅 all）')
+    run.add_argument('--to', dest='last', choices=list(STAGES), help='运行到该阶段为止（仅 all）')
+    for name, (module_name, _) in STAGES.items():
+        run.add_argument(f'--{name}-args', default='', metavar='ARGS',
+                         help=f'传给 {module_name}.py 的参数；以 - 开头时用 = 连接，如 --{name}-args=--force')
+    # plan 的参数原样交给 capacity_plan.py 解析（见 main）
+    subparsers.add_parser('plan', help='预测各阶段的请求数、CPU 时间、体积与耗时，参数同 capacity_plan.py',
+                          add_help=False)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    """主函数"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['plan']:
+        importlib.import_module('capacity_plan').main(argv[1:])
+        return
+    # 单个阶段时 -- 之后的参数原样传给该阶段
+    extra: List[str] = []
+    if '--' in argv:
+        separator = argv.index('--')
+        argv, extra = argv[:separator], argv[separator + 1:]
+    args = parse_args(argv)
+    try:
+        stages = stage_range(args.stage, args.first, args.last)
+        if extra and len(stages) > 1:
+            raise ValueError('-- 之后的参数只能用于单个阶段，多个阶段时使用 --<阶段>-args=...')
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    elapsed: Dict[str, float] = {}
+    for name in stages:
+        stage_args = shlex.split(getattr(args, f'{name}_args')) + extra
+        print(f"\n>>> {name}: {STAGES[name][1]}\n")
+        elapsed[name] = run_stage(name, stage_args)
+
+    stats = artifact_store.stats()
+    print("\n" + "=" * 60)
+    print("流水线完成")
+    print("=" * 60)
+    for name, seconds in elapsed.items():
+        print(f"   {name}: {round(seconds, 2)} 秒")
+    print(f"   JSON 产物: 解析 {stats['parsed']} 次 ({round(stats['parsed_bytes'] / 1024, 1)} KB), "
+          f"内存复用 {stats['hits']} 次, 写入 {stats['writes']} 个")
+
+if __name__ == '__main__':
+    main()
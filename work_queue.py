@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+后处理工作队列
+以 SQLite 租约表协调多个 worker（可以在不同机器上，通过共享存储访问同一项目目录）
+处理片段编码与章节合并，避免重复处理和同时写入同一文件：
+  - enqueue: 按章节顺序登记片段任务与章节合并任务，并记录本次运行的处理参数
+  - work:    领取任务并定期心跳续租；worker 崩溃或失联后租约过期，其他 worker 重新领取
+  - status:  查看队列进度与 worker 状态
+  - report:  由队列中的任务结果生成 processing_log.json（最后完成的 worker 会自动生成）
+章节合并任务在该章全部片段任务结束后才可领取。
+租约过期后原 worker 提交的结果会被拒绝；产物均以临时文件 + 原子替换写入，重复执行不会留下半写文件
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import subprocess
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator
+
+import postprocess_audio as post
+from build_cache import BuildCache, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# 路径配置
+PROJECT_ROOT = Path(__file__).parent
+QUEUE_FILE = PROJECT_ROOT / 'source' / '05_post' / 'work_queue.db'
+
+# 租约参数
+LEASE_SECONDS = 120  # 租约时长，超过未续租视为 worker 已失联
+HEARTBEAT_SECONDS = 20
+POLL_SECONDS = 2.0  # 暂无可领取任务（等待其他 worker 的片段完成）时的轮询间隔
+MAX_ATTEMPTS = 3  # 同一任务租约过期的最大次数，超过后标记失败
+CACHE_SAVE_SECONDS = 60  # 定期把构建缓存与响度缓存合并写回磁盘
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    chapter_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, kind, seq);
+CREATE INDEX IF NOT EXISTS idx_jobs_chapter ON jobs (chapter_id, kind, status);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    started REAL NOT NULL,
+    heartbeat REAL NOT NULL,
+    stopped REAL,
+    jobs_done INTEGER NOT NULL DEFAULT 0,
+    jobs_failed INTEGER NOT NULL DEFAULT 0,
+    loudness_hits INTEGER NOT NULL DEFAULT 0,
+    loudness_misses INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class LeaseLost(Exception):
+    """提交结果时租约已过期并被其他 worker 领取"""
+
+class WorkQueue:
+    """
+    SQLite 租约队列。每个线程使用独立连接；领取与提交在 BEGIN IMMEDIATE 事务中完成，
+    多个进程同时领取时由 SQLite 的写锁串行化。
+    不启用 WAL：WAL 依赖共享内存，跨机器访问共享存储时不可用
+    """
+
+    def __init__(self, queue_file: Path = QUEUE_FILE):
+        self.queue_file = queue_file
+        self._local = threading.local()
+        queue_file.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.queue_file), timeout=60, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    # ------------------------------------------------------------------
+    # 登记
+    # ------------------------------------------------------------------
+
+    def active_leases(self) -> int:
+        row = self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status = 'leased' AND lease_expires >= ?",
+                                   (time.time(),)).fetchone()
+        return row[0]
+
+    def enqueue(self, chapters: Dict[str, List[Dict[str, Any]]], order: List[str], params: Dict[str, Any]) -> int:
+        """清空队列并按章节顺序登记任务：每个片段一个编码任务，每章一个合并任务"""
+        now = time.time()
+        seq = 0
+        rows = []
+        for chapter_id in order:
+            for segment in chapters[chapter_id]:
+                rows.append((f"segment:{segment['segment_id']}", 'segment', chapter_id, seq, json.dumps(segment)))
+                seq += 1
+            segment_ids = [segment['segment_id'] for segment in chapters[chapter_id]]
+            rows.append((f'merge:{chapter_id}', 'merge', chapter_id, seq, json.dumps(segment_ids)))
+            seq += 1
+
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM jobs')
+            conn.execute('DELETE FROM workers')
+            conn.execute('DELETE FROM meta')
+            conn.executemany('INSERT INTO jobs (job_id, kind, chapter_id, seq, payload) VALUES (?, ?, ?, ?, ?)', rows)
+            conn.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+                ('params', json.dumps(params, ensure_ascii=False)),
+                ('order', json.dumps(order)),
+                ('created', json.dumps(now))
+            ])
+        return len(rows)
+
+    def meta(self, key: str, default: Any = None) -> Any:
+        row = self._conn().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    # ------------------------------------------------------------------
+    # 领取、续租与提交
+    # ------------------------------------------------------------------
+
+    def register_worker(self, worker: str) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO workers (worker, host, pid, started, heartbeat) VALUES (?, ?, ?, ?, ?)',
+                         (worker, socket.gethostname(), os.getpid(), now, now))
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        领取一个任务：待处理的任务，或租约已过期的任务（原 worker 失联）。
+        可合并的章节优先，其余按登记顺序；合并任务要求该章片段任务全部结束
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            # 反复过期的任务多半会让 worker 崩溃，不再重试
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', worker = NULL, lease_expires = NULL, finished = ?, result = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, json.dumps({'error': f'租约过期 {MAX_ATTEMPTS} 次'}, ensure_ascii=False), now, MAX_ATTEMPTS))
+            row = conn.execute(
+                """
+                SELECT job_id, kind, chapter_id, payload, status, worker FROM jobs AS j
+                WHERE (j.status = 'pending' OR (j.status = 'leased' AND j.lease_expires < :now))
+                  AND (j.kind = 'segment' OR NOT EXISTS (
+                      SELECT 1 FROM jobs AS s
+                      WHERE s.chapter_id = j.chapter_id AND s.kind = 'segment' AND s.status IN ('pending', 'leased')))
+                ORDER BY j.kind = 'segment', j.seq
+                LIMIT 1
+                """, {'now': now}).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, started = ? "
+                "WHERE job_id = ?", (worker, now + LEASE_SECONDS, now, row['job_id']))
+
+        return {
+            'job_id': row['job_id'],
+            'kind': row['kind'],
+            'chapter_id': row['chapter_id'],
+            'payload': json.loads(row['payload']),
+            # 从失联 worker 手中收回的任务
+            'reclaimed_from': row['worker'] if row['status'] == 'leased' else None
+        }
+
+    def heartbeat(self, worker: str, loudness_hits: int = 0, loudness_misses: int = 0) -> None:
+        """续租该 worker 持有的全部任务"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET lease_expires = ? WHERE worker = ? AND status = 'leased'",
+                         (now + LEASE_SECONDS, worker))
+            conn.execute('UPDATE workers SET heartbeat = ?, loudness_hits = ?, loudness_misses = ? WHERE worker = ?',
+                         (now, loudness_hits, loudness_misses, worker))
+
+    def complete(self, job_id: str, worker: str, failed: bool, result: Dict[str, Any]) -> None:
+        """提交任务结果；租约已被其他 worker 收回时拒绝提交"""
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished = ?, lease_expires = NULL "
+                "WHERE job_id = ? AND worker = ? AND status = 'leased'",
+                ('failed' if failed else 'done', json.dumps(result, ensure_ascii=False), now, job_id, worker)).rowcount
+            if not updated:
+                raise LeaseLost(job_id)
+            conn.execute(f"UPDATE workers SET {'jobs_failed' if failed else 'jobs_done'} = "
+                         f"{'jobs_failed' if failed else 'jobs_done'} + 1 WHERE worker = ?", (worker,))
+
+    def stop_worker(self, worker: str, loudness_hits: int, loudness_misses: int) -> None:
+        with self._transaction() as conn:
+            conn.execute('UPDATE workers SET stopped = ?, loudness_hits = ?, loudness_misses = ? WHERE worker = ?',
+                         (time.time(), loudness_hits, loudness_misses, worker))
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def chapter_failed(self, chapter_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE chapter_id = ? AND kind = 'segment' AND status = 'failed'",
+            (chapter_id,)).fetchone()
+        return row[0] > 0
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """按任务类型与状态计数"""
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in self._conn().execute('SELECT kind, status, COUNT(*) AS n FROM jobs GROUP BY kind, status'):
+            counts.setdefault(row['kind'], {})[row['status']] = row['n']
+        return counts
+
+    def idle(self) -> bool:
+        """没有待处理或处理中的任务"""
+        row = self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'leased')").fetchone()
+        return row[0] == 0
+
+    def jobs(self, kind: str) -> List[sqlite3.Row]:
+        return self._conn().execute('SELECT * FROM jobs WHERE kind = ? ORDER BY seq', (kind,)).fetchall()
+
+    def workers(self) -> List[sqlite3.Row]:
+        return self._conn().execute('SELECT * FROM workers ORDER BY started').fetchall()
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# ----------------------------------------------------------------------
+# worker
+# ----------------------------------------------------------------------
+
+def worker_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def configure_worker(params: Dict[str, Any]) -> None:
+    """按登记时的参数配置后处理模块，所有 worker 使用相同的处理参数"""
+    post.configure(params['loudnorm_mode'], params['backend'],
+                   {'audio_processing': {'renditions': params['renditions']}})
+
+def execute_job(job: Dict[str, Any], queue: WorkQueue, params: Dict[str, Any], build_cache: BuildCache,
+                loudness_cache: 'post.LoudnessCache', started: float) -> Dict[str, Any]:
+    """执行一个任务，返回 {"failed": 是否失败, "result": 任务结果}"""
+    if job['kind'] == 'segment':
+        result = post.run_segment_job(job['payload'], loudness_cache, build_cache, params['force'])
+        return {'failed': result['status'] == 'failed', 'result': result}
+
+    chapter_id = job['chapter_id']
+    result = post.run_chapter_pipeline(chapter_id, job['payload'], build_cache, params['force'],
+                                       params['publish'], queue.chapter_failed(chapter_id), started)
+    # 任一版本合并失败时任务计为失败（主版本的结果仍保留在任务结果中）
+    return {'failed': not result['success'] or bool(result.get('rendition_errors')), 'result': result}
+
+def run_worker(queue: WorkQueue, threads: int) -> Dict[str, int]:
+    """领取并执行任务直到队列中没有剩余任务；返回本 worker 完成与失败的任务数"""
+    params = queue.meta('params')
+    if params is None:
+        raise SystemExit("队列为空，请先运行: python3 work_queue.py enqueue")
+    configure_worker(params)
+
+    worker = worker_id()
+    queue.register_worker(worker)
+    build_cache = BuildCache()
+    loudness_cache = post.LoudnessCache(post.LOUDNESS_CACHE_FILE)
+    # 章节就绪时间从登记队列时算起（run_chapter_pipeline 使用单调时钟）
+    started = time.monotonic() - (time.time() - queue.meta('created'))
+    stats = {'done': 0, 'failed': 0, 'lease_lost': 0}
+    stats_lock = threading.Lock()
+    stop = threading.Event()
+
+    def heartbeat():
+        last_save = time.monotonic()
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                queue.heartbeat(worker, loudness_cache.hits, loudness_cache.misses)
+                if time.monotonic() - last_save >= CACHE_SAVE_SECONDS:
+                    build_cache.save(merge=True)
+                    loudness_cache.save(merge=True)
+                    last_save = time.monotonic()
+            except Exception as e:
+                logger.warning(f"   [{worker}] 心跳失败: {str(e)}")
+        queue.close()
+
+    def loop():
+        while True:
+            job = queue.claim(worker)
+            if job is None:
+                if queue.idle():
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+            if job['reclaimed_from']:
+                logger.warning(f"   [{worker}] 收回 {job['job_id']}（原 worker {job['reclaimed_from']} 租约过期）")
+            try:
+                outcome = execute_job(job, queue, params, build_cache, loudness_cache, started)
+            except Exception as e:
+                outcome = {'failed': True, 'result': {'status': 'failed', 'error': str(e)}}
+            try:
+                queue.complete(job['job_id'], worker, outcome['failed'], outcome['result'])
+            except LeaseLost:
+                logger.warning(f"   [{worker}] {job['job_id']} 租约已被收回，结果丢弃")
+                with stats_lock:
+                    stats['lease_lost'] += 1
+                continue
+            with stats_lock:
+                stats['failed' if outcome['failed'] else 'done'] += 1
+            status = '✗ 失败' if outcome['failed'] else '✓'
+            logger.info(f"   [{worker}] {job['job_id']} {status}")
+        queue.close()
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(loop) for _ in range(threads)]:
+                future.result()
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+        build_cache.save(merge=True)
+        loudness_cache.save(merge=True)
+        queue.stop_worker(worker, loudness_cache.hits, loudness_cache.misses)
+
+    # 队列处理完毕后每个退出的 worker 都重新生成处理日志，最后退出的 worker 写入完整统计
+    if queue.idle():
+        write_report(queue)
+    return stats
+
+def spawn_workers(processes: int, threads: int, queue_file: Path) -> int:
+    """在本机启动多个 worker 进程（用于单机多进程运行与测试），返回失败的进程数"""
+    cmd = [sys.executable, str(Path(__file__).resolve()), '--queue', str(queue_file),
+           'work', '--threads', str(threads)]
+    children = [subprocess.Popen(cmd) for _ in range(processes)]
+    return sum(1 for child in children if child.wait() != 0)
+
+# ----------------------------------------------------------------------
+# 报告
+# ----------------------------------------------------------------------
+
+def write_report(queue: WorkQueue) -> Dict[str, Any]:
+    """由队列中的任务结果生成统一的 processing_log.json"""
+    params = queue.meta('params')
+    configure_worker(params)
+    order = queue.meta('order', [])
+
+    processed_segments = []
+    failed_segments = []
+    segment_errors = {}
+    segment_jobs = queue.jobs('segment')
+    for row in segment_jobs:
+        segment_id = row['job_id'].split(':', 1)[1]
+        result = json.loads(row['result']) if row['result'] else {}
+        if row['status'] == 'failed':
+            failed_segments.append(segment_id)
+            segment_errors[segment_id] = result.get('error', '')
+        elif row['status'] == 'done' and result.get('status') == 'skipped':
+            processed_segments.append({'segment_id': segment_id, 'skipped': True})
+        elif row['status'] == 'done':
+            processed_segments.append({'segment_id': segment_id, **result.get('result', {})})
+
+    merge_results = {row['chapter_id']: json.loads(row['result']) for row in queue.jobs('merge') if row['result']}
+    merged_chapters = [merge_results[cid] for cid in order if merge_results.get(cid, {}).get('success')]
+
+    workers = queue.workers()
+    log_data = post.build_processing_log(
+        len(segment_jobs), processed_segments, failed_segments, segment_errors, merged_chapters, order,
+        sum(w['loudness_hits'] for w in workers), sum(w['loudness_misses'] for w in workers))
+    log_data['work_queue'] = {
+        'queue_file': str(queue.queue_file),
+        'created': datetime.fromtimestamp(queue.meta('created')).isoformat(),
+        'reclaimed_jobs': sum(1 for kind in ('segment', 'merge') for row in queue.jobs(kind) if row['attempts'] > 1),
+        'workers': [{
+            'worker': w['worker'],
+            'host': w['host'],
+            'pid': w['pid'],
+            'jobs_done': w['jobs_done'],
+            'jobs_failed': w['jobs_failed'],
+            'started': datetime.fromtimestamp(w['started']).isoformat(),
+            'stopped': datetime.fromtimestamp(w['stopped']).isoformat() if w['stopped'] else None
+        } for w in workers]
+    }
+    atomic_write_json(post.LOG_FILE, log_data)
+    logger.info(f"   ✓ 日志已保存: {post.LOG_FILE}")
+    return log_data
+
+# ----------------------------------------------------------------------
+# 命令行
+# ----------------------------------------------------------------------
+
+def enqueue_command(queue: WorkQueue, args: argparse.Namespace) -> None:
+    if queue.active_leases() and not args.reset:
+        raise SystemExit("队列中仍有处理中的任务（租约未过期），确认 worker 已停止后使用 --reset 重新登记")
+    if args.backend == 'numpy' and not post.numpy_backend_available():
+        raise SystemExit("numpy 后端需要安装 NumPy（pip install numpy），或使用 --backend ffmpeg")
+
+    config = post.load_config()
+    renditions = post.load_renditions(config)
+    segments = post.load_segments(args.chapter)
+    chapters: Dict[str, List[Dict[str, Any]]] = {}
+    for segment in segments:
+        chapters.setdefault(segment['chapter_id'], []).append(segment)
+    order = post.chapter_order(list(chapters), [cid for cid in args.priority.split(',') if cid])
+
+    params = {
+        'loudnorm_mode': args.loudnorm_mode,
+        'backend': args.backend,
+        'renditions': [{k: r[k] for k in ('name', 'codec', 'bitrate')} for r in renditions],
+        'force': args.force,
+        'publish': args.publish
+    }
+    count = queue.enqueue(chapters, order, params)
+    print(f"✓ 已登记 {count} 个任务: {len(segments)} 个片段, {len(chapters)} 个章节合并")
+    print(f"   队列: {queue.queue_file}")
+
+def status_command(queue: WorkQueue) -> None:
+    counts = queue.counts()
+    if not counts:
+        print("队列为空")
+        return
+    for kind, label in (('segment', '片段'), ('merge', '合并')):
+        by_status = counts.get(kind, {})
+        total = sum(by_status.values())
+        print(f"{label}: {total} 个 | 待处理 {by_status.get('pending', 0)} | 处理中 {by_status.get('leased', 0)} | "
+              f"完成 {by_status.get('done', 0)} | 失败 {by_status.get('failed', 0)}")
+    now = time.time()
+    for w in queue.workers():
+        if w['stopped']:
+            state = '已退出'
+        elif now - w['heartbeat'] > LEASE_SECONDS:
+            state = '失联'
+        else:
+            state = '运行中'
+        print(f"   {w['worker']}: {state}, 完成 {w['jobs_done']}, 失败 {w['jobs_failed']}")
+
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='后处理工作队列（多 worker / 多机器）')
+    parser.add_argument('--queue', type=Path, default=QUEUE_FILE, help='队列数据库路径（多台机器需位于共享存储）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = subparsers.add_parser('enqueue', help='登记片段与章节合并任务（会清空原队列）')
+    enqueue.add_argument('--chapter', action='append', default=[], help='只登记指定章节（可重复指定）')
+    enqueue.add_argument('--priority', default='', help='优先处理的章节，逗号分隔')
+    enqueue.add_argument('--loudnorm-mode', choices=post.LOUDNORM_MODES, default=post.LOUDNORM_MODE)
+    enqueue.add_argument('--backend', choices=post.AUDIO_BACKENDS, default=post.AUDIO_BACKEND)
+    enqueue.add_argument('--force', action='store_true', help='忽略构建缓存')
+    enqueue.add_argument('--publish', action='store_true', help='章节合并后立即发布')
+    enqueue.add_argument('--reset', action='store_true', help='即使仍有未过期的租约也重新登记')
+
+    work = subparsers.add_parser('work', help='领取并执行任务，直到队列处理完毕')
+    work.add_argument('--threads', '-j', type=int, default=None, help='本 worker 的并发任务数（默认按 CPU 与内存计算）')
+    work.add_argument('--processes', type=int, default=1, help='在本机启动的 worker 进程数')
+
+    subparsers.add_parser('status', help='查看队列进度')
+    subparsers.add_parser('report', help='由队列结果重新生成 processing_log.json')
+    return parser.parse_args()
+
+def main():
+    """主函数"""
+    args = parse_args()
+    queue = WorkQueue(args.queue)
+
+    if args.command == 'enqueue':
+        enqueue_command(queue, args)
+    elif args.command == 'work':
+        threads = args.threads if args.threads and args.threads > 0 else post.default_jobs()
+        if args.processes > 1:
+            failed = spawn_workers(args.processes, max(1, threads // args.processes), args.queue)
+            status_command(queue)
+            if failed:
+                raise SystemExit(f"{failed} 个 worker 进程异常退出")
+            return
+        stats = run_worker(queue, threads)
+        logger.info(f"worker {worker_id()} 结束: 完成 {stats['done']}, 失败 {stats['failed']}, "
+                    f"租约被收回 {stats['lease_lost']}")
+    elif args.command == 'status':
+        status_command(queue)
+    elif args.command == 'report':
+        write_report(queue)
+
+if __name__ == "__main__":
+    main()